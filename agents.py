@@ -1,4 +1,7 @@
-from crewai import Agent
+from lazy import lazy_import
+
+# CrewAI takes seconds to import, so it is only imported when the first agent is built
+Agent = lazy_import("crewai", "Agent")
 
 class Agents:
     def __init__(self, model) -> None:
@@ -185,4 +188,32 @@ class Agents:
             ),
             # tools=[],
             allow_delegation=False,
-        )
\ No newline at end of file
+        )
+    def edit_memory(self):
+        """
+        Create an agent for finding the memory targeted by the user and rewriting it in a single step.
+
+        Returns:
+            Agent: An Agent object configured to update or delete a detail in one of several candidate memories.
+
+        Description:
+            This method creates an Agent which is given the user prompt and the candidate memories most similar to it. 
+            The agent picks the memory holding the detail the user wants to update or delete and returns that memory 
+            rewritten with the change, as structured output. If no memory holds the detail, it says so instead of 
+            making up an answer.
+        """
+        return Agent(
+            role='Memory Editor',
+            goal="""you are a personal assistant who understands what the user wants to update or delete in a database based on the prompt entered. \
+                    you would be given the user query prompt and a numbered list of candidate memories from the database.
+                    Your goal is to find the memory holding the detail or category that the user wants to change and return that memory with the change made. \
+                    If none of the memories holds it, do not make up answers.""",
+            verbose=True,
+            llm = self.model,
+            max_iter=5,
+            backstory=(
+                "You are the best personal assistant who figures out which memory the user is talking about and changes only the \
+                    necessary part of it. You do not make up answers if you do not know them."
+            ),
+            allow_delegation=False,
+        )
@@ -1,59 +1,138 @@
-from crewai import Crew, Process
+import asyncio
+import functools
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 from agents import Agents
+from crew_templates import TEMPLATES, CrewTemplates
 from tasks import Tasks
 from langchain_core.documents import Document
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.pydantic_v1 import BaseModel, Field
+from ingestion import iter_file_windows
+from parallel import RateLimiter, bounded_map
+from prompt_budget import PromptBudget
+from tracing import annotate, span, traced
+
+class MemoryEdit(BaseModel):
+    """
+    The structured output of the fused update and delete.
+    """
+    target: int = Field(description="The number of the candidate memory holding the detail, or -1 if none of them holds it")
+    content: str = Field(description="The entire candidate memory after the change, empty if nothing is left")
+
+
+_EDIT_PARSER = PydanticOutputParser(pydantic_object=MemoryEdit)
+
 
 class AI_Agents():
     """
     A class to manage AI agent tasks and workflows using CrewAI framework.
     """
 
-    def __init__(self, model, output_path: str) -> None:
+    def __init__(self, model, output_path: str, intent_classifier=None, classifier_threshold: float = 0.6,
+                 max_concurrency: int = 8, direct_tasks=(), prompt_budget: PromptBudget = None,
+                 output_mode: str = "async") -> None:
         """
         Initializes the AI_Agents class with the given model and output path.
 
         Args:
             model (ChatGroq): The model to be used by the agents.
             output_path (str): The path where output files will be saved.
+            intent_classifier (IntentClassifier): Optional local classifier tried before the LLM crew.
+            classifier_threshold (float): The minimum confidence for which the local prediction is used.
+            max_concurrency (int): The maximum number of workflows run at once by the async methods.
+            direct_tasks (Iterable[str]): The workflows run as a single chat call instead of a crew, among
+                extract_personal_info, classify_prompt, update_memory, extract_category and delete_memory.
+            prompt_budget (PromptBudget): The token budget of the inputs of every workflow. Defaults to the default budgets.
+            output_mode (str): How the task outputs are persisted: "off", "sync" (one output file per task, written
+                on the request path) or "async" (batched JSONL audit records written in the background).
         """
+        unknown = set(direct_tasks) - set(TEMPLATES)
+        if unknown:
+            raise ValueError(f"Unknown tasks {sorted(unknown)}. Choose among {list(TEMPLATES)}.")
         self.model = model
         self.agent = Agents(model=model)
-        self.tasks = Tasks(path=output_path)
+        self.tasks = Tasks(path=output_path, output_mode=output_mode)
+        self.crews = CrewTemplates(self.agent, self.tasks, budget=prompt_budget)
+        self.direct_tasks = frozenset(direct_tasks)
+        self.intent_classifier = intent_classifier
+        self.classifier_threshold = classifier_threshold
+        self.max_concurrency = max_concurrency
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
-    def extract_from_uploaded_file(self, file: str) -> str:
+    @traced("extract_upload")
+    def extract_from_uploaded_file(self, file: str, max_workers: int = 1, requests_per_minute: float = None,
+                                   rate_limiter: RateLimiter = None) -> str:
         """
         Extracts data from the uploaded file and processes it to extract personal information.
+        With several workers, the windows of the file are extracted concurrently (map) and the
+        bullet points of all windows are merged and deduplicated (reduce).
 
         Args:
             file (str): The uploaded file to be processed.
+            max_workers (int): The number of windows extracted concurrently.
+            requests_per_minute (float): Optional cap on the LLM requests started per minute.
+            rate_limiter (RateLimiter): Optional limiter shared with the other callers of the same API,
+                used instead of one created for requests_per_minute.
 
         Returns:
             The extracted personal information from the file.
         """
+        return merge_extractions(self.iter_extract_from_uploaded_file(
+            file, max_workers=max_workers, requests_per_minute=requests_per_minute, rate_limiter=rate_limiter))
+
+    def iter_extract_from_uploaded_file(self, file, max_tokens: int = 3000, max_workers: int = 1,
+                                        requests_per_minute: float = None, rate_limiter: RateLimiter = None):
+        """
+        Streams the uploaded file in token-bounded windows and extracts the personal information of
+        each window. The file is never fully loaded in memory, and only a bounded number of windows
+        is read ahead of the extractions.
+
+        Args:
+            file: The uploaded file to be processed.
+            max_tokens (int): The maximum number of tokens of the file passed to a single extraction.
+            max_workers (int): The number of windows extracted concurrently.
+            requests_per_minute (float): Optional cap on the LLM requests started per minute.
+            rate_limiter (RateLimiter): Optional limiter shared with the other callers of the same API,
+                used instead of one created for requests_per_minute.
+
+        Returns:
+            Iterator[str]: The extracted personal information, one result per window, in file order.
+        """
         file_ext = file.name.split(".")[-1]
-        
-        if file_ext == "txt":
-            data = file.read().decode()
+        if file_ext != "txt":
+            raise ValueError(f"Unsupported file type '.{file_ext}'. Only .txt files can be uploaded.")
+
+        windows = iter_file_windows(file, max_tokens=max_tokens)
+        if rate_limiter is None and requests_per_minute:
+            rate_limiter = RateLimiter(requests_per_minute)
+        if max_workers <= 1 and rate_limiter is None:
+            for window in windows:
+                yield self.extract_personal_info(window)
         else:
-            RuntimeWarning
-
-        data_agent = self.agent.agent_extractPersonalInfo()
-        # Kick off the crew's work
-        data_task = self.tasks.task_personalInfo(data, data_agent)
-
-        # Instantiate your crew with a sequential process
-        data_crew = Crew(
-            agents=[data_agent],
-            tasks=[data_task],
-            verbose=2,
-            process=Process.sequential,
-            full_output=True,
-            share_crew=False,
-        )
-        results = data_crew.kickoff()
+            yield from bounded_map(self.extract_personal_info, windows,
+                                   max_workers=max(1, max_workers), rate_limiter=rate_limiter)
+
+    def extract_personal_info(self, data: str) -> str:
+        """
+        Extracts the personal information from a piece of unstructured text.
+
+        Args:
+            data (str): The text to be processed.
+
+        Returns:
+            The extracted personal information.
+        """
+        results = self._run("extract_personal_info", data=data)
         return self.output(results)
 
+    @traced("classify")
     def prompt_classifier(self, prompt: str) -> str:
         """
         Classifies the given prompt into predefined categories.
@@ -64,18 +143,15 @@ class AI_Agents():
         Returns:
             The classification result of the prompt.
         """
-        agent_prompt_classifier = self.agent.agent_classifyPrompt()
-        task_prompt_classifier = self.tasks.task_classifyPrompt(prompt, agent_prompt_classifier)
-
-        crew_prompt = Crew(
-            agents=[agent_prompt_classifier],
-            tasks=[task_prompt_classifier],
-            verbose=2,
-            process=Process.sequential,
-            full_output=True,
-            share_crew=False,
-        )
-        prompt_result = crew_prompt.kickoff()
+        # Skip the LLM round trip when the local classifier is confident enough
+        if self.intent_classifier is not None:
+            label, confidence = self.intent_classifier.predict(prompt)
+            if confidence >= self.classifier_threshold:
+                annotate(local=1)
+                return label
+
+        annotate(llm=1)
+        prompt_result = self._run("classify_prompt", data=prompt)
         return self.output(prompt_result)
     
     def memory_management(self, prompt: str, db_data: Document) -> str:
@@ -89,17 +165,7 @@ class AI_Agents():
         Returns:
             The updated memory data.
         """
-        agent_memory = self.agent.update_category()
-        task_memory = self.tasks.task_update_category(prompt=prompt, data=db_data.page_content, agent=agent_memory) 
-        crew_memory = Crew(
-            agents=[agent_memory],
-            tasks=[task_memory],
-            verbose=2,
-            process=Process.sequential,
-            full_output=True,
-            share_crew=False,
-        )
-        r = crew_memory.kickoff()
+        r = self._run("update_memory", prompt=prompt, data=db_data.page_content)
         return self.output(r)
     
     def category_extraction(self, prompt: str) -> str:
@@ -112,19 +178,7 @@ class AI_Agents():
         Returns:
             The extracted category or detail from the prompt.
         """
-        extraction_agent = self.agent.extract_category()
-        extraction_task = self.tasks.task_extract_category(prompt, extraction_agent)
-
-        extraction_crew = Crew(
-            agents=[extraction_agent],
-            tasks=[extraction_task],
-            verbose=2,
-            process=Process.sequential,
-            full_output=True,
-            share_crew=False,
-        )
-
-        extracted_class = extraction_crew.kickoff()
+        extracted_class = self._run("extract_category", prompt=prompt)
         return self.output(extracted_class)
     
     def delete_memory(self, prompt: str, db_data: Document) -> str:
@@ -138,20 +192,179 @@ class AI_Agents():
         Returns:
             The updated data after deletion.
         """
-        deletion_agent = self.agent.delete_category()
-        deletion_task = self.tasks.task_delete_category(prompt, db_data.page_content, deletion_agent)
-
-        deletion_crew = Crew(
-            agents=[deletion_agent],
-            tasks=[deletion_task],
-            verbose=2,
-            process=Process.sequential,
-            full_output=True,
-            share_crew=False,
-        )
-        res = deletion_crew.kickoff()
+        res = self._run("delete_memory", prompt=prompt, data=db_data.page_content)
         return self.output(res)
 
+    @traced("edit_memory")
+    def edit_memory(self, prompt: str, candidates: List[Document], action: str = "update") -> Optional[Document]:
+        """
+        Updates or deletes a detail in one of the candidate memories with a single structured LLM call, which
+        both picks the memory holding the detail and rewrites it. This replaces the category extraction followed
+        by memory_management or delete_memory.
+
+        If the answer is not valid structured output, the first candidate is edited by the corresponding crew.
+
+        Args:
+            prompt (str): The user prompt indicating what to update or delete.
+            candidates (List[Document]): The memories most similar to the prompt.
+            action (str): Either "update" or "delete".
+
+        Returns:
+            Optional[Document]: The targeted candidate with its rewritten content, or None when no candidate holds the detail.
+        """
+        if action not in ("update", "delete"):
+            raise ValueError(f"Unknown action '{action}'. Choose among ['update', 'delete'].")
+        if not candidates:
+            return None
+
+        data = "\n\n".join(f"[{i}] {doc.page_content}" for i, doc in enumerate(candidates))
+        result = self.crews.direct("edit_memory", prompt=prompt, data=data, action=action,
+                                   format_instructions=_EDIT_PARSER.get_format_instructions())
+        try:
+            edit = _EDIT_PARSER.parse(self.output(result))
+        except OutputParserException:
+            edit = None
+
+        if edit is None:
+            fallback = self.memory_management if action == "update" else self.delete_memory
+            target, content = candidates[0], fallback(prompt, candidates[0])
+        elif 0 <= edit.target < len(candidates):
+            target, content = candidates[edit.target], edit.content
+        else:
+            return None
+        return Document(page_content=content, metadata=dict(target.metadata))
+
+    def prompt_stats(self) -> dict:
+        """
+        Reports the number of prompt tokens sent by every workflow.
+
+        Returns:
+            dict: The number of calls and the last, mean and maximum prompt tokens of every workflow.
+        """
+        return self.crews.budget.stats()
+
+    def _run(self, name: str, **inputs) -> dict:
+        """
+        Runs a workflow on its crew, or as a single chat call when the workflow is direct.
+        """
+        direct = name in self.direct_tasks
+        with span("llm." + name, backend="direct" if direct else "crew"):
+            if direct:
+                return self.crews.direct(name, **inputs)
+            return self.crews.kickoff(name, **inputs)
+
+    async def aextract_from_uploaded_file(self, file, timeout: float = None, **kwargs) -> str:
+        """
+        Async counterpart of extract_from_uploaded_file.
+
+        Args:
+            file: The uploaded file to be processed.
+            timeout (float): The maximum number of seconds to wait. None waits forever.
+
+        Returns:
+            The extracted personal information from the file.
+        """
+        return await self._run_async(functools.partial(self.extract_from_uploaded_file, file, **kwargs), timeout)
+
+    async def aprompt_classifier(self, prompt: str, timeout: float = None) -> str:
+        """
+        Async counterpart of prompt_classifier.
+
+        Args:
+            prompt (str): The user prompt to be classified.
+            timeout (float): The maximum number of seconds to wait. None waits forever.
+
+        Returns:
+            The classification result of the prompt.
+        """
+        return await self._run_async(functools.partial(self.prompt_classifier, prompt), timeout)
+
+    async def amemory_management(self, prompt: str, db_data: Document, timeout: float = None) -> str:
+        """
+        Async counterpart of memory_management.
+
+        Args:
+            prompt (str): The user prompt for updating memory.
+            db_data (Document): The existing data from the database to be updated.
+            timeout (float): The maximum number of seconds to wait. None waits forever.
+
+        Returns:
+            The updated memory data.
+        """
+        return await self._run_async(functools.partial(self.memory_management, prompt, db_data), timeout)
+
+    async def acategory_extraction(self, prompt: str, timeout: float = None) -> str:
+        """
+        Async counterpart of category_extraction.
+
+        Args:
+            prompt (str): The user prompt indicating the category or detail.
+            timeout (float): The maximum number of seconds to wait. None waits forever.
+
+        Returns:
+            The extracted category or detail from the prompt.
+        """
+        return await self._run_async(functools.partial(self.category_extraction, prompt), timeout)
+
+    async def adelete_memory(self, prompt: str, db_data: Document, timeout: float = None) -> str:
+        """
+        Async counterpart of delete_memory.
+
+        Args:
+            prompt (str): The user prompt indicating what to delete.
+            db_data (Document): The existing data from the database to be processed for deletion.
+            timeout (float): The maximum number of seconds to wait. None waits forever.
+
+        Returns:
+            The updated data after deletion.
+        """
+        return await self._run_async(functools.partial(self.delete_memory, prompt, db_data), timeout)
+
+    async def aedit_memory(self, prompt: str, candidates: List[Document], action: str = "update",
+                           timeout: float = None) -> Optional[Document]:
+        """
+        Async counterpart of edit_memory.
+
+        Args:
+            prompt (str): The user prompt indicating what to update or delete.
+            candidates (List[Document]): The memories most similar to the prompt.
+            action (str): Either "update" or "delete".
+            timeout (float): The maximum number of seconds to wait. None waits forever.
+
+        Returns:
+            Optional[Document]: The targeted candidate with its rewritten content, or None when no candidate holds the detail.
+        """
+        return await self._run_async(functools.partial(self.edit_memory, prompt, candidates, action), timeout)
+
+    async def _run_async(self, fn, timeout: float = None):
+        """
+        Runs a blocking workflow on the worker threads without blocking the event loop.
+
+        On timeout or cancellation the awaiting coroutine stops right away. The LLM call already
+        started in the worker thread cannot be interrupted; it finishes in the background and
+        its result is discarded.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), fn)
+        return await asyncio.wait_for(future, timeout)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="aya-agents")
+            return self._executor
+
+    def close(self) -> None:
+        """
+        Shuts down the worker threads of the async methods and writes the buffered audit records.
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        if self.tasks.audit_writer is not None:
+            self.tasks.audit_writer.close()
+
     def output(self, result: dict) -> str:
         """
         Extracts and returns the final output from the task result.
@@ -162,4 +375,45 @@ class AI_Agents():
         Returns:
             The final output of the task.
         """
-        return result['final_output']
\ No newline at end of file
+        return result['final_output']
+
+
+_BULLET = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+")
+
+
+def merge_extractions(outputs) -> str:
+    """
+    Merges the bullet point outputs of several extractions, keeping every category once and
+    every bullet point once per category.
+
+    Args:
+        outputs (Iterable[str]): The extraction outputs.
+
+    Returns:
+        str: The merged bullet points.
+    """
+    categories = OrderedDict()
+    for output in outputs:
+        category = ""
+        lines = [line.strip() for line in output.splitlines() if line.strip()]
+        # Outputs without any bullet point are kept line by line
+        has_bullets = any(_BULLET.match(line) for line in lines)
+        for line in lines:
+            if not has_bullets:
+                categories.setdefault("", OrderedDict()).setdefault(" ".join(line.lower().split()), line)
+            elif _BULLET.match(line):
+                point = _BULLET.sub("", line)
+                key = " ".join(point.lower().split())
+                categories.setdefault(category, OrderedDict()).setdefault(key, point)
+            else:
+                # Anything which is not a bullet point starts a new category. Categories
+                # without any bullet point, e.g. "no information found", are never added.
+                category = line.strip("*#: ").strip()
+
+    merged = []
+    # Points without a category come first, so they are not read as part of the last category
+    for category, points in sorted(categories.items(), key=lambda item: item[0] != ""):
+        if category:
+            merged.append(category + ":")
+        merged.extend("- " + point for point in points.values())
+    return "\n".join(merged)
@@ -0,0 +1,101 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AuditWriter():
+    """
+    Appends JSON records to a JSONL file from a background thread. Records are buffered and written in
+    batches, so the callers never wait for the file system.
+    """
+
+    def __init__(self, path: str, batch_size: int = 64, flush_interval: float = 1.0) -> None:
+        """
+        Initializes the writer. The background thread starts with the first record.
+
+        Args:
+            path (str): The path of the JSONL file.
+            batch_size (int): The number of buffered records which triggers a write.
+            flush_interval (float): The maximum number of seconds a record stays buffered.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._records = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        """
+        Buffers a record without blocking.
+
+        Args:
+            record (dict): The JSON serializable record.
+        """
+        self._start()
+        self._records.put(record)
+
+    def flush(self) -> None:
+        """
+        Blocks until every record buffered so far is written.
+        """
+        if self._thread is not None:
+            self._records.join()
+
+    def close(self) -> None:
+        """
+        Writes the buffered records and stops the background thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._records.put(_STOP)
+            thread.join()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="aya-audit", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            # Wait for a first record, then gather the batch until it is full or the interval is over
+            batch = [self._records.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._records.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                stop = True
+
+            try:
+                self._append([record for record in batch if record is not _STOP])
+            except Exception:
+                logger.exception("Could not write %d audit records to %s", len(batch), self.path)
+            finally:
+                for _ in batch:
+                    self._records.task_done()
+
+    def _append(self, batch: list) -> None:
+        if not batch:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with span("persist.audit", records=len(batch)), open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
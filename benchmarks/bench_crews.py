@@ -0,0 +1,81 @@
+"""
+Measures the cost of building the CrewAI agents, tasks and crews per call against reusing the prebuilt
+crew templates. The LLM is a stub returning a fixed answer, so only the framework overhead is measured.
+
+Usage:
+    python benchmarks/bench_crews.py --calls 50
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from agents import Agents
+from crew_templates import TEMPLATES, CrewTemplates
+from tasks import Tasks
+
+INPUTS = {
+    "data": "Name - John Doe\nEmail ID - john@doe.com\nFavourite food - pizza",
+    "prompt": "Update my email id to jane@doe.com",
+    "action": "update",
+    "format_instructions": "Output a JSON object with the keys target and content.",
+}
+
+
+def stub_model() -> FakeListChatModel:
+    return FakeListChatModel(responses=["Thought: I now can give a great answer\nFinal Answer: off_topic"])
+
+
+def run(kickoff, calls: int) -> dict:
+    """
+    Runs every workflow calls times and measures the wall time and the memory allocated per call.
+    """
+    gc.collect()
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(calls):
+            for name, (_, _, fields) in TEMPLATES.items():
+                kickoff(name, **{field: INPUTS[field] for field in fields})
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    allocated = sum(stat.size for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    total = calls * len(TEMPLATES)
+    return {
+        "ms_per_call": 1000 * elapsed / total,
+        "retained_kib": allocated / 1024,
+        "peak_kib": peak / 1024,
+        "gc_collections": sum(stat["collections"] for stat in gc.get_stats()) - collections,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20, help="The number of calls per workflow.")
+    args = parser.parse_args()
+
+    templates = CrewTemplates(Agents(stub_model()), Tasks(path="/tmp/aya_bench", output_mode="off"))
+    # Building a crew for every call is what the workflows did before the templates
+    fresh = run(lambda name, **inputs: templates.build(name).kickoff(inputs=inputs), args.calls)
+    reused = run(templates.kickoff, args.calls)
+
+    print(f"{'':<10}{'ms/call':>10}{'retained KiB':>14}{'peak KiB':>10}{'gc runs':>9}")
+    for label, result in (("fresh", fresh), ("templates", reused)):
+        print(f"{label:<10}{result['ms_per_call']:>10.2f}{result['retained_kib']:>14.0f}"
+              f"{result['peak_kib']:>10.0f}{result['gc_collections']:>9}")
+    print(f"crews built by the templates: {templates.built}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the CPU embedding backends of the instructor model. Every backend embeds the same synthetic
+personal-fact chunks at every thread count, and its throughput and its agreement with the fp32 torch
+reference (cosine similarity of the vectors and overlap of the retrieved chunks) are reported.
+
+The ONNX graphs are exported on first use, see embedding_backends.py.
+
+Usage:
+    python benchmarks/bench_embeddings.py --threads 1 4 --texts 512 --json embeddings.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_store import git_revision, synthetic_fact, synthetic_question
+from embedding_backends import BACKENDS, DEFAULT_MODEL, load_embedding, parity
+
+
+def throughput(embedding, texts, batch_size: int, repeats: int) -> float:
+    """
+    Embeds the texts in batches, after one warm-up batch, and returns the best texts per second.
+    """
+    embedding.embed_documents(texts[:batch_size])
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            embedding.embed_documents(texts[i:i + batch_size])
+        best = max(best, len(texts) / (time.perf_counter() - start))
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count()],
+                        help="The intra-op thread counts to measure.")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--onnx-dir", help="The directory of the exported ONNX model.")
+    parser.add_argument("--texts", type=int, default=256, help="The number of chunks embedded per run.")
+    parser.add_argument("--batch-size", type=int, default=32, help="The number of chunks per call.")
+    parser.add_argument("--queries", type=int, default=50, help="The number of questions of the parity check.")
+    parser.add_argument("--repeats", type=int, default=3, help="The number of timed runs, the best is kept.")
+    parser.add_argument("--json", default="bench_embeddings.json", help="The file the results are written to.")
+    args = parser.parse_args()
+
+    texts = [synthetic_fact(i).page_content for i in range(args.texts)]
+    queries = [synthetic_question(i) for i in range(args.queries)]
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+        "backends": [],
+    }
+
+    reference = load_embedding("torch", model_name=args.model)
+    print(f"{'backend':>11}{'threads':>9}{'texts/s':>10}{'speedup':>9}{'min cos':>10}{'mean cos':>10}{'top4':>7}")
+    # The torch reference is measured first at every thread count, so the other backends have a baseline
+    backends = sorted(args.backends, key=lambda backend: backend != "torch")
+    baselines = {}
+    for threads in args.threads:
+        for backend in backends:
+            embedding = load_embedding(backend, model_name=args.model, num_threads=threads, onnx_dir=args.onnx_dir)
+            per_s = throughput(embedding, texts, args.batch_size, args.repeats)
+            if backend == "torch":
+                baselines[threads] = per_s
+            row = {"backend": backend, "threads": threads, "texts_per_s": per_s,
+                   **(parity(reference, embedding, texts, queries) if backend != "torch" else {})}
+            results["backends"].append(row)
+
+            speedup = f"{per_s / baselines[threads]:.2f}x" if threads in baselines else "-"
+            print(f"{backend:>11}{threads:>9}{per_s:>10.1f}{speedup:>9}{row.get('min_cosine', 1.0):>10.5f}"
+                  f"{row.get('mean_cosine', 1.0):>10.5f}{row.get('top4_overlap', 1.0):>7.2f}", flush=True)
+
+    with open(args.json, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
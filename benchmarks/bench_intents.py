@@ -0,0 +1,211 @@
+"""
+Drives every intent path of the assistant end to end, offline: save, deduce (with a fresh and with a
+repeated question), update, delete and off-topic. The chat model is a local stub with a configurable
+latency and canned outputs, and the embeddings are a fast deterministic hashing function, so the
+throughput and latency percentiles reported per path track the framework and storage overhead.
+
+Usage:
+    python benchmarks/bench_intents.py --iterations 20 --latency 0.05 --stages
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_agents import AI_Agents
+from semantic_cache import SemanticAnswerCache
+from speculative import classify_with_prefetch
+from store_pool import StorePool
+from stubs import HashingEmbeddings, StubChatModel
+from tracing import TRACER
+from utils import Utils
+
+PATHS = ("save", "deduce", "deduce_cached", "update", "delete", "off_topic")
+
+# The labels the stub classifier gives to the prompts of the benchmark, by their first word
+_INTENTS = {
+    "save": "save something in memory",
+    "what": "deduce memory from unstructured text",
+    "update": "update memory",
+    "delete": "delete memory",
+}
+_FOODS = ("pizza", "sushi", "tacos", "ramen", "curry", "paella", "falafel", "dumplings")
+
+
+def respond(text: str) -> str:
+    """
+    Picks the canned answer of a prompt of the assistant.
+    """
+    if "USER INPUT:" in text:
+        words = text.split("USER INPUT:", 1)[1].split()
+        return _INTENTS.get(words[0].lower() if words else "", "off_topic")
+    if "CANDIDATE MEMORIES:" in text:
+        person = re.search(r"person(\d+)@new", text)
+        content = "" if "Your task is to delete" in text else \
+            f"Email ID - person{person.group(1) if person else 0}@new.com"
+        return json.dumps({"target": 0, "content": content})
+    if "DATA:" in text:
+        data = text.split("DATA:", 1)[1]
+        facts = re.findall(r"My ([\w ]+?) is ([^.\n]+)\.", data)
+        return "Personal Information:\n" + "\n".join(f"- {key.title()} - {value}" for key, value in facts)
+    if "Use the following pieces of context" in text:
+        return "According to your memories, your email is person0@example.com and you love pizza."
+    return "Hello! I am doing well, thank you for asking. How can I help you today?"
+
+
+def upload(i: int) -> io.BytesIO:
+    """
+    Builds the uploaded text file of a save.
+    """
+    file = io.BytesIO((f"My name is Person {i}. My email is person{i}@example.com. "
+                       f"My favourite food is {_FOODS[i % len(_FOODS)]}. My phone number is +1 555 {i:04d}.\n"
+                       ).encode("utf-8"))
+    file.name = f"notes_{i}.txt"
+    return file
+
+
+class Assistant():
+    """
+    The chat turns of non_gui.py, without the prints.
+    """
+
+    def __init__(self, workdir: str, model: StubChatModel, output_mode: str) -> None:
+        self.model = model
+        self.utils = Utils(embedding_cache_dir=None, db_path=os.path.join(workdir, "db"),
+                           store_pool=StorePool(), embedding=HashingEmbeddings())
+        self.ai_agents = AI_Agents(model, os.path.join(workdir, "text_files"),
+                                   direct_tasks=("classify_prompt", "extract_category"), output_mode=output_mode)
+        self.answer_cache = SemanticAnswerCache(self.utils.embedding)
+
+    def turn(self, prompt: str, file: io.BytesIO = None) -> str:
+        vectordb = self.utils.load_db()
+        intent, prefetched = classify_with_prefetch(self.ai_agents, vectordb, prompt)
+
+        if intent == "save something in memory":
+            # Same map-reduce as the GUI, without its rate limit since the model is a stub
+            extracted = self.ai_agents.extract_from_uploaded_file(file, max_workers=4)
+            self.utils.store_in_db(extracted)
+            return extracted
+
+        elif intent == "deduce memory from unstructured text":
+            cached = self.answer_cache.lookup(prompt, prefetched.generation)
+            if cached is not None:
+                prefetched.discard()
+                return cached[0]
+            docs = prefetched.docs(k=3)
+            answer = "".join(self.utils.stream_answer_from_memory(self.model, prompt, docs))
+            self.answer_cache.store(prompt, answer, prefetched.generation, docs)
+            return answer
+
+        elif intent in ("update memory", "delete memory"):
+            action = "update" if intent == "update memory" else "delete"
+            document = self.ai_agents.edit_memory(prompt, prefetched.docs(k=3), action=action)
+            if document is None:
+                return ""
+            if document.page_content:
+                vectordb.update_document(document.metadata["id"], document)
+            else:
+                vectordb.delete([document.metadata["id"]])
+            return document.page_content
+
+        else:
+            return "".join(self.utils.stream_generic_response(self.model, prompt))
+
+    def close(self) -> None:
+        self.ai_agents.close()
+        self.utils.stores.close_all()
+
+
+def requests(path: str, i: int) -> dict:
+    """
+    Builds the i-th request of a path.
+    """
+    if path == "save":
+        return {"prompt": "Save this file in memory", "file": upload(1000 + i)}
+    if path == "deduce":
+        return {"prompt": f"What is the email of person {i}?"}
+    if path == "deduce_cached":
+        return {"prompt": "What is my favourite food?"}
+    if path == "update":
+        return {"prompt": f"Update my email id to person{i}@new.com"}
+    if path == "delete":
+        return {"prompt": "Delete my favourite food"}
+    return {"prompt": "How are you doing today?"}
+
+
+def run(assistant: Assistant, path: str, iterations: int) -> dict:
+    """
+    Runs the turns of a path one after the other and measures their latency.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        request = requests(path, i)
+        turn_start = time.perf_counter()
+        assistant.turn(**request)
+        latencies.append(time.perf_counter() - turn_start)
+    elapsed = time.perf_counter() - start
+    p50, p95, p99 = 1000 * np.percentile(latencies, (50, 95, 99))
+    return {"ops_per_s": iterations / elapsed, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="The number of turns per path.")
+    parser.add_argument("--seed", type=int, default=20, help="The number of files saved before the measures.")
+    parser.add_argument("--latency", type=float, default=0.0, help="The seconds the stub model waits per call.")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="The seconds the stub model waits per answered token.")
+    parser.add_argument("--output-mode", default="async", choices=("off", "sync", "async"),
+                        help="How the outputs of the tasks are persisted.")
+    parser.add_argument("--paths", nargs="+", default=PATHS, choices=PATHS, help="The paths to run.")
+    parser.add_argument("--stages", action="store_true", help="Also report the latency of every traced stage.")
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    model = StubChatModel(responder=respond, latency=args.latency, token_latency=args.token_latency)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="aya_bench_") as workdir:
+        assistant = Assistant(workdir, model, args.output_mode)
+        try:
+            # CrewAI prints every step of the agents
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(args.seed):
+                    assistant.turn(**requests("save", -1 - i))
+                TRACER.stats.clear()
+                for path in args.paths:
+                    results[path] = run(assistant, path, args.iterations)
+            memories = assistant.utils.load_db()._collection.count()
+        finally:
+            assistant.close()
+
+    print(f"{'path':<15}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for path, result in results.items():
+        print(f"{path:<15}{result['ops_per_s']:>9.2f}{result['p50_ms']:>10.1f}"
+              f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+    print(f"model calls: {model.calls}, memories: {memories}, answer cache hits: {assistant.answer_cache.hits}")
+
+    stages = TRACER.stats.summary()
+    if args.stages:
+        print(f"\n{'stage':<32}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, stage in stages.items():
+            print(f"{name:<32}{stage['count']:>7}{stage['p50_ms']:>10.1f}"
+                  f"{stage['p95_ms']:>10.1f}{stage['p99_ms']:>10.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"paths": results, "stages": stages, "args": vars(args)}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Measures how the Chroma_AYA memory store scales with its size. The store is filled with synthetic
+personal-fact chunks up to every requested collection size and, at each size, the insert throughput,
+the latency of the similarity, MMR and update calls, the on-disk size and the RSS are recorded.
+
+With the default precomputed embeddings, the vectors of every batch are computed before the timer
+starts, so only the storage cost is measured. --embedding hashing embeds inline instead, on
+--embedding-processes worker processes when given, while the previous batch is upserted.
+
+Usage:
+    python benchmarks/bench_store.py --sizes 10000 100000 1000000 --json store.json
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from bulk_embedding import BulkEmbedder
+from chroma_aya import Chroma_AYA
+from stubs import HashingEmbeddings
+
+_FIRST_NAMES = ("Alice", "Bob", "Chloe", "David", "Emma", "Farid", "Grace", "Hiro", "Ines", "Jonas",
+                "Kemi", "Liam", "Maya", "Noah", "Olga", "Priya", "Quinn", "Rosa", "Sven", "Tara")
+_LAST_NAMES = ("Smith", "Garcia", "Chen", "Okafor", "Muller", "Rossi", "Tanaka", "Dubois", "Kowalski",
+               "Silva", "Nguyen", "Haddad", "Larsen", "Patel", "Ivanova", "Moreau")
+_CITIES = ("Paris", "Lagos", "Osaka", "Berlin", "Lima", "Toronto", "Mumbai", "Oslo", "Austin", "Porto")
+_FOODS = ("pizza", "sushi", "tacos", "ramen", "curry", "paella", "falafel", "dumplings", "pho", "risotto")
+_HOBBIES = ("climbing", "chess", "painting", "running", "baking", "birdwatching", "guitar", "sailing")
+_EMPLOYERS = ("Acme Corp", "Globex", "Initech", "Umbrella Labs", "Stark Industries", "Wayne Enterprises")
+
+
+def synthetic_fact(i: int) -> Document:
+    """
+    Generates the i-th personal-fact chunk, in the format of the extracted memories. The same index
+    always gives the same chunk.
+
+    Args:
+        i (int): The index of the chunk.
+
+    Returns:
+        Document: The chunk.
+    """
+    rng = random.Random(i)
+    first, last = rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES)
+    text = (f"Personal Information:\n"
+            f"- Name - {first} {last}\n"
+            f"- Email ID - {first.lower()}.{last.lower()}{i}@example.com\n"
+            f"- Phone number - +1 555 {rng.randrange(10 ** 7):07d}\n"
+            f"- City - {rng.choice(_CITIES)}\n"
+            f"- Favourite food - {rng.choice(_FOODS)}\n"
+            f"- Hobby - {rng.choice(_HOBBIES)}\n"
+            f"- Employer - {rng.choice(_EMPLOYERS)} since {rng.randrange(1995, 2025)}")
+    return Document(page_content=text, metadata={"source": f"fact_{i}"})
+
+
+def synthetic_question(i: int) -> str:
+    rng = random.Random(-1 - i)
+    return rng.choice((f"What is the email of {rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}?",
+                       f"Who lives in {rng.choice(_CITIES)} and likes {rng.choice(_FOODS)}?",
+                       f"Which of my friends works at {rng.choice(_EMPLOYERS)}?",
+                       f"Who enjoys {rng.choice(_HOBBIES)}?"))
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """
+    Serves vectors computed ahead of time, so that the timed calls of the store do not pay for the
+    embedding model. Texts which were not precomputed are embedded on the fly and counted as misses.
+    """
+
+    def __init__(self, embedding: Embeddings) -> None:
+        self.embedding = embedding
+        self.misses = 0
+        self._vectors: Dict[str, List[float]] = {}
+
+    def precompute(self, texts: List[str]) -> None:
+        self._vectors.update(zip(texts, self.embedding.embed_documents(texts)))
+
+    def clear(self) -> None:
+        self._vectors.clear()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._lookup(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._lookup(text)
+
+    def _lookup(self, text: str) -> List[float]:
+        vector = self._vectors.get(text)
+        if vector is None:
+            self.misses += 1
+            vector = self.embedding.embed_query(text)
+        return vector
+
+
+def rss_mib() -> float:
+    """
+    Returns the resident set size of the process, or its peak where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def disk_mib(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / 2 ** 20
+
+
+def latencies(calls) -> dict:
+    """
+    Times every call and returns the p50 and p99 in milliseconds.
+    """
+    durations = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    p50, p99 = 1000 * np.percentile(durations, (50, 99))
+    return {"p50_ms": p50, "p99_ms": p99}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(vectordb: Chroma_AYA, embedding: Embeddings, size: int, queries: int, updates: int, k: int) -> dict:
+    """
+    Measures the query, MMR and update latency of a store of the given size.
+    """
+    questions = [synthetic_question(i) for i in range(queries)]
+    rng = random.Random(size)
+    edited = [synthetic_fact(i) for i in rng.sample(range(size), min(updates, size))]
+    for doc in edited:
+        doc.page_content = doc.page_content.replace("- City - ", "- City - New ")
+    if isinstance(embedding, PrecomputedEmbeddings):
+        embedding.precompute(questions + [doc.page_content for doc in edited])
+
+    result = {
+        "similarity_search_with_score": latencies(
+            lambda q=q: vectordb.similarity_search_with_score(q, k=k) for q in questions),
+        "max_marginal_relevance_search": latencies(
+            lambda q=q: vectordb.max_marginal_relevance_search(q, k=k, fetch_k=5 * k) for q in questions),
+        # Chunks are stored under random IDs, so the IDs are looked up by source before the timer starts
+        "update_documents": latencies(
+            lambda id_=id_, doc=doc: vectordb.update_documents([id_], [doc])
+            for id_, doc in zip(_ids_by_source(vectordb, edited), edited)),
+    }
+    if isinstance(embedding, PrecomputedEmbeddings):
+        embedding.clear()
+    return result
+
+
+def _ids_by_source(vectordb: Chroma_AYA, documents: List[Document]) -> List[str]:
+    found = vectordb._collection.get(where={"source": {"$in": [doc.metadata["source"] for doc in documents]}},
+                                     include=["metadatas"])
+    ids = {metadata["source"]: id_ for id_, metadata in zip(found["ids"], found["metadatas"])}
+    return [ids[doc.metadata["source"]] for doc in documents]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="The collection sizes at which the store is measured.")
+    parser.add_argument("--batch-size", type=int, default=5000, help="The number of chunks per add_texts call.")
+    parser.add_argument("--embedding", default="precomputed", choices=("precomputed", "hashing"),
+                        help="Whether the vectors are computed before the timed calls or inline.")
+    parser.add_argument("--embedding-processes", type=int,
+                        help="The number of worker processes embedding the inserts, with --embedding hashing.")
+    parser.add_argument("--dimensions", type=int, default=768,
+                        help="The number of dimensions of the vectors, 768 like hkunlp/instructor-base.")
+    parser.add_argument("--queries", type=int, default=200, help="The number of queries per size.")
+    parser.add_argument("--updates", type=int, default=100, help="The number of updated chunks per size.")
+    parser.add_argument("--k", type=int, default=4, help="The number of chunks returned per query.")
+    parser.add_argument("--dir", help="The directory of the store. Defaults to a temporary directory.")
+    parser.add_argument("--json", default="bench_store.json", help="The file the results are written to.")
+    args = parser.parse_args()
+
+    embedding = HashingEmbeddings(dimensions=args.dimensions)
+    if args.embedding == "precomputed":
+        embedding = PrecomputedEmbeddings(embedding)
+    bulk_embedder = None
+    if args.embedding_processes and args.embedding == "hashing":
+        bulk_embedder = BulkEmbedder(functools.partial(HashingEmbeddings, dimensions=args.dimensions),
+                                     processes=args.embedding_processes).start()
+
+    results = {
+        "revision": git_revision(),
+        "chromadb": chromadb.__version__,
+        "python": platform.python_version(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+        "sizes": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="aya_store_bench_") as tmp_dir:
+        path = args.dir or tmp_dir
+        vectordb, count = None, 0
+        print(f"{'size':>9}{'insert/s':>10}{'query p50':>11}{'query p99':>11}{'mmr p50':>9}{'mmr p99':>9}"
+              f"{'update p50':>12}{'update p99':>12}{'disk MiB':>10}{'RSS MiB':>9}")
+        for size in sorted(args.sizes):
+            inserted, insert_seconds = 0, 0.0
+            while count < size:
+                documents = [synthetic_fact(i) for i in range(count, min(size, count + args.batch_size))]
+                texts = [doc.page_content for doc in documents]
+                if isinstance(embedding, PrecomputedEmbeddings):
+                    embedding.precompute(texts)
+
+                start = time.perf_counter()
+                if vectordb is None:
+                    # The first batch creates the store, like the first save of the assistant
+                    vectordb = Chroma_AYA.from_documents(documents, embedding, persist_directory=path,
+                                                         bulk_embedder=bulk_embedder)
+                    elapsed = time.perf_counter() - start
+                    results["from_documents"] = {"chunks": len(documents), "per_s": len(documents) / elapsed}
+                elif bulk_embedder is not None:
+                    vectordb.bulk_add_texts(texts, metadatas=[doc.metadata for doc in documents],
+                                            embedder=bulk_embedder)
+                    elapsed = time.perf_counter() - start
+                else:
+                    vectordb.add_texts(texts, metadatas=[doc.metadata for doc in documents])
+                    elapsed = time.perf_counter() - start
+                insert_seconds += elapsed
+
+                if isinstance(embedding, PrecomputedEmbeddings):
+                    embedding.clear()
+                inserted += len(documents)
+                count += len(documents)
+
+            row = {
+                "size": size,
+                "inserted": inserted,
+                "insert_per_s": inserted / insert_seconds if insert_seconds else None,
+                **measure(vectordb, embedding, size, args.queries, args.updates, args.k),
+                "disk_mib": disk_mib(path),
+                "rss_mib": rss_mib(),
+            }
+            results["sizes"].append(row)
+            print(f"{size:>9}{row['insert_per_s'] or 0:>10.0f}"
+                  f"{row['similarity_search_with_score']['p50_ms']:>11.2f}"
+                  f"{row['similarity_search_with_score']['p99_ms']:>11.2f}"
+                  f"{row['max_marginal_relevance_search']['p50_ms']:>9.2f}"
+                  f"{row['max_marginal_relevance_search']['p99_ms']:>9.2f}"
+                  f"{row['update_documents']['p50_ms']:>12.2f}{row['update_documents']['p99_ms']:>12.2f}"
+                  f"{row['disk_mib']:>10.1f}{row['rss_mib']:>9.0f}", flush=True)
+
+            # Written after every size, so the finished sizes of an interrupted run are kept
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+
+    if bulk_embedder is not None:
+        bulk_embedder.close()
+    if "from_documents" in results:
+        print(f"from_documents: {results['from_documents']['per_s']:.0f} chunks/s "
+              f"for the first {results['from_documents']['chunks']} chunks")
+    if isinstance(embedding, PrecomputedEmbeddings) and embedding.misses:
+        print(f"embedded inline: {embedding.misses} texts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Offline stand-ins for the chat model and the embedding model, so the benchmarks measure the framework and
+storage overhead of the assistant without network access or model downloads.
+"""
+import re
+import time
+import zlib
+from typing import Any, Callable, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# CrewAI agents only stop once the model gives a final answer in the ReAct format
+_REACT_ANSWER = "Thought: I now can give a great answer\nFinal Answer: {answer}"
+_TOKENS = re.compile(r"\S+\s*")
+
+
+class StubChatModel(BaseChatModel):
+    """
+    A local chat model answering with canned outputs after a configurable latency. The answer is picked by
+    a responder from the text of the prompt, and wrapped as a final answer when the prompt is a crew's.
+    """
+
+    responder: Callable[[str], str] = lambda text: "I do not know."
+    latency: float = 0.0
+    token_latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        self.calls += 1
+        text = "\n".join(str(message.content) for message in messages)
+        answer = self.responder(text)
+        if "Final Answer:" in text:
+            answer = _REACT_ANSWER.format(answer=answer)
+        return answer
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        answer = self._answer(messages)
+        time.sleep(self.latency + self.token_latency * len(_TOKENS.findall(answer)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        answer = self._answer(messages)
+        time.sleep(self.latency)
+        for token in _TOKENS.findall(answer):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    A fast deterministic embedding: the signed counts of the hashed words of the text, normalized. Texts
+    sharing words are close, which is enough for the retrieval and deduplication paths to do real work.
+    """
+
+    def __init__(self, dimensions: int = 384) -> None:
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = zlib.crc32(word.encode("utf-8"))
+            vector[digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
@@ -0,0 +1,166 @@
+"""
+Bulk embedding for large ingests. The texts are cut into batches which a pool of worker processes embeds,
+every worker loading its own copy of the model once. The batches are handed back in order while the
+following ones are still being embedded, so the collection can upsert batch N while the workers embed
+batch N+1 and the cores and the writer stay busy.
+
+Usage:
+    with BulkEmbedder(processes=4, batch_size=64) as embedder:
+        vectordb.bulk_add_texts(texts, metadatas=metadatas, embedder=embedder)
+"""
+import functools
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_backends import DEFAULT_MODEL, load_embedding
+from tracing import span
+
+# The default number of worker processes. Every worker holds its own copy of the model next to the one of the
+# parent process, so the default stays small rather than one worker per core
+DEFAULT_PROCESSES = 2
+
+# The model of a worker process, loaded once by the initializer of the pool
+_WORKER_EMBEDDING: Embeddings = None
+
+
+def _init_worker(factory: Callable[[], Embeddings]) -> None:
+    global _WORKER_EMBEDDING
+    _WORKER_EMBEDDING = factory()
+
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    # Sent back as one float32 array, which pickles much faster than lists of floats
+    return np.asarray(_WORKER_EMBEDDING.embed_documents(texts), dtype=np.float32)
+
+
+def model_factory(backend: str = None, model_name: str = DEFAULT_MODEL, processes: int = None,
+                  onnx_dir: str = None, num_threads: int = None) -> Callable[[], Embeddings]:
+    """
+    Builds the loader of the instructor model run by every worker. The threads are shared among the
+    workers, so that the intra-op threads of all the workers do not oversubscribe the CPU.
+
+    Args:
+        backend (str): The embedding backend. Defaults to the AYA_EMBEDDING_BACKEND environment variable,
+            or "torch".
+        model_name (str): The instructor model.
+        processes (int): The number of worker processes. Defaults to DEFAULT_PROCESSES.
+        onnx_dir (str): The directory of the exported ONNX model. Defaults to the AYA_EMBEDDING_ONNX_DIR
+            environment variable.
+        num_threads (int): The number of intra-op threads of all the workers together. Defaults to the
+            number of cores.
+
+    Returns:
+        Callable[[], Embeddings]: A picklable function loading the model.
+    """
+    cores = os.cpu_count() or 1
+    return functools.partial(load_embedding, backend or os.environ.get("AYA_EMBEDDING_BACKEND", "torch"),
+                             model_name=model_name,
+                             num_threads=max(1, (num_threads or cores) // (processes or DEFAULT_PROCESSES)),
+                             onnx_dir=onnx_dir or os.environ.get("AYA_EMBEDDING_ONNX_DIR"))
+
+
+class BulkEmbedder():
+    """
+    Embeds batches of texts on a pool of worker processes and hands them back in order, with the next
+    batches embedded in the background.
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings] = None, processes: int = None, batch_size: int = 64,
+                 max_pending: int = None, start_method: str = "spawn") -> None:
+        """
+        Initializes the embedder. The workers are started on first use.
+
+        Args:
+            factory (Callable[[], Embeddings]): A picklable function loading the model in every worker.
+                Defaults to the instructor model on the configured backend, see model_factory.
+            processes (int): The number of worker processes. Defaults to DEFAULT_PROCESSES.
+            batch_size (int): The number of texts per batch.
+            max_pending (int): The maximum number of batches being embedded ahead of the consumer.
+                Defaults to two per worker, so every worker has a batch queued while the consumer upserts.
+            start_method (str): The multiprocessing start method. "spawn" does not inherit the threads of
+                the parent, which the PyTorch and ONNX Runtime thread pools do not survive.
+        """
+        self.processes = processes or DEFAULT_PROCESSES
+        self.factory = factory or model_factory(processes=self.processes)
+        self.batch_size = batch_size
+        self.max_pending = max_pending or 2 * self.processes
+        self.start_method = start_method
+        self._pool = None
+
+    def start(self) -> "BulkEmbedder":
+        """
+        Starts the worker processes, each of which loads the model.
+
+        Returns:
+            BulkEmbedder: The started embedder.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                             initargs=(self.factory,),
+                                             mp_context=multiprocessing.get_context(self.start_method))
+        return self
+
+    def close(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self) -> "BulkEmbedder":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def iter_batches(self, texts: Sequence[str]) -> Iterator[Tuple[int, List[List[float]]]]:
+        """
+        Embeds the texts batch by batch. Up to max_pending batches are embedded ahead of the consumer,
+        so the consumer can store a batch while the following ones are embedded.
+
+        Args:
+            texts (Sequence[str]): The texts.
+
+        Returns:
+            Iterator[Tuple[int, List[List[float]]]]: The position of the first text of every batch and the
+                embeddings of the batch, in order.
+        """
+        self.start()
+        starts = iter(range(0, len(texts), self.batch_size))
+        pending = deque()
+        try:
+            for start in starts:
+                pending.append((start, self._pool.submit(_embed_batch, list(texts[start:start + self.batch_size]))))
+                if len(pending) >= self.max_pending:
+                    yield self._next(pending)
+            while pending:
+                yield self._next(pending)
+        finally:
+            # The batches which are not consumed are not embedded
+            for _, future in pending:
+                future.cancel()
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        Embeds the texts on the workers.
+
+        Args:
+            texts (Sequence[str]): The texts.
+
+        Returns:
+            List[List[float]]: The embeddings, in the order of the texts.
+        """
+        return [vector for _, vectors in self.iter_batches(texts) for vector in vectors]
+
+    @staticmethod
+    def _next(pending: deque) -> Tuple[int, List[List[float]]]:
+        start, future = pending.popleft()
+        with span("embed.bulk_wait"):
+            return start, future.result().tolist()
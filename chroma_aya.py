@@ -1,7 +1,11 @@
 from __future__ import annotations
 
 import base64
+import hashlib
+import json
 import logging
+import os
+import threading
 import uuid
 from typing import (
     TYPE_CHECKING,
@@ -22,10 +26,19 @@ from langchain_core.embeddings import Embeddings
 from langchain_core.utils import xor_args
 from langchain_core.vectorstores import VectorStore
 
-from langchain_community.vectorstores.utils import maximal_marginal_relevance
+try:
+    import fcntl
+except ImportError:  # Windows, where the generation file is only safe within one process
+    fcntl = None
+
+from lazy import lazy_import
+from tracing import span, traced
+
+maximal_marginal_relevance = lazy_import("langchain_community.vectorstores.utils", "maximal_marginal_relevance")
 
 if TYPE_CHECKING:
     import chromadb
+    from bulk_embedding import BulkEmbedder
     import chromadb.config
     from chromadb.api.types import ID, OneOrMany, Where, WhereDocument
 
@@ -33,14 +46,78 @@ logger = logging.getLogger()
 DEFAULT_K = 4  # Number of Documents to return.
 
 
+def _content_id(text: str, metadata: Optional[dict] = None) -> str:
+    """Derive a deterministic ID from the normalized content and metadata."""
+    payload = json.dumps(
+        {"text": " ".join(text.split()), "metadata": metadata or {}},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class WriteGeneration:
+    """A write counter shared by every store of a persist directory.
+
+    The counter of a persistent store lives in a file of its directory, so it
+    survives reopening the store and counts the writes of other processes too.
+    The counter of an in-memory store lives with the store.
+    """
+
+    FILE_NAME = "aya_generation"
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.path = os.path.join(directory, self.FILE_NAME) if directory else None
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        if self.path is None:
+            return self._value
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def bump(self) -> None:
+        with self._lock:
+            if self.path is None:
+                self._value += 1
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Replaced in one step, so readers never see a partly written counter
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as file:
+                    file.write(str(self.value + 1))
+                os.replace(tmp_path, self.path)
+
+
+_generations: Dict[str, WriteGeneration] = {}
+_generations_lock = threading.Lock()
+
+
+def _write_generation(directory: Optional[str]) -> WriteGeneration:
+    """Return the write counter of a persist directory, shared by every store of this process."""
+    if not directory:
+        return WriteGeneration()
+    directory = os.path.abspath(directory)
+    with _generations_lock:
+        if directory not in _generations:
+            _generations[directory] = WriteGeneration(directory)
+        return _generations[directory]
+
+
 def _results_to_docs(results: Any) -> List[Document]:
     return [doc for doc, _ in _results_to_docs_and_scores(results)]
 
 
-def _results_to_docs_and_scores(results: Any) -> List[Tuple[Document, float]]:
+def _results_to_docs_and_scores(results: Any, query_index: int = 0) -> List[Tuple[Document, float]]:
     return [
-        # TODO: Chroma can do batch querying,
-        # we shouldn't hard code to the 1st result
         (
             Document(
                 # page_content=result[0], metadata=(result[1] | {"id": result[3]} | "Null") or {}
@@ -50,14 +127,21 @@ def _results_to_docs_and_scores(results: Any) -> List[Tuple[Document, float]]:
             result[2],
         )
         for result in zip(
-            results["documents"][0],
-            results["metadatas"][0],
-            results["distances"][0],
-            results["ids"][0],
+            results["documents"][query_index],
+            results["metadatas"][query_index],
+            results["distances"][query_index],
+            results["ids"][query_index],
         )
     ]
 
 
+def _batch_results_to_docs_and_scores(results: Any) -> List[List[Tuple[Document, float]]]:
+    return [
+        _results_to_docs_and_scores(results, query_index)
+        for query_index in range(len(results["ids"]))
+    ]
+
+
 class Chroma_AYA(VectorStore):
     """`ChromaDB` vector store.
 
@@ -84,8 +168,14 @@ class Chroma_AYA(VectorStore):
         collection_metadata: Optional[Dict] = None,
         client: Optional[chromadb.Client] = None,
         relevance_score_fn: Optional[Callable[[float], float]] = None,
+        content_ids: bool = False,
     ) -> None:
-        """Initialize with a Chroma client."""
+        """Initialize with a Chroma client.
+
+        If ``content_ids`` is set, texts added without explicit IDs get an ID
+        derived from their content and metadata, and texts already stored
+        are skipped instead of being embedded again.
+        """
         try:
             import chromadb
             import chromadb.config
@@ -138,11 +228,27 @@ class Chroma_AYA(VectorStore):
             metadata=collection_metadata,
         )
         self.override_relevance_score_fn = relevance_score_fn
+        self._content_ids = content_ids
+        self._generation = _write_generation(self._persist_directory)
 
     @property
     def embeddings(self) -> Optional[Embeddings]:
         return self._embedding_function
 
+    @property
+    def generation(self) -> int:
+        """The write generation of the store, bumped after every write to its persist directory,
+        through any instance and from any process.
+
+        A result derived from the store while the generation was g is still valid as long as
+        the generation is g.
+        """
+        return self._generation.value
+
+    def _bump_generation(self) -> None:
+        # Bumped after the write, so results computed from the old content always carry an old generation
+        self._generation.bump()
+
     @xor_args(("query_texts", "query_embeddings"))
     def __query_collection(
         self,
@@ -256,13 +362,16 @@ class Chroma_AYA(VectorStore):
                 documents=b64_texts,
                 ids=ids,
             )
+        self._bump_generation()
         return ids
 
+    @traced("chroma.upsert")
     def add_texts(
         self,
         texts: Iterable[str],
         metadatas: Optional[List[dict]] = None,
         ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None,
         **kwargs: Any,
     ) -> List[str]:
         """Run more texts through the embeddings and add to the vectorstore.
@@ -271,16 +380,53 @@ class Chroma_AYA(VectorStore):
             texts (Iterable[str]): Texts to add to the vectorstore.
             metadatas (Optional[List[dict]], optional): Optional list of metadatas.
             ids (Optional[List[str]], optional): Optional list of IDs.
+            embeddings (Optional[List[List[float]]], optional): The embeddings of
+                the texts, when they are already computed.
 
         Returns:
             List[str]: List of IDs of the added texts.
         """
-        # TODO: Handle the case where the user doesn't provide ids on the Collection
-        if ids is None:
-            ids = [str(uuid.uuid4()) for _ in texts]
-        embeddings = None
         texts = list(texts)
-        if self._embedding_function is not None:
+        # Only IDs derived from the content identify texts already stored,
+        # the IDs given by the caller are always upserted
+        skip_stored = ids is None and self._content_ids
+        if ids is None:
+            if self._content_ids:
+                ids = [
+                    _content_id(text, metadatas[idx] if metadatas and idx < len(metadatas) else None)
+                    for idx, text in enumerate(texts)
+                ]
+            else:
+                ids = [str(uuid.uuid4()) for _ in texts]
+        self._add_texts(texts, metadatas, ids, embeddings, skip_stored=skip_stored)
+        return ids
+
+    def _add_texts(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[dict]],
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None,
+        skip_stored: bool = False,
+    ) -> None:
+        """Embed the texts and upsert them under the given IDs.
+
+        With ``skip_stored``, the IDs which are already stored or repeated are
+        skipped before anything is embedded.
+        """
+        if skip_stored:
+            # Skip the texts which are already stored so they are not embedded again
+            kept = self._unstored_indices(ids)
+            if len(kept) < len(texts):
+                texts = [texts[idx] for idx in kept]
+                ids = [ids[idx] for idx in kept]
+                if embeddings is not None:
+                    embeddings = [embeddings[idx] for idx in kept]
+                if metadatas:
+                    metadatas = [metadatas[idx] if idx < len(metadatas) else {} for idx in kept]
+            if not texts:
+                return
+        if embeddings is None and self._embedding_function is not None:
             embeddings = self._embedding_function.embed_documents(texts)
         if metadatas:
             # fill metadatas with empty dicts if somebody
@@ -335,7 +481,115 @@ class Chroma_AYA(VectorStore):
                 documents=texts,
                 ids=ids,
             )
-        return ids
+        self._bump_generation()
+
+    def bulk_add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        embedder: Optional[BulkEmbedder] = None,
+        keep: Optional[Callable[[List[str], List[List[float]]], List[int]]] = None,
+    ) -> List[str]:
+        """Add many texts, embedded in batches on a pool of worker processes.
+
+        Every batch is upserted as soon as it is embedded, while the workers
+        embed the following batches. With ``content_ids``, the texts added
+        without explicit IDs which are already stored are skipped before
+        anything is embedded.
+
+        Args:
+            texts (Iterable[str]): Texts to add to the vectorstore.
+            metadatas (Optional[List[dict]], optional): Optional list of metadatas.
+            ids (Optional[List[str]], optional): Optional list of IDs.
+            embedder (Optional[BulkEmbedder], optional): The embedding engine.
+                Defaults to one with the default number of workers, stopped
+                once done.
+            keep (Optional[Callable], optional): Called with the texts and the
+                embeddings of every batch, in order, before it is upserted.
+                Returns the positions in the batch of the texts to store, e.g.
+                to drop near-duplicates. Defaults to storing every text.
+
+        Returns:
+            List[str]: List of IDs of the texts, including the ones ``keep``
+            dropped, which are not stored.
+        """
+        texts = list(texts)
+        if metadatas:
+            metadatas = metadatas + [{}] * (len(texts) - len(metadatas))
+        skip_stored = ids is None and self._content_ids
+        if ids is None:
+            if self._content_ids:
+                ids = [
+                    _content_id(text, metadatas[idx] if metadatas else None)
+                    for idx, text in enumerate(texts)
+                ]
+            else:
+                ids = [str(uuid.uuid4()) for _ in texts]
+        all_ids = ids
+        if skip_stored:
+            kept = self._unstored_indices(ids)
+            texts = [texts[idx] for idx in kept]
+            ids = [ids[idx] for idx in kept]
+            if metadatas:
+                metadatas = [metadatas[idx] for idx in kept]
+        if not texts:
+            return all_ids
+
+        owned = embedder is None
+        if owned:
+            from bulk_embedding import BulkEmbedder
+
+            embedder = BulkEmbedder()
+        try:
+            for start, embeddings in embedder.iter_batches(texts):
+                batch = list(range(start, start + len(embeddings)))
+                if keep is not None:
+                    kept = keep(texts[start:batch[-1] + 1], embeddings)
+                    batch = [start + idx for idx in kept]
+                    embeddings = [embeddings[idx] for idx in kept]
+                    if not batch:
+                        continue
+                # The stored IDs were filtered once above, not again per batch
+                with span("chroma.upsert"):
+                    self._add_texts(
+                        texts=[texts[idx] for idx in batch],
+                        metadatas=[metadatas[idx] for idx in batch] if metadatas else None,
+                        ids=[ids[idx] for idx in batch],
+                        embeddings=embeddings,
+                    )
+        finally:
+            if owned:
+                embedder.close()
+        return all_ids
+
+    def _unstored_indices(self, ids: List[str]) -> List[int]:
+        """Return the positions of the IDs that are neither stored nor repeated.
+
+        The lookup is done with a single ``collection.get`` call.
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        stored = set(self._collection.get(ids=unique_ids, include=[])["ids"]) if unique_ids else set()
+        seen = set()
+        kept = []
+        for idx, id_ in enumerate(ids):
+            if id_ in stored or id_ in seen:
+                continue
+            seen.add(id_)
+            kept.append(idx)
+        return kept
+
+    def filter_stored_documents(self, documents: List[Document]) -> List[Document]:
+        """Return the documents whose content IDs are not stored yet.
+
+        Args:
+            documents (List[Document]): Documents to check.
+
+        Returns:
+            List[Document]: The documents which are new to the collection.
+        """
+        ids = [_content_id(doc.page_content, doc.metadata) for doc in documents]
+        return [documents[idx] for idx in self._unstored_indices(ids)]
 
     def similarity_search(
         self,
@@ -414,6 +668,7 @@ class Chroma_AYA(VectorStore):
         )
         return _results_to_docs_and_scores(results)
 
+    @traced("chroma.query")
     def similarity_search_with_score(
         self,
         query: str,
@@ -454,6 +709,107 @@ class Chroma_AYA(VectorStore):
 
         return _results_to_docs_and_scores(results)
 
+    def similarity_search_batch(
+        self,
+        queries: List[str],
+        k: int = DEFAULT_K,
+        filter: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[List[Document]]:
+        """Run similarity search for several queries with one Chroma query.
+
+        Args:
+            queries (List[str]): Query texts to search for.
+            k (int): Number of results to return per query. Defaults to 4.
+            filter (Optional[Dict[str, str]]): Filter by metadata. Defaults to None.
+
+        Returns:
+            List[List[Document]]: For each query, the list of documents most similar to it.
+        """
+        batch_docs_and_scores = self.similarity_search_with_score_batch(
+            queries, k, filter=filter, **kwargs
+        )
+        return [[doc for doc, _ in docs_and_scores] for docs_and_scores in batch_docs_and_scores]
+
+    @traced("chroma.query_batch")
+    def similarity_search_with_score_batch(
+        self,
+        queries: List[str],
+        k: int = DEFAULT_K,
+        filter: Optional[Dict[str, str]] = None,
+        where_document: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """Run similarity search with distance for several queries at once.
+
+        All the queries are embedded in one call and sent to the collection
+        in a single query.
+
+        Args:
+            queries (List[str]): Query texts to search for.
+            k (int): Number of results to return per query. Defaults to 4.
+            filter (Optional[Dict[str, str]]): Filter by metadata. Defaults to None.
+
+        Returns:
+            List[List[Tuple[Document, float]]]: For each query, the list of
+            documents most similar to it and the distance in float for each.
+            Lower score represents more similarity.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+
+        if self._embedding_function is None:
+            results = self.__query_collection(
+                query_texts=queries,
+                n_results=k,
+                where=filter,
+                where_document=where_document,
+                **kwargs,
+            )
+        else:
+            if hasattr(self._embedding_function, "embed_queries"):
+                query_embeddings = self._embedding_function.embed_queries(queries)
+            else:
+                query_embeddings = self._embedding_function.embed_documents(queries)
+            results = self.__query_collection(
+                query_embeddings=query_embeddings,
+                n_results=k,
+                where=filter,
+                where_document=where_document,
+                **kwargs,
+            )
+
+        return _batch_results_to_docs_and_scores(results)
+
+    @traced("chroma.nearest")
+    def nearest_embeddings(
+        self, embeddings: List[List[float]], k: int = DEFAULT_K
+    ) -> List[np.ndarray]:
+        """Look up the stored embeddings nearest to each of the given ones.
+
+        The neighbours are found with the HNSW index of the collection, in a
+        single query, so the cost does not grow with the whole collection.
+
+        Args:
+            embeddings (List[List[float]]): The embeddings to look up.
+            k (int): Number of neighbours per embedding. Defaults to 4.
+
+        Returns:
+            List[np.ndarray]: For each embedding, the stored neighbours, one
+            per row. Empty when the collection is.
+        """
+        embeddings = [list(map(float, vector)) for vector in embeddings]
+        count = self._collection.count()
+        if not embeddings or not count:
+            return [np.zeros((0, 0), dtype=np.float32) for _ in embeddings]
+        results = self.__query_collection(
+            query_embeddings=embeddings,
+            n_results=min(k, count),
+            include=["embeddings"],
+        )
+        return [np.asarray(neighbours, dtype=np.float32) for neighbours in results["embeddings"]]
+
     def _select_relevance_score_fn(self) -> Callable[[float], float]:
         """
         The 'correct' relevance function
@@ -580,6 +936,7 @@ class Chroma_AYA(VectorStore):
     def delete_collection(self) -> None:
         """Delete the collection."""
         self._client.delete_collection(self._collection.name)
+        self._bump_generation()
 
     def get(
         self,
@@ -657,6 +1014,7 @@ class Chroma_AYA(VectorStore):
         """
         return self.update_documents([document_id], [document])
 
+    @traced("chroma.update")
     def update_documents(self, ids: List[str], documents: List[Document]) -> None:
         """Update a document in the collection.
 
@@ -697,6 +1055,7 @@ class Chroma_AYA(VectorStore):
                 documents=text,
                 metadatas=metadata,
             )
+        self._bump_generation()
 
     @classmethod
     def from_texts(
@@ -710,12 +1069,15 @@ class Chroma_AYA(VectorStore):
         client_settings: Optional[chromadb.config.Settings] = None,
         client: Optional[chromadb.Client] = None,
         collection_metadata: Optional[Dict] = None,
+        bulk_embedder: Optional[BulkEmbedder] = None,
         **kwargs: Any,
     ):
         """Create a Chroma vectorstore from a raw documents.
 
         If a persist_directory is specified, the collection will be persisted there.
         Otherwise, the data will be ephemeral in-memory.
+        If a bulk_embedder is given, the texts are embedded in batches on its
+        worker processes while the previous batches are upserted.
 
         Args:
             texts (List[str]): List of texts to add to the collection.
@@ -727,6 +1089,8 @@ class Chroma_AYA(VectorStore):
             client_settings (Optional[chromadb.config.Settings]): Chroma client settings
             collection_metadata (Optional[Dict]): Collection configurations.
                                                   Defaults to None.
+            bulk_embedder (Optional[BulkEmbedder]): Embedding engine of large
+                                                    ingests. Defaults to None.
 
         Returns:
             Chroma: Chroma vectorstore.
@@ -740,8 +1104,21 @@ class Chroma_AYA(VectorStore):
             collection_metadata=collection_metadata,
             **kwargs,
         )
+        skip_stored = ids is None and chroma_collection._content_ids
+        if bulk_embedder is not None:
+            # bulk_add_texts derives the content IDs itself when none are given
+            chroma_collection.bulk_add_texts(
+                texts=texts, metadatas=metadatas, ids=ids, embedder=bulk_embedder
+            )
+            return chroma_collection
         if ids is None:
-            ids = [str(uuid.uuid4()) for _ in texts]
+            if chroma_collection._content_ids:
+                ids = [
+                    _content_id(text, metadatas[idx] if metadatas else None)
+                    for idx, text in enumerate(texts)
+                ]
+            else:
+                ids = [str(uuid.uuid4()) for _ in texts]
         if hasattr(
             chroma_collection._client, "max_batch_size"
         ):  # for Chroma 0.4.10 and above
@@ -753,13 +1130,16 @@ class Chroma_AYA(VectorStore):
                 metadatas=metadatas,
                 documents=texts,
             ):
-                chroma_collection.add_texts(
+                chroma_collection._add_texts(
                     texts=batch[3] if batch[3] else [],
                     metadatas=batch[2] if batch[2] else None,
                     ids=batch[0],
+                    skip_stored=skip_stored,
                 )
         else:
-            chroma_collection.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+            chroma_collection._add_texts(
+                texts=texts, metadatas=metadatas, ids=ids, skip_stored=skip_stored
+            )
         return chroma_collection
 
     @classmethod
@@ -808,6 +1188,7 @@ class Chroma_AYA(VectorStore):
             **kwargs,
         )
 
+    @traced("chroma.delete")
     def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
         """Delete by vector IDs.
 
@@ -815,6 +1196,7 @@ class Chroma_AYA(VectorStore):
             ids: List of ids to delete.
         """
         self._collection.delete(ids=ids)
+        self._bump_generation()
 
     def __len__(self) -> int:
         """Count the number of documents in the collection."""
@@ -0,0 +1,158 @@
+import threading
+from typing import Dict, List, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agents import Agent, Agents
+from lazy import lazy_import
+from prompt_budget import PromptBudget, compact, prompt_tokens
+from tracing import annotate
+from tasks import Task, Tasks
+
+Crew = lazy_import("crewai", "Crew")
+Process = lazy_import("crewai", "Process")
+
+# The agent factory, the task factory and the per-request inputs of every workflow
+TEMPLATES = {
+    "extract_personal_info": ("agent_extractPersonalInfo", "task_personalInfo", ("data",)),
+    "classify_prompt": ("agent_classifyPrompt", "task_classifyPrompt", ("data",)),
+    "update_memory": ("update_category", "task_update_category", ("prompt", "data")),
+    "extract_category": ("extract_category", "task_extract_category", ("prompt",)),
+    "delete_memory": ("delete_category", "task_delete_category", ("prompt", "data")),
+    "edit_memory": ("edit_memory", "task_edit_memory", ("prompt", "data", "action", "format_instructions")),
+}
+
+# The same role playing and answer criteria CrewAI adds to the agent and task prompts
+DIRECT_SYSTEM_PROMPT = "You are {role}. {backstory}\nYour personal goal is: {goal}"
+DIRECT_ANSWER_CRITERIA = ("This is the expect criteria for your final answer: {expected_output}\n"
+                          "Reply with the complete final answer only, without any thoughts or explanations.")
+
+
+class CrewTemplates():
+    """
+    A cache of prebuilt crews, one pool per workflow. The agents, tasks and crews are built once per model
+    with placeholders in place of the request data, and the inputs of every request are bound by CrewAI's
+    input interpolation at kickoff. The same templates also render the single chat call of the direct backend.
+
+    The whitespace of the templates is compacted when they are built, and the inputs of every request are
+    truncated to the token budget of their workflow before they are bound.
+    """
+
+    def __init__(self, agents: Agents, tasks: Tasks, budget: PromptBudget = None) -> None:
+        """
+        Initializes the cache.
+
+        Args:
+            agents (Agents): The factory of the agents, bound to the model.
+            tasks (Tasks): The factory of the tasks.
+            budget (PromptBudget): The token budget of the inputs. Defaults to the default budgets.
+        """
+        self.agents = agents
+        self.tasks = tasks
+        self.budget = budget or PromptBudget()
+        self.built = 0
+        self._idle: Dict[str, List[Crew]] = {name: [] for name in TEMPLATES}
+        self._prompts: Dict[str, Tuple[str, str, Task]] = {}
+        self._lock = threading.Lock()
+
+    def build(self, name: str) -> Crew:
+        """
+        Builds a new crew for a workflow, with a "{input}" placeholder for every request input.
+
+        Args:
+            name (str): The name of the workflow.
+
+        Returns:
+            Crew: The crew template.
+        """
+        agent, task = self._template(name)
+        return Crew(
+            agents=[agent],
+            tasks=[task],
+            verbose=2,
+            process=Process.sequential,
+            full_output=True,
+            share_crew=False,
+        )
+
+    def kickoff(self, name: str, **inputs) -> dict:
+        """
+        Runs a workflow on an idle crew of its pool. A crew is only built when all the crews of the
+        workflow are busy, so the pool grows up to the number of concurrent requests.
+
+        Args:
+            name (str): The name of the workflow.
+            **inputs: The request inputs bound to the placeholders of the workflow.
+
+        Returns:
+            dict: The result of the crew.
+        """
+        inputs = self._fit(name, inputs)
+        crew = self._checkout(name)
+        try:
+            return crew.kickoff(inputs=inputs)
+        finally:
+            with self._lock:
+                self._idle[name].append(crew)
+
+    def direct(self, name: str, **inputs) -> dict:
+        """
+        Runs a workflow as one chat call against the model, skipping the ReAct loop of the agent.
+        The role, goal and backstory of the agent become the system message, and the description
+        and expected output of the task become the user message.
+
+        Args:
+            name (str): The name of the workflow.
+            **inputs: The request inputs bound to the placeholders of the workflow.
+
+        Returns:
+            dict: The answer of the model, in the same form as the result of a crew.
+        """
+        system, prompt, task = self._direct_prompts(name)
+        prompt = prompt.format(**self._fit(name, inputs))
+        answer = self.agents.model.invoke([SystemMessage(content=system), HumanMessage(content=prompt)])
+        output = answer.content.strip()
+        self.tasks.save_output(task, output, description=prompt)
+        return {"final_output": output}
+
+    def _template(self, name: str) -> Tuple[Agent, Task]:
+        """
+        Builds the agent and the task of a workflow, with compacted prompts.
+        """
+        agent_factory, task_factory, fields = TEMPLATES[name]
+        agent = getattr(self.agents, agent_factory)()
+        placeholders = {field: "{" + field + "}" for field in fields}
+        task = getattr(self.tasks, task_factory)(agent=agent, **placeholders)
+        agent.goal, agent.backstory = compact(agent.goal), compact(agent.backstory)
+        task.description, task.expected_output = compact(task.description), compact(task.expected_output)
+        return agent, task
+
+    def _fit(self, name: str, inputs: dict) -> dict:
+        """
+        Truncates the inputs to the budget of the workflow and records the prompt tokens of the call. For crews,
+        the scaffolding CrewAI adds around the agent and task prompts is not counted.
+        """
+        inputs = self.budget.fit(name, inputs)
+        system, prompt, _ = self._direct_prompts(name)
+        tokens = prompt_tokens(system, prompt.format(**inputs))
+        self.budget.record(name, tokens)
+        annotate(prompt_tokens=tokens)
+        return inputs
+
+    def _direct_prompts(self, name: str) -> Tuple[str, str, Task]:
+        with self._lock:
+            if name in self._prompts:
+                return self._prompts[name]
+
+        agent, task = self._template(name)
+        system = DIRECT_SYSTEM_PROMPT.format(role=agent.role, backstory=agent.backstory, goal=agent.goal)
+        prompt = task.description + "\n\n" + DIRECT_ANSWER_CRITERIA.format(expected_output=task.expected_output)
+        with self._lock:
+            return self._prompts.setdefault(name, (system, prompt, task))
+
+    def _checkout(self, name: str) -> Crew:
+        with self._lock:
+            if self._idle[name]:
+                return self._idle[name].pop()
+            self.built += 1
+        return self.build(name)
@@ -0,0 +1,310 @@
+"""
+CPU backends of the instructor embedding model. Besides the reference PyTorch fp32 model, the model can
+run with its linear layers dynamically quantized to int8, or as an exported ONNX Runtime graph in fp32
+or int8. All backends give the same kind of vectors; parity() measures how close they stay.
+
+Usage:
+    python embedding_backends.py export --output ~/.cache/aya/onnx/hkunlp__instructor-base
+"""
+import argparse
+import json
+import os
+import threading
+from typing import Dict, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from lazy import lazy_import
+from tracing import span
+
+torch = lazy_import("torch")
+HuggingFaceInstructEmbeddings = lazy_import("langchain.embeddings", "HuggingFaceInstructEmbeddings")
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_MODEL = "hkunlp/instructor-base"
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "aya", "onnx")
+
+# The instructions of HuggingFaceInstructEmbeddings, so every backend embeds the same inputs
+EMBED_INSTRUCTION = "Represent the document for retrieval: "
+QUERY_INSTRUCTION = "Represent the question for retrieving supporting documents: "
+
+_ONNX_FILES = {False: "model.onnx", True: "model.int8.onnx"}
+_CONFIG_FILE = "instructor_onnx.json"
+
+
+def load_embedding(backend: str = "torch", model_name: str = DEFAULT_MODEL, num_threads: int = None,
+                   onnx_dir: str = None) -> Embeddings:
+    """
+    Loads the instructor embedding model on the given backend.
+
+    Args:
+        backend (str): One of "torch" (the fp32 reference), "torch-int8", "onnx" or "onnx-int8".
+        model_name (str): The instructor model.
+        num_threads (int): The number of intra-op threads. None keeps the default of the runtime.
+        onnx_dir (str): The directory of the exported ONNX model. The model is exported there when it is
+            missing. Defaults to a directory per model in ~/.cache/aya/onnx.
+
+    Returns:
+        Embeddings: The embedding model. The model_name of the quantized and ONNX backends is suffixed with
+            the backend, so their vectors are not mixed with the reference ones in the embedding cache.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Choose among {list(BACKENDS)}.")
+
+    if backend.startswith("torch"):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        embedding = HuggingFaceInstructEmbeddings(model_name=model_name)
+        if backend == "torch-int8":
+            with span("embed.quantize"):
+                embedding.client = torch.quantization.quantize_dynamic(
+                    embedding.client, {torch.nn.Linear}, dtype=torch.qint8)
+            embedding.model_name = f"{model_name}+int8"
+        return embedding
+
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            f"The '{backend}' embedding backend needs onnxruntime, and onnx to export the model. "
+            "Please install them with `pip install -r requirements.txt`."
+        )
+    onnx_dir = onnx_dir or os.path.join(DEFAULT_ONNX_DIR, model_name.replace("/", "__"))
+    quantized = backend == "onnx-int8"
+    if not os.path.exists(os.path.join(onnx_dir, _ONNX_FILES[False])):
+        export_onnx(model_name, onnx_dir, quantize=quantized)
+    elif quantized and not os.path.exists(os.path.join(onnx_dir, _ONNX_FILES[True])):
+        quantize_onnx(onnx_dir)
+    return OnnxInstructorEmbeddings(onnx_dir, quantized=quantized, num_threads=num_threads)
+
+
+class OnnxInstructorEmbeddings(Embeddings):
+    """
+    The instructor model run by ONNX Runtime. The inputs are tokenized like INSTRUCTOR does: the instruction
+    is prepended to the text, and its tokens are left out of the mean pooling.
+    """
+
+    def __init__(self, onnx_dir: str, quantized: bool = False, num_threads: int = None, batch_size: int = 32,
+                 embed_instruction: str = EMBED_INSTRUCTION, query_instruction: str = QUERY_INSTRUCTION) -> None:
+        """
+        Loads an exported model.
+
+        Args:
+            onnx_dir (str): The directory written by export_onnx.
+            quantized (bool): Whether to run the int8 graph instead of the fp32 one.
+            num_threads (int): The number of intra-op threads. None uses all the cores.
+            batch_size (int): The number of texts per run of the graph.
+            embed_instruction (str): The instruction of the documents.
+            query_instruction (str): The instruction of the queries.
+        """
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(onnx_dir, _CONFIG_FILE), encoding="utf-8") as file:
+            config = json.load(file)
+        suffix = "+onnx-int8" if quantized else "+onnx"
+        self.model_name = config["model_name"] + suffix
+        self.max_seq_length = config["max_seq_length"]
+        self.do_lower_case = config["do_lower_case"]
+        self.batch_size = batch_size
+        self.embed_instruction = embed_instruction
+        self.query_instruction = query_instruction
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(os.path.join(onnx_dir, _ONNX_FILES[quantized]), options,
+                                                    providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        self._context_lengths: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(self.embed_instruction, texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode(self.query_instruction, [text])[0].tolist()
+
+    def encode(self, instruction: str, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embeds texts with an instruction. The texts are sorted by length so the batches hold little padding.
+
+        Args:
+            instruction (str): The instruction.
+            texts (Sequence[str]): The texts.
+
+        Returns:
+            np.ndarray: The embeddings, one row per text, in the order of the texts.
+        """
+        if not texts:
+            return np.zeros((0, self.session.get_outputs()[0].shape[-1]), dtype=np.float32)
+        inputs = [self._prepare(instruction + self._prepare(text)) for text in texts]
+        order = np.argsort([-len(text) for text in inputs], kind="stable")
+        context_length = self._context_length(instruction)
+
+        embeddings = [None] * len(inputs)
+        for start in range(0, len(inputs), self.batch_size):
+            batch = [int(idx) for idx in order[start:start + self.batch_size]]
+            features = self.tokenizer([inputs[idx] for idx in batch], padding=True, truncation="longest_first",
+                                      max_length=self.max_seq_length, return_tensors="np")
+            output = self.session.run(None, {
+                "input_ids": features["input_ids"].astype(np.int64),
+                "attention_mask": features["attention_mask"].astype(np.int64),
+                "context_masks": np.full(len(batch), context_length, dtype=np.int64),
+            })[0]
+            for row, idx in enumerate(batch):
+                embeddings[idx] = output[row]
+        return np.stack(embeddings)
+
+    def _prepare(self, text: str) -> str:
+        text = text.strip()
+        return text.lower() if self.do_lower_case else text
+
+    def _context_length(self, instruction: str) -> int:
+        # The number of instruction tokens left out of the pooling, computed as INSTRUCTOR does
+        with self._lock:
+            if instruction not in self._context_lengths:
+                tokens = len(self.tokenizer(self._prepare(instruction), truncation=True,
+                                            max_length=self.max_seq_length)["input_ids"]) - 1
+                self._context_lengths[instruction] = tokens if tokens > 1 else 0
+            return self._context_lengths[instruction]
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True, client=None, opset: int = 14) -> str:
+    """
+    Exports the instructor model, from the tokens to the normalized sentence embedding, to an ONNX graph.
+    The tokenizer is saved next to it.
+
+    Args:
+        model_name (str): The instructor model.
+        output_dir (str): The directory of the exported model.
+        quantize (bool): Whether to also write the dynamically int8-quantized graph.
+        client (INSTRUCTOR): An already loaded model. Loaded from model_name when None.
+        opset (int): The ONNX opset.
+
+    Returns:
+        str: The output directory.
+    """
+    if client is None:
+        from InstructorEmbedding import INSTRUCTOR
+        client = INSTRUCTOR(model_name)
+    transformer, pooling, *head = list(client)
+    if not pooling.pooling_mode_mean_tokens or pooling.get_pooling_mode_str() != "mean":
+        raise ValueError(f"Only the mean pooling of the instructor models can be exported, not "
+                         f"'{pooling.get_pooling_mode_str()}'.")
+
+    class Graph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = transformer.auto_model
+            self.head = torch.nn.ModuleList(head)
+
+        def forward(self, input_ids, attention_mask, context_masks):
+            tokens = self.encoder(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+            # The instruction tokens are part of the encoder input but not of the pooling
+            positions = torch.arange(input_ids.shape[1], device=input_ids.device).unsqueeze(0)
+            mask = (attention_mask * (positions >= context_masks.unsqueeze(1))).unsqueeze(-1).to(tokens.dtype)
+            features = {"sentence_embedding": (tokens * mask).sum(1) / mask.sum(1).clamp(min=1e-9)}
+            for module in self.head:
+                features = module(features)
+            return features["sentence_embedding"]
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, _ONNX_FILES[False])
+    sample = transformer.tokenizer([EMBED_INSTRUCTION + "Name - Jane Doe"], return_tensors="pt")
+    with span("embed.export"), torch.no_grad():
+        torch.onnx.export(
+            Graph().eval(),
+            (sample["input_ids"], sample["attention_mask"], torch.zeros(1, dtype=torch.long)),
+            path,
+            input_names=["input_ids", "attention_mask", "context_masks"],
+            output_names=["sentence_embedding"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                          "context_masks": {0: "batch"}, "sentence_embedding": {0: "batch"}},
+            opset_version=opset,
+        )
+    transformer.tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, _CONFIG_FILE), "w", encoding="utf-8") as file:
+        json.dump({"model_name": model_name, "max_seq_length": transformer.max_seq_length,
+                   "do_lower_case": transformer.do_lower_case}, file, indent=2)
+
+    if quantize:
+        quantize_onnx(output_dir)
+    return output_dir
+
+
+def quantize_onnx(onnx_dir: str) -> str:
+    """
+    Writes the dynamically int8-quantized version of an exported graph: the weights of the matrix
+    multiplications are stored in int8 and the activations are quantized on the fly.
+
+    Args:
+        onnx_dir (str): The directory written by export_onnx.
+
+    Returns:
+        str: The path of the quantized graph.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path = os.path.join(onnx_dir, _ONNX_FILES[True])
+    with span("embed.quantize"):
+        quantize_dynamic(os.path.join(onnx_dir, _ONNX_FILES[False]), path, weight_type=QuantType.QInt8)
+    return path
+
+
+def parity(reference: Embeddings, candidate: Embeddings, texts: List[str], queries: List[str] = (),
+           k: int = 4) -> dict:
+    """
+    Measures how closely a backend agrees with the reference model.
+
+    Args:
+        reference (Embeddings): The reference model, usually the torch backend.
+        candidate (Embeddings): The backend to check.
+        texts (List[str]): The documents embedded by both models.
+        queries (List[str]): Questions searched among the documents by both models.
+        k (int): The number of documents retrieved per question.
+
+    Returns:
+        dict: The minimum and mean cosine similarity between the document vectors of both models, and with
+            queries, the mean overlap of the k documents each model retrieves per question.
+    """
+    expected = _normalize(np.asarray(reference.embed_documents(texts), dtype=np.float32))
+    actual = _normalize(np.asarray(candidate.embed_documents(texts), dtype=np.float32))
+    cosines = np.sum(expected * actual, axis=1)
+    result = {"documents": len(texts), "min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+
+    if queries:
+        k = min(k, len(texts))
+        overlaps = []
+        for query in queries:
+            expected_top = np.argsort(-(expected @ _normalize(np.asarray(reference.embed_query(query)))))[:k]
+            actual_top = np.argsort(-(actual @ _normalize(np.asarray(candidate.embed_query(query)))))[:k]
+            overlaps.append(len(set(expected_top) & set(actual_top)) / k)
+        result[f"top{k}_overlap"] = float(np.mean(overlaps))
+    return result
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Export the model to ONNX, in fp32 and int8.")
+    export.add_argument("--model", default=DEFAULT_MODEL)
+    export.add_argument("--output", help="The output directory. Defaults to the one used by load_embedding.")
+    export.add_argument("--no-quantize", action="store_true", help="Only write the fp32 graph.")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(DEFAULT_ONNX_DIR, args.model.replace("/", "__"))
+    print(f"Exported {args.model} to {export_onnx(args.model, output, quantize=not args.no_quantize)}")
+
+
+if __name__ == "__main__":
+    main()
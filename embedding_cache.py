@@ -0,0 +1,337 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the store is only safe within one process
+    fcntl = None
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from tracing import span
+
+
+class DiskEmbeddingStore():
+    """
+    An append-only on-disk store of embeddings.
+
+    The vectors are kept in a flat float32 file which is memory-mapped for reading, and the
+    content hashes in a text file with one key per line. The line number of a key is the row
+    of its vector. Several stores, in one or several processes, can share the files: the appends
+    hold an exclusive lock on the directory and first read the keys appended by the other writers.
+    """
+
+    def __init__(self, directory: str, name: str) -> None:
+        """
+        Opens (or creates) the store and loads the hash index.
+
+        Args:
+            directory (str): The directory where the cache files are kept.
+            name (str): The base name of the cache files.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, name + ".f32")
+        self.keys_path = os.path.join(directory, name + ".keys")
+        self.meta_path = os.path.join(directory, name + ".json")
+        self.lock_path = os.path.join(directory, name + ".lock")
+
+        self.dim = None
+        self.index = {}
+        self._rows = 0
+        self._keys_size = 0
+        self._mmap = None
+        self._lock = threading.Lock()
+
+        with self._lock, self._file_lock():
+            self._load()
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """
+        Holds the exclusive lock of the cache files, shared by every process using the directory.
+        """
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        """
+        Indexes the keys appended since the last load, by this store or any other writer, and truncates
+        both files to the rows that were completely written, e.g. after a crash. Called with the file lock.
+        """
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path) as meta_file:
+                self.dim = json.load(meta_file)["dim"]
+        if not self.dim or not os.path.exists(self.keys_path) or not os.path.exists(self.vectors_path):
+            return
+
+        with open(self.keys_path, "rb") as keys_file:
+            keys_file.seek(self._keys_size)
+            lines = keys_file.read().splitlines(keepends=True)
+        lines = [line for line in lines if line.endswith(b"\n")]
+        vector_rows = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        if vector_rows < self._rows:
+            # Rows this store had read were truncated by another writer, the index is rebuilt
+            self.index, self._rows, self._keys_size = {}, 0, 0
+            self._load()
+            return
+
+        for line in lines[:vector_rows - self._rows]:
+            # The first row of a key appended twice by concurrent writers is kept
+            self.index.setdefault(line.decode("utf-8").strip(), self._rows)
+            self._rows += 1
+            self._keys_size += len(line)
+        self._repair()
+
+    def _repair(self) -> None:
+        """
+        Truncates both files to the rows that were indexed. Vectors are appended before their keys,
+        so only a crashed writer leaves a vector without its key or a key without its vector.
+        """
+        if os.path.getsize(self.vectors_path) != self._rows * self.dim * 4:
+            with open(self.vectors_path, "r+b") as vectors_file:
+                vectors_file.truncate(self._rows * self.dim * 4)
+        if os.path.getsize(self.keys_path) != self._keys_size:
+            with open(self.keys_path, "r+b") as keys_file:
+                keys_file.truncate(self._keys_size)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """
+        Reads the vector stored for the key.
+
+        Args:
+            key (str): The content hash.
+
+        Returns:
+            The stored vector, or None if the key is not in the store.
+        """
+        row = self.index.get(key)
+        if row is None:
+            return None
+        with self._lock:
+            if self._mmap is None or row >= self._mmap.shape[0]:
+                self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+            return self._mmap[row].tolist()
+
+    def put(self, keys: List[str], vectors: List[List[float]]) -> None:
+        """
+        Appends the vectors of keys that are not stored yet.
+
+        Args:
+            keys (List[str]): The content hashes.
+            vectors (List[List[float]]): The vectors, in the same order as the keys.
+        """
+        with self._lock, self._file_lock():
+            # The rows appended by the other writers come first, so the new rows are numbered after them
+            self._load()
+            new = OrderedDict()
+            for key, vector in zip(keys, vectors):
+                if key not in self.index:
+                    new.setdefault(key, vector)
+            if not new:
+                return
+            array = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = array.shape[1]
+                with open(self.meta_path, "w") as meta_file:
+                    json.dump({"dim": self.dim}, meta_file)
+
+            # Vectors first, so that a key on disk always points to a complete row
+            with open(self.vectors_path, "ab") as vectors_file:
+                vectors_file.write(array.tobytes())
+            lines = "".join(key + "\n" for key in new).encode("utf-8")
+            with open(self.keys_path, "ab") as keys_file:
+                keys_file.write(lines)
+
+            for key in new:
+                self.index[key] = self._rows
+                self._rows += 1
+            self._keys_size += len(lines)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    A content-addressed cache in front of an embedding model.
+
+    Every text is keyed by a hash of the model name, the instruction and the text itself. Lookups
+    go through an in-memory LRU first and then through an optional on-disk store, and only the
+    texts that miss both are sent to the wrapped model.
+    """
+
+    def __init__(self, embedding: Embeddings, cache_dir: str = None, max_memory_entries: int = 10000) -> None:
+        """
+        Initializes the cache around the given embedding model.
+
+        Args:
+            embedding (Embeddings): The embedding model to be cached.
+            cache_dir (str): The directory of the on-disk cache. None keeps the cache in memory only.
+            max_memory_entries (int): The maximum number of vectors kept in the in-memory LRU.
+        """
+        self.embedding = embedding
+        self.model_name = getattr(embedding, "model_name", type(embedding).__name__)
+        self.max_memory_entries = max_memory_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if cache_dir:
+            name = hashlib.sha256(self.model_name.encode("utf-8")).hexdigest()[:16]
+            self._disk = DiskEmbeddingStore(cache_dir, name)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, instruction: str, text: str) -> str:
+        """
+        Computes the cache key of a text.
+
+        Args:
+            instruction (str): The instruction the text is embedded with.
+            text (str): The text to be embedded.
+
+        Returns:
+            str: The hex digest identifying the embedding.
+        """
+        digest = hashlib.sha256()
+        for part in (self.model_name, instruction or "", text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds the documents, computing only the ones that are not cached.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text.
+        """
+        instruction = getattr(self.embedding, "embed_instruction", "")
+        return self._embed(list(texts), instruction, self.embedding.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a query, computing it only if it is not cached.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            List[float]: The embedding of the query.
+        """
+        instruction = getattr(self.embedding, "query_instruction", "")
+        return self._embed([text], instruction, lambda texts: [self.embedding.embed_query(texts[0])])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries, computing the ones that are not cached in a single forward pass.
+
+        Args:
+            texts (List[str]): The queries to embed.
+
+        Returns:
+            List[List[float]]: One embedding per query.
+        """
+        instruction = getattr(self.embedding, "query_instruction", "")
+        return self._embed(list(texts), instruction, self._compute_queries)
+
+    def _compute_queries(self, texts: List[str]) -> List[List[float]]:
+        client = getattr(self.embedding, "client", None)
+        if client is not None and hasattr(self.embedding, "query_instruction"):
+            # Instructor models encode [instruction, text] pairs, so the batch keeps the query instruction
+            instruction_pairs = [[self.embedding.query_instruction, text] for text in texts]
+            return client.encode(instruction_pairs, **getattr(self.embedding, "encode_kwargs", {})).tolist()
+        return [self.embedding.embed_query(text) for text in texts]
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counters of the cache.
+
+        Returns:
+            dict: The counters and the number of cached vectors per tier.
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk) if self._disk is not None else 0,
+        }
+
+    def _embed(self, texts: List[str], instruction: str, compute: Callable) -> List[List[float]]:
+        with span("embed", texts=len(texts)) as current:
+            results, misses = self._embed_cached(texts, instruction, compute)
+            if current is not None:
+                current.set(hits=len(texts) - misses, misses=misses)
+            return results
+
+    def _embed_cached(self, texts: List[str], instruction: str, compute: Callable):
+        keys = [self.key(instruction, text) for text in texts]
+        results = [None] * len(texts)
+
+        # Group the misses by key so that repeated texts are computed once
+        missing = OrderedDict()
+        for idx, key in enumerate(keys):
+            vector = self._lookup(key)
+            if vector is None:
+                missing.setdefault(key, []).append(idx)
+            else:
+                results[idx] = vector
+
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            missing_keys = list(missing)
+            with span("embed.compute", texts=len(missing_keys)):
+                computed = compute([texts[missing[key][0]] for key in missing_keys])
+            computed = [list(map(float, vector)) for vector in computed]
+            self._remember(missing_keys, computed)
+            if self._disk is not None:
+                self._disk.put(missing_keys, computed)
+            for key, vector in zip(missing_keys, computed):
+                for idx in missing[key]:
+                    results[idx] = vector
+        return results, sum(len(indices) for indices in missing.values())
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        if self._disk is not None:
+            vector = self._disk.get(key)
+            if vector is not None:
+                self._remember([key], [vector])
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return vector
+        return None
+
+    def _remember(self, keys: List[str], vectors: List[List[float]]) -> None:
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
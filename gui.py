@@ -1,19 +1,23 @@
 import streamlit as st
-from langchain.memory.chat_message_histories import StreamlitChatMessageHistory
-from langchain.tools import DuckDuckGoSearchRun
-from langchain.chains import RetrievalQA
-from langchain.memory import ConversationBufferMemory
-import os, time
+import functools
+import os
 
-from utils import *
-from ai_agents import *
+from lazy import lazy_import
+from resources import get_registry
+from speculative import classify_with_prefetch
+from tracing import TRACER, StageStats
+
+# Only imported when first used, so the page renders while the heavy dependencies load
+StreamlitChatMessageHistory = lazy_import("langchain.memory.chat_message_histories", "StreamlitChatMessageHistory")
+ConversationBufferMemory = lazy_import("langchain.memory", "ConversationBufferMemory")
+DuckDuckGoSearchRun = lazy_import("langchain.tools", "DuckDuckGoSearchRun")
 
 def setup_sidebar() -> tuple:
     """
     Sets up the sidebar configuration for the Streamlit application.
 
     Returns:
-        tuple: Contains API key entered by the user, model choice, and available tools.
+        tuple: Contains API key entered by the user, model choice, and the factories of the available tools.
     """
     st.set_page_config(page_title="AI Agent with tools", page_icon="🚀")
     
@@ -23,7 +27,7 @@ def setup_sidebar() -> tuple:
         "Choose a model:", ("Llama3 - 8B", "gpt-4-0613 (Not Implemented)"))
 
     available_tools = {
-        "Search": DuckDuckGoSearchRun(name="Search"),
+        "Search": functools.partial(DuckDuckGoSearchRun, name="Search"),
     }
 
     # st.sidebar.text("Select tools:")
@@ -33,7 +37,8 @@ def setup_sidebar() -> tuple:
 
     # Tool selections
     # if st.sidebar.checkbox("Upload a File 📓"):
-    #     uploaded_file = st.file_uploader("Upload an article", type=("txt", "pdf"))
+    #     # Uploads are streamed as UTF-8 text, so only .txt files are accepted
+    uploaded_file = st.file_uploader("Upload an article", type=("txt",))
     #     available_tools['Uploaded Data'] = uploaded_file.read().decode()
 
     return api_key, model_choice, available_tools
@@ -47,6 +52,22 @@ def ai_message(msg: str):
     """
     st.chat_message("assistant", avatar='./ui_imgs/assistant.jpeg').write(msg)
 
+def show_latency_panel(stats: StageStats):
+    """
+    Displays the p50 and p95 latency of every stage of the current session in the sidebar.
+
+    Args:
+        stats (StageStats): The statistics of the session.
+    """
+    summary = stats.summary()
+    if not summary:
+        st.sidebar.caption("Nothing has been timed yet.")
+        return
+    st.sidebar.table([
+        {"stage": name, "count": stage["count"], "p50 (ms)": round(stage["p50_ms"]), "p95 (ms)": round(stage["p95_ms"])}
+        for name, stage in summary.items()
+    ])
+
 def main():
     """
     Main function to run the Streamlit application.
@@ -62,29 +83,31 @@ def main():
     prompt = None
     data = ""
 
-    # Init the Utils class
-    utils = Utils()
+    # Start loading the shared resources in the background. This is a no-op after the first run.
+    registry = get_registry()
+    registry.warm_up()
 
-    # Progress bar for API key input
-    progress_text = "Please Enter API Key of Groq"
-    my_bar = st.progress(0, text=progress_text)
+    # Time the stages of this session separately, for the latency panel
+    stage_stats = st.session_state.setdefault("stage_stats", StageStats())
+    TRACER.bind_session(stage_stats)
 
-    for percent_complete in range(100):
-        if not api_key:
-            time.sleep(0.01)
-            my_bar.progress(percent_complete + 1, text=progress_text)
-            time.sleep(1)
-            my_bar.empty()
-            continue
-        else:
-            my_bar.empty()
-            break
-        
-    # Load the LLM Model
-    model = utils.load_model(api_key)
-    ai_agents = AI_Agents(model, "./text_files")
+    # Wait for the API key without blocking the script
+    if not api_key:
+        st.info("Please Enter API Key of Groq")
+        st.stop()
+
+    # The embedding model is only loaded once per process
+    if not registry.is_ready():
+        with st.spinner("Loading the embedding model..."):
+            registry.utils()
+    utils = registry.utils()
+
+    # Reuse the LLM Model and the agents bound to this API key
+    model = registry.model(api_key)
+    ai_agents = registry.agents(api_key)
     # Load the Chroma Database or Return Null if nothing is there in DB
-    vectordb = utils.load_db()
+    vectordb = registry.vectordb()
+    answer_cache = registry.answer_cache()
 
     # Setup the Streamlit interface
     st.title("🚀 AI Assistant")
@@ -103,7 +126,8 @@ def main():
     if not prompt:
         prompt = st.chat_input(placeholder="What would you like to know?")
 
-    uploaded_file = st.file_uploader("Upload an article", type=("txt", "pdf"))
+    # Uploads are streamed as UTF-8 text, so only .txt files are accepted
+    uploaded_file = st.file_uploader("Upload an article", type=("txt",))
 
     # Process user prompt
     if prompt:
@@ -113,19 +137,25 @@ def main():
             st.stop()
         new_file_uploaded = True if uploaded_file else False
         
-        # Classify the prompt into one of 5 categories
-        prompt_result = ai_agents.prompt_classifier(prompt)
+        # Classify the prompt into one of 5 categories, searching the memory for it in the meantime
+        prompt_result, prefetched = classify_with_prefetch(ai_agents, vectordb, prompt)
 
         # Save something in Memory
         if prompt_result == "save something in memory":
             if new_file_uploaded:
                 ai_message("Data uploaded")
-                # Get the Structured data from the Unstructured Input
-                structured_output = ai_agents.extract_from_uploaded_file(uploaded_file)
-            
-                # Store the structured data in the Chroma DB database
-                utils.store_in_db(structured_output)
-                ai_message("Data stored in DB")
+                try:
+                    # Get the Structured data from the Unstructured Input, extracting the windows of the file in
+                    # parallel and merging their bullet points without duplicates
+                    structured_output = ai_agents.extract_from_uploaded_file(
+                        uploaded_file, max_workers=4, rate_limiter=registry.rate_limiter())
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    # Store the structured data in the Chroma DB database
+                    utils.store_in_db(structured_output, bulk_embedder=registry.bulk_embedder())
+                    registry.refresh_vectordb()
+                    ai_message("Data stored in DB")
             else:
                 ai_message("You have not uploaded any file to save in memory! \
                             Please Upload file and Enter New prompt")
@@ -134,76 +164,76 @@ def main():
         elif prompt_result == "deduce memory from unstructured text":
             ai_message(prompt)
 
-            # Retrieve from the Database the Most Similar Content
-            retriever = vectordb.as_retriever(search_kwargs={"k": 3})
-
             # If there is nothing in the db
-            if type(retriever) == str:
+            if type(vectordb) == str:
                 ai_message("There is Nothing in Memory")
             else:
-                # create the chain to answer questions 
-                qa_chain = RetrievalQA.from_chain_type(llm=model, 
-                                                chain_type="stuff", 
-                                                retriever=retriever, 
-                                                return_source_documents=True)
-                llm_response = qa_chain(prompt)['result']
-                ai_message(llm_response)
+                # Reuse the answer to a similar question if the memory has not changed since
+                cached = answer_cache.lookup(prompt, prefetched.generation)
+                if cached is not None:
+                    prefetched.discard()
+                    answer, docs = cached
+                else:
+                    # The Most Similar Content was already retrieved from the Database during the classification
+                    docs = prefetched.docs(k=3)
+
+                with st.chat_message("assistant", avatar='./ui_imgs/assistant.jpeg'):
+                    # Show the memories right away, while the answer is being generated
+                    with st.expander("Sources"):
+                        for doc in docs:
+                            st.text(doc.page_content)
+                    if cached is not None:
+                        st.write(answer)
+                    else:
+                        # Render the answer token by token
+                        answer = st.write_stream(utils.stream_answer_from_memory(model, prompt, docs))
+                        answer_cache.store(prompt, answer, prefetched.generation, docs)
 
         # Update the Memory
         elif prompt_result == "update memory":
             ai_message("Loading Old Memory....Updating Memory")
 
-            # Extract from the DB vectors, the most similar memory
-            docs = vectordb.similarity_search(prompt)
-
-            # Extract the Index for the most similar memory
-            doc_id = docs[0].metadata['id']
-
-            # Update the old memory with the new memory or content
-            stored_memory = ai_agents.memory_management(prompt, docs[0])
-            
-            # Update DB with the new memory. In place Update.
-            document = docs[0]
-            document.page_content = stored_memory
-            vectordb.update_document(doc_id, document)
-
-            # Save the DB to disk
-            vectordb.persist()  
-            ai_message("Updated DB with new data")
+            # The most similar memories were already extracted from the DB vectors during the classification.
+            # A single LLM call picks the memory to update and rewrites it.
+            document = ai_agents.edit_memory(prompt, prefetched.docs(k=3), action="update")
+            if document is None:
+                ai_message("Could not find the memory to update")
+            else:
+                # Update DB with the new memory. In place Update.
+                vectordb.update_document(document.metadata['id'], document)
+                ai_message("Updated DB with new data")
 
         # Delete certain memory
         elif prompt_result == "delete memory":
-            
-            # Extract the category or detail to be deleted
-            extracted_class = ai_agents.category_extraction(prompt)
-
-            # Get the memory from the DB which is most similar
-            db_result = vectordb.similarity_search(extracted_class.lower())[0]
-            db_index = db_result.metadata['id']
 
-            # Delte the Memory from the DB
+            # A single LLM call picks the memory holding the detail to be deleted and removes it
             ai_message("Deleting Memory")
-            updated_memory = ai_agents.delete_memory(prompt, db_result)
-            document = db_result
-            if len(updated_memory)>0:
-                document.page_content = updated_memory
-                vectordb.update_document(db_index, document)
-
-                # Store the updated DB to disk
-                vectordb.persist()
+            document = ai_agents.edit_memory(prompt, prefetched.docs(k=3), action="delete")
+            if document is None:
+                ai_message("Could not find the memory to delete")
+            elif len(document.page_content) > 0:
+                vectordb.update_document(document.metadata['id'], document)
+            else:
+                # Nothing is left of the memory
+                vectordb.delete([document.metadata['id']])
 
         # Any Other Prompt....Or just interact with the Model (LLM)
         elif prompt_result == "off_topic":
 
             with st.chat_message("assistant", avatar='./ui_imgs/assistant.jpeg'):
-                response = utils.generic_response(model, prompt)
                 try:
-                    st.write(response)
+                    # Render the response token by token
+                    st.write_stream(utils.stream_generic_response(model, prompt))
                 except Exception as e:
                     st.error("Something went wrong. Please try again later.")
                     msgs.clear()
                     msgs.add_ai_message("How can I help you?")
 
+    # Export the process-wide latency histograms if AYA_TRACE_EXPORT is set
+    TRACER.maybe_export()
+    if st.sidebar.checkbox("Show latency (p50/p95)"):
+        show_latency_panel(stage_stats)
+
 
 # Execute the main function
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+import codecs
+import queue
+import threading
+from typing import BinaryIO, Iterable, Iterator
+
+from tokens import CHARS_PER_TOKEN, count_tokens, split_by_tokens
+
+_DONE = object()
+
+
+def iter_decoded(file: BinaryIO, chunk_size: int = 64 * 1024, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Reads a file incrementally and decodes it chunk by chunk.
+
+    Multi-byte characters split across two reads are kept by the incremental decoder,
+    so at most one chunk of the file is held in memory.
+
+    Args:
+        file (BinaryIO): The file-like object to be read.
+        chunk_size (int): The number of bytes read at a time.
+        encoding (str): The text encoding of the file.
+
+    Returns:
+        Iterator[str]: The decoded text, piece by piece.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    while True:
+        raw = file.read(chunk_size)
+        if not raw:
+            break
+        text = raw if isinstance(raw, str) else decoder.decode(raw)
+        if text:
+            yield text
+
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_segments(pieces: Iterable[str], max_chars: int) -> Iterator[str]:
+    """
+    Regroups text pieces into lines. Lines longer than max_chars are cut, so the pending
+    text never grows beyond max_chars plus one piece.
+
+    Args:
+        pieces (Iterable[str]): The text pieces.
+        max_chars (int): The maximum length of a segment.
+
+    Returns:
+        Iterator[str]: The segments, in order.
+    """
+    pending = ""
+    for piece in pieces:
+        pending += piece
+        while True:
+            newline = pending.find("\n", 0, max_chars)
+            if newline != -1:
+                yield pending[:newline + 1]
+                pending = pending[newline + 1:]
+            elif len(pending) >= max_chars:
+                yield pending[:max_chars]
+                pending = pending[max_chars:]
+            else:
+                break
+    if pending:
+        yield pending
+
+
+def iter_token_windows(pieces: Iterable[str], max_tokens: int = 3000) -> Iterator[str]:
+    """
+    Groups text pieces into windows of at most max_tokens tokens, breaking on line boundaries
+    whenever possible.
+
+    Args:
+        pieces (Iterable[str]): The text pieces.
+        max_tokens (int): The maximum number of tokens per window.
+
+    Returns:
+        Iterator[str]: The windows, in order.
+    """
+    window, window_tokens = [], 0
+    for segment in iter_segments(pieces, max_chars=max_tokens * CHARS_PER_TOKEN):
+        tokens = count_tokens(segment)
+        parts = [(segment, tokens)] if tokens <= max_tokens else \
+            [(part, count_tokens(part)) for part in split_by_tokens(segment, max_tokens)]
+
+        for part, part_tokens in parts:
+            if window and window_tokens + part_tokens > max_tokens:
+                yield "".join(window)
+                window, window_tokens = [], 0
+            window.append(part)
+            window_tokens += part_tokens
+
+    if window:
+        yield "".join(window)
+
+
+def prefetch(iterable: Iterable, max_pending: int = 2) -> Iterator:
+    """
+    Produces the items of an iterable in a background thread, at most max_pending items ahead
+    of the consumer. The producer blocks when the consumer falls behind.
+
+    Args:
+        iterable (Iterable): The items to be produced.
+        max_pending (int): The maximum number of items waiting for the consumer.
+
+    Returns:
+        Iterator: The items, in order.
+    """
+    items = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except Exception as e:
+            put((_DONE, e))
+
+    producer = threading.Thread(target=produce, name="aya-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Let the producer exit if the consumer stops early
+        stop.set()
+
+
+def iter_file_windows(file: BinaryIO, max_tokens: int = 3000, chunk_size: int = 64 * 1024,
+                      max_pending: int = 2) -> Iterator[str]:
+    """
+    Streams a text file as token-bounded windows. Reading and decoding run ahead in a background
+    thread by at most max_pending windows, so the peak memory does not depend on the file size.
+
+    Args:
+        file (BinaryIO): The file-like object to be read.
+        max_tokens (int): The maximum number of tokens per window.
+        chunk_size (int): The number of bytes read at a time.
+        max_pending (int): The number of windows prepared ahead of the consumer.
+
+    Returns:
+        Iterator[str]: The windows, in order.
+    """
+    return prefetch(iter_token_windows(iter_decoded(file, chunk_size), max_tokens), max_pending)
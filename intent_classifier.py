@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_SEEDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_seeds.json")
+
+
+class IntentClassifier():
+    """
+    A local nearest-centroid classifier of the user intent.
+
+    Every category is represented by the mean embedding of a set of example prompts. A prompt
+    is assigned to the closest centroid by cosine similarity, and the softmax over the similarities
+    is returned as the confidence of the prediction.
+    """
+
+    def __init__(self, embedding: Embeddings, seeds_path: str = DEFAULT_SEEDS_PATH, temperature: float = 0.05) -> None:
+        """
+        Initializes the classifier. The seed prompts are embedded on the first prediction.
+
+        Args:
+            embedding (Embeddings): The embedding model used for the seeds and the prompts.
+            seeds_path (str): The path of the JSON file mapping each category to example prompts.
+            temperature (float): The softmax temperature. Lower values give sharper confidences.
+        """
+        self.embedding = embedding
+        self.seeds_path = seeds_path
+        self.temperature = temperature
+
+        self.labels = []
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    def fit(self, seeds: Dict[str, List[str]] = None) -> "IntentClassifier":
+        """
+        Computes one normalized centroid per category from the seed prompts.
+
+        Args:
+            seeds (Dict[str, List[str]]): The example prompts per category. Defaults to the bundled seed file.
+
+        Returns:
+            IntentClassifier: The fitted classifier.
+        """
+        if seeds is None:
+            with open(self.seeds_path) as seeds_file:
+                seeds = json.load(seeds_file)
+
+        labels = list(seeds)
+        # Embed all seeds in a single batch
+        texts = [text for label in labels for text in seeds[label]]
+        vectors = self._normalize(np.asarray(self.embedding.embed_documents(texts), dtype=np.float32))
+
+        centroids = []
+        start = 0
+        for label in labels:
+            end = start + len(seeds[label])
+            centroids.append(vectors[start:end].mean(axis=0))
+            start = end
+
+        with self._lock:
+            self.labels = labels
+            self._centroids = self._normalize(np.stack(centroids))
+        return self
+
+    def predict(self, prompt: str) -> Tuple[str, float]:
+        """
+        Classifies the prompt into one of the seed categories.
+
+        Args:
+            prompt (str): The user prompt to be classified.
+
+        Returns:
+            Tuple[str, float]: The predicted category and the confidence of the prediction.
+        """
+        if self._centroids is None:
+            self.fit()
+
+        vector = self._normalize(np.asarray(self.embedding.embed_documents([prompt]), dtype=np.float32))[0]
+        similarities = self._centroids @ vector
+
+        logits = (similarities - similarities.max()) / self.temperature
+        probabilities = np.exp(logits) / np.exp(logits).sum()
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
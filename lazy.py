@@ -0,0 +1,72 @@
+import importlib
+import threading
+from typing import Any
+
+from tracing import span
+
+
+class LazyImport():
+    """
+    A stand-in for a module, or for an object of a module, which is only imported on first use. Calling
+    the stand-in or reading one of its attributes imports the module, so heavy dependencies are paid for
+    by the first request which needs them instead of at startup.
+    """
+
+    def __init__(self, module: str, name: str = None) -> None:
+        """
+        Initializes the stand-in. Nothing is imported yet.
+
+        Args:
+            module (str): The module to import.
+            name (str): The object of the module. None stands for the module itself.
+        """
+        self._module = module
+        self._name = name
+        self._target = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Any:
+        """
+        Imports the module on first use, recording the import time as an "import.<module>" span.
+
+        Returns:
+            Any: The module or the object.
+        """
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    with span(f"import.{self._module}"):
+                        target = importlib.import_module(self._module)
+                    self._target = getattr(target, self._name) if self._name else target
+        return self._target
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def __call__(self, *args, **kwargs) -> Any:
+        return self.load()(*args, **kwargs)
+
+    def __getattr__(self, attribute: str) -> Any:
+        # Only called for the attributes which are not set in __init__
+        if attribute.startswith("__"):
+            raise AttributeError(attribute)
+        return getattr(self.load(), attribute)
+
+    def __repr__(self) -> str:
+        target = f"{self._module}.{self._name}" if self._name else self._module
+        return f"<lazy {target}{'' if self.loaded else ' (not imported)'}>"
+
+
+def lazy_import(module: str, name: str = None) -> LazyImport:
+    """
+    Defers the import of a module, or of an object of a module, to its first use.
+
+    Args:
+        module (str): The module to import.
+        name (str): The object of the module. None stands for the module itself.
+
+    Returns:
+        LazyImport: The stand-in.
+    """
+    return LazyImport(module, name)
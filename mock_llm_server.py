@@ -0,0 +1,288 @@
+"""
+A local stand-in for the Groq and OpenAI chat completions APIs, for load testing the assistant offline.
+
+It answers POST /openai/v1/chat/completions (the Groq client) and /v1/chat/completions (OpenAI clients)
+with scripted responses per task type, optionally streamed, after a configurable latency per request and
+per token, and can answer 429 errors at a given rate or above a number of requests per minute.
+
+Usage:
+    python mock_llm_server.py --port 8000 --token-latency 0.02 --rate-limit 0.1
+    AYA_LLM_BASE_URL=http://127.0.0.1:8000 streamlit run gui.py
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Union
+
+# The task types of the prompts, recognized by a marker of their prompt and checked in this order
+TASK_MARKERS = (
+    ("edit_memory", "CANDIDATE MEMORIES:"),
+    ("classify_prompt", "USER INPUT:"),
+    ("extract_personal_info", "DATA:"),
+    ("update_memory", "wants to update in the"),
+    ("delete_memory", "wants to delete in the"),
+    ("extract_category", "wants to delete from the"),
+    ("answer_from_memory", "Use the following pieces of context"),
+)
+
+DEFAULT_SCRIPT = {
+    "edit_memory": '{"target": 0, "content": "Email ID - jane@doe.com"}',
+    "classify_prompt": "off_topic",
+    "extract_personal_info": "Personal Information:\n- Name - Jane Doe\n- Email ID - jane@doe.com",
+    "update_memory": "Name - Jane Doe\nEmail ID - jane@doe.com",
+    "delete_memory": "Name - Jane Doe",
+    "extract_category": "Email ID",
+    "answer_from_memory": "According to your memories, your email is jane@doe.com.",
+    "generic": "Hello! I am a local mock of the language model. How can I help you today?",
+}
+
+# CrewAI agents only stop once the model gives a final answer in the ReAct format
+_REACT_ANSWER = "Thought: I now can give a great answer\nFinal Answer: {answer}"
+_TOKENS = re.compile(r"\S+\s*")
+_PATHS = ("/openai/v1/chat/completions", "/v1/chat/completions", "/chat/completions")
+
+
+def task_type(messages: List[dict]) -> str:
+    """
+    Recognizes the task of a chat completion request from its messages.
+
+    Args:
+        messages (List[dict]): The messages of the request.
+
+    Returns:
+        str: The task type, "generic" when no marker is found.
+    """
+    text = "\n".join(str(message.get("content") or "") for message in messages)
+    for name, marker in TASK_MARKERS:
+        if marker in text:
+            return name
+    return "generic"
+
+
+class MockLLMServer():
+    """
+    A threaded HTTP server mocking the chat completions API. Every scripted response is either a string
+    or a list of strings served in turn.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000, latency: float = 0.0, token_latency: float = 0.0,
+                 rate_limit: float = 0.0, requests_per_minute: float = None, retry_after: float = 1.0,
+                 script: Dict[str, Union[str, List[str]]] = None, seed: int = None) -> None:
+        """
+        Initializes the server. Nothing listens until it is started.
+
+        Args:
+            host (str): The host to bind.
+            port (int): The port to bind, 0 picks a free one.
+            latency (float): The seconds waited before the first token of every response.
+            token_latency (float): The seconds waited per token of every response.
+            rate_limit (float): The probability of answering a request with a 429 error.
+            requests_per_minute (float): The number of requests per minute above which 429 errors are answered.
+            retry_after (float): The seconds advertised in the Retry-After header of the 429 errors.
+            script (Dict[str, Union[str, List[str]]]): The responses per task type, on top of DEFAULT_SCRIPT.
+            seed (int): The seed of the random 429 errors.
+        """
+        self.latency = latency
+        self.token_latency = token_latency
+        self.rate_limit = rate_limit
+        self.requests_per_minute = requests_per_minute
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self.tasks: Dict[str, int] = {}
+
+        self._responses = {
+            name: itertools.cycle([responses] if isinstance(responses, str) else list(responses))
+            for name, responses in {**DEFAULT_SCRIPT, **(script or {})}.items()
+        }
+        self._random = random.Random(seed)
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """
+        The base URL of the server, as expected by the Groq client. OpenAI clients take url + "/v1".
+        """
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        """
+        Serves the requests in a background thread.
+
+        Returns:
+            MockLLMServer: The started server.
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="aya-mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops serving and releases the port.
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def respond(self, messages: List[dict]) -> str:
+        """
+        Picks the scripted response of a request.
+
+        Args:
+            messages (List[dict]): The messages of the request.
+
+        Returns:
+            str: The response, in the ReAct format when the request comes from a crew.
+        """
+        name = task_type(messages)
+        with self._lock:
+            self.tasks[name] = self.tasks.get(name, 0) + 1
+            answer = next(self._responses[name])
+        if any("Final Answer:" in str(message.get("content") or "") for message in messages):
+            answer = _REACT_ANSWER.format(answer=answer)
+        return answer
+
+    def _admit(self) -> bool:
+        """
+        Counts a request and tells whether it is served or rate limited.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            limited = self._random.random() < self.rate_limit or (
+                self.requests_per_minute is not None and len(self._recent) >= self.requests_per_minute)
+            if limited:
+                self.rate_limited += 1
+            else:
+                self._recent.append(now)
+            return not limited
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.rstrip("/") not in _PATHS:
+                    return self._json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+                if not server._admit():
+                    return self._json(429, {"error": {"message": "Rate limit reached, please retry later.",
+                                                      "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}},
+                                      {"Retry-After": f"{server.retry_after:g}"})
+
+                answer = server.respond(body.get("messages", []))
+                tokens = _TOKENS.findall(answer) or [""]
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                model = body.get("model", "mock")
+                time.sleep(server.latency)
+                if body.get("stream"):
+                    self._stream(completion_id, model, tokens)
+                else:
+                    time.sleep(server.token_latency * len(tokens))
+                    prompt_tokens = sum(len(_TOKENS.findall(str(m.get("content") or "")))
+                                        for m in body.get("messages", []))
+                    self._json(200, {
+                        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                                     "finish_reason": "stop", "logprobs": None}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                                  "total_tokens": prompt_tokens + len(tokens)},
+                    })
+
+            def _stream(self, completion_id: str, model: str, tokens: List[str]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                created = int(time.time())
+                deltas = [{"role": "assistant", "content": ""}] + [{"content": token} for token in tokens]
+                for i, delta in enumerate(deltas + [{}]):
+                    if 0 < i <= len(tokens):
+                        time.sleep(server.token_latency)
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                             "model": model, "choices": [{"index": 0, "delta": delta, "logprobs": None,
+                                                          "finish_reason": None if delta else "stop"}]}
+                    self._chunk(f"data: {json.dumps(chunk)}\n\n")
+                self._chunk("data: [DONE]\n\n")
+                self._chunk("")
+
+            def _chunk(self, data: str) -> None:
+                payload = data.encode("utf-8")
+                self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+                self.wfile.flush()
+
+            def _json(self, status: int, payload: dict, headers: Dict[str, str] = None) -> None:
+                content = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="The seconds before the first token.")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="The seconds per token.")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="The probability of a 429 error.")
+    parser.add_argument("--rpm", type=float, help="The requests per minute above which 429 errors are answered.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="The Retry-After of the 429 errors.")
+    parser.add_argument("--script", help="A JSON file mapping task types to a response or a list of responses.")
+    parser.add_argument("--seed", type=int, help="The seed of the random 429 errors.")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as file:
+            script = json.load(file)
+    server = MockLLMServer(args.host, args.port, latency=args.latency, token_latency=args.token_latency,
+                           rate_limit=args.rate_limit, requests_per_minute=args.rpm, retry_after=args.retry_after,
+                           script=script, seed=args.seed)
+    print(f"Mock LLM listening on {server.url} (Groq base URL) and {server.url}/v1 (OpenAI base URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
-import streamlit as st
-from langchain.memory.chat_message_histories import StreamlitChatMessageHistory
-from langchain.tools import DuckDuckGoSearchRun
-from langchain.chains import RetrievalQA
-from langchain.memory import ConversationBufferMemory
 import os, sys
 
-from utils import *
-from ai_agents import *
+from lazy import lazy_import
+from resources import get_registry
+from speculative import classify_with_prefetch
+from tracing import TRACER
+
+# Only the helpers shared with the GUI use Streamlit and the LangChain tools
+st = lazy_import("streamlit")
+DuckDuckGoSearchRun = lazy_import("langchain.tools", "DuckDuckGoSearchRun")
 
 def setup_sidebar():
     st.set_page_config(page_title="AI Agent with tools", page_icon="🚀")
@@ -41,27 +42,28 @@ def main():
     prompt = None
     data = ""
 
-    # Init the Utils class
-    utils = Utils()
-
-    # Load the LLM Model
-    model = utils.load_model()
-    ai_agents = AI_Agents(model, "./text_files")
-    # Load the Chroma Database or Return Null if nothing is there in DB
-    vectordb = utils.load_db()
-
-
-    if not prompt:
-        prompt = st.chat_input(placeholder="What would you like to know?")
+    # Load the embedding model and CrewAI in the background while the first prompt is typed
+    registry = get_registry()
+    registry.warm_up()
+    api_key = os.environ.get("GROQ_API_KEY")
 
     # uploaded_file = st.file_uploader("Upload an article", type=("txt", "pdf"))
 
     while True:
         prompt = input("Enter value:")
+
+        # Init the shared resources, the registry only builds them once
+        utils = registry.utils()
+        # Load the LLM Model
+        model = registry.model(api_key)
+        ai_agents = registry.agents(api_key)
+        # Load the Chroma Database or Return Null if nothing is there in DB
+        vectordb = registry.vectordb()
+        answer_cache = registry.answer_cache()
         # new_file_uploaded = True if uploaded_file else False
         
         # Classify the prompt into one of 5 categories
-        prompt_result = ai_agents.prompt_classifier(prompt)
+        prompt_result, prefetched = classify_with_prefetch(ai_agents, vectordb, prompt)
 
         # if prompt_result == "save something in memory":
         #     if new_file_uploaded:
@@ -85,52 +87,58 @@ def main():
         #                     Please Upload file and Enter New prompt")
 
         if prompt_result == "deduce memory from unstructured text":
-            retriever = vectordb.as_retriever(search_kwargs={"k": 3})
-            if type(retriever) == str:
+            if type(vectordb) == str:
                 print("There is Nothing in Memory")
             else:
-                # create the chain to answer questions 
-                qa_chain = RetrievalQA.from_chain_type(llm=model, 
-                                                chain_type="stuff", 
-                                                retriever=retriever, 
-                                                return_source_documents=True)
-                llm_response = qa_chain(prompt)['result']
-                print(llm_response)
+                # Reuse the answer to a similar question if the memory has not changed since
+                cached = answer_cache.lookup(prompt, prefetched.generation)
+                if cached is not None:
+                    prefetched.discard()
+                    answer, docs = cached
+                else:
+                    docs = prefetched.docs(k=3)
+
+                # Show the memories right away, while the answer is being generated
+                for doc in docs:
+                    print("Source:", doc.page_content.replace("\n", " ")[:200])
+                if cached is not None:
+                    print(answer)
+                else:
+                    chunks = []
+                    for chunk in utils.stream_answer_from_memory(model, prompt, docs):
+                        chunks.append(chunk)
+                        print(chunk, end="", flush=True)
+                    print()
+                    answer_cache.store(prompt, "".join(chunks), prefetched.generation, docs)
 
         elif prompt_result == "update memory":
             print("Loading Old Memory....Updating Memory")
 
-            docs = vectordb.similarity_search(prompt)
-            doc_id = docs[0].metadata['id']
-
-            stored_memory = ai_agents.memory_management(prompt, docs[0])
-            
-            document = docs[0]
-            document.page_content = stored_memory
-            vectordb.update_document(doc_id, document)
-            vectordb.persist()
-            
-            print("Updated DB with new data")
+            document = ai_agents.edit_memory(prompt, prefetched.docs(k=3), action="update")
+            if document is None:
+                print("Could not find the memory to update")
+            else:
+                vectordb.update_document(document.metadata['id'], document)
+                print("Updated DB with new data")
 
         elif prompt_result == "delete memory":
             print("Deleting memory")
-            extracted_class = ai_agents.category_extraction(prompt)
-
-            db_result = vectordb.similarity_search(extracted_class.lower())[0]
-            db_index = db_result.metadata['id']
-            updated_memory = ai_agents.delete_memory(prompt, db_result)
+            document = ai_agents.edit_memory(prompt, prefetched.docs(k=3), action="delete")
+            if document is None:
+                print("Could not find the memory to delete")
+            elif len(document.page_content) > 0:
+                vectordb.update_document(document.metadata['id'], document)
+            else:
+                vectordb.delete([document.metadata['id']])
             print("Updated Memory ------------ \n\n")
 
-            document = db_result
-            
-            if len(updated_memory)>0:
-                document.page_content = updated_memory
-                vectordb.update_document(db_index, document)
-                vectordb.persist()
-
         elif prompt_result == "off_topic":
-            response = utils.generic_response(model, prompt)
-            print(response)
+            for chunk in utils.stream_generic_response(model, prompt):
+                print(chunk, end="", flush=True)
+            print()
+
+        # Export the latency histograms if AYA_TRACE_EXPORT is set
+        TRACER.maybe_export()
 
 # Execute the main function
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+
+class RateLimiter():
+    """
+    Spaces out calls shared by several threads so that at most requests_per_minute calls start per minute.
+    """
+
+    def __init__(self, requests_per_minute: float) -> None:
+        """
+        Initializes the limiter.
+
+        Args:
+            requests_per_minute (float): The maximum number of calls started per minute.
+        """
+        self.interval = 60.0 / requests_per_minute
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Blocks until the caller is allowed to start its call.
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def bounded_map(fn: Callable, items: Iterable, max_workers: int = 4,
+                rate_limiter: RateLimiter = None) -> Iterator:
+    """
+    Applies fn to the items on a thread pool and yields the results in the order of the items.
+
+    At most 2 * max_workers items are in flight, so a lazy iterable of items is only consumed
+    as fast as the results are.
+
+    Args:
+        fn (Callable): The function applied to every item.
+        items (Iterable): The items.
+        max_workers (int): The number of threads.
+        rate_limiter (RateLimiter): Optional limiter acquired before every call.
+
+    Returns:
+        Iterator: The results, in order.
+    """
+    def call(item):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return fn(item)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="aya-map") as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(call, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,115 @@
+import re
+import threading
+from typing import Dict
+
+from tokens import count_tokens, truncate_to_tokens
+
+# The maximum number of tokens of every interpolated input, per workflow. Stored chunks are about 250
+# tokens, so the memories passed to the update and delete workflows are never cut by these budgets.
+DEFAULT_BUDGETS = {
+    "extract_personal_info": {"data": 3000},
+    "classify_prompt": {"data": 512},
+    "update_memory": {"prompt": 512, "data": 2048},
+    "extract_category": {"prompt": 512},
+    "delete_memory": {"prompt": 512, "data": 2048},
+    "edit_memory": {"prompt": 512, "data": 3072},
+}
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def compact(text: str) -> str:
+    """
+    Strips the whitespace of a prompt template: the indentation of the lines, the runs of spaces left by
+    backslash-continued lines and the runs of blank lines. Line breaks and "{placeholders}" are kept.
+
+    Args:
+        text (str): The prompt template.
+
+    Returns:
+        str: The compacted template.
+    """
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+class PromptBudget():
+    """
+    Keeps the prompts of the workflows within a token budget and records the number of prompt tokens
+    sent by every workflow.
+    """
+
+    def __init__(self, budgets: Dict[str, Dict[str, int]] = None) -> None:
+        """
+        Initializes the budget.
+
+        Args:
+            budgets (Dict[str, Dict[str, int]]): The maximum number of tokens of every input, per workflow.
+                Defaults to DEFAULT_BUDGETS.
+        """
+        self.budgets = DEFAULT_BUDGETS if budgets is None else budgets
+        self._stats: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def fit(self, name: str, inputs: dict) -> dict:
+        """
+        Truncates the inputs of a workflow which exceed their budget. Cut inputs end on a line break
+        whenever one is found in the second half of what is kept.
+
+        Args:
+            name (str): The name of the workflow.
+            inputs (dict): The request inputs.
+
+        Returns:
+            dict: The inputs within budget.
+        """
+        fitted = dict(inputs)
+        for field, max_tokens in self.budgets.get(name, {}).items():
+            value = fitted.get(field)
+            if value is None or count_tokens(value) <= max_tokens:
+                continue
+            value = truncate_to_tokens(value, max_tokens)
+            newline = value.rfind("\n")
+            fitted[field] = value[:newline] if newline > len(value) // 2 else value
+        return fitted
+
+    def record(self, name: str, tokens: int) -> None:
+        """
+        Records the number of prompt tokens of one call of a workflow.
+
+        Args:
+            name (str): The name of the workflow.
+            tokens (int): The number of prompt tokens.
+        """
+        with self._lock:
+            stats = self._stats.setdefault(name, {"calls": 0, "total": 0, "max": 0, "last": 0})
+            stats["calls"] += 1
+            stats["total"] += tokens
+            stats["max"] = max(stats["max"], tokens)
+            stats["last"] = tokens
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Reports the prompt tokens per workflow.
+
+        Returns:
+            Dict[str, dict]: The number of calls and the last, mean and maximum prompt tokens of every workflow.
+        """
+        with self._lock:
+            return {
+                name: {"calls": s["calls"], "last": s["last"], "mean": s["total"] / s["calls"], "max": s["max"]}
+                for name, s in self._stats.items()
+            }
+
+
+def prompt_tokens(*messages: str) -> int:
+    """
+    Counts the tokens of the messages of a prompt.
+
+    Args:
+        *messages (str): The messages.
+
+    Returns:
+        int: The number of tokens.
+    """
+    return sum(count_tokens(message) for message in messages)
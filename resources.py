@@ -0,0 +1,234 @@
+import threading
+
+from utils import Utils
+from ai_agents import AI_Agents
+from crew_templates import Crew
+from intent_classifier import IntentClassifier
+from parallel import RateLimiter
+from semantic_cache import SemanticAnswerCache
+
+
+class ResourceRegistry():
+    """
+    A process-wide registry for the expensive resources of the assistant.
+
+    Streamlit re-executes the script on every interaction, but imported modules stay loaded.
+    Keeping the embedding model, the LLM clients, the agents and the vector store in this
+    registry lets every rerun and every session reuse the warm objects instead of rebuilding them.
+    """
+
+    def __init__(self, db_path: str = "/tmp/db", output_path: str = "./text_files", classifier_threshold: float = 0.6,
+                 direct_tasks=("classify_prompt", "extract_category"), requests_per_minute: float = 30) -> None:
+        """
+        Initializes an empty registry. Nothing is loaded until it is first requested.
+
+        Args:
+            db_path (str): The path of the vector database directory.
+            output_path (str): The path where the agents save their output files.
+            classifier_threshold (float): The confidence below which prompts are classified by the LLM crew.
+            direct_tasks (Iterable[str]): The workflows of the agents run as a single chat call instead of a crew.
+            requests_per_minute (float): The cap on the LLM requests of the uploads, shared by every session.
+        """
+        self.db_path = db_path
+        self.output_path = output_path
+        self.classifier_threshold = classifier_threshold
+        self.direct_tasks = tuple(direct_tasks)
+        self.requests_per_minute = requests_per_minute
+
+        self._lock = threading.RLock()
+        self._utils = None
+        self._utils_ready = threading.Event()
+        self._loader = None
+        self._load_error = None
+        self._models = {}
+        self._agents = {}
+        self._intent_classifier = None
+        self._vectordb = None
+        self._answer_cache = None
+        self._bulk_embedder = None
+        self._rate_limiter = None
+
+    def warm_up(self) -> None:
+        """
+        Starts loading the embedding model in a background thread. Calling it again is a no-op.
+        """
+        with self._lock:
+            if self._loader is None and not self._utils_ready.is_set():
+                self._loader = threading.Thread(target=self._load_utils, name="aya-warm-up", daemon=True)
+                self._loader.start()
+
+    def _load_utils(self) -> None:
+        """
+        Loads the Utils class (and with it the embedding model) and opens the readiness gate.
+        """
+        try:
+            self._utils = Utils(db_path=self.db_path)
+            # The agents need CrewAI, which is imported in the meantime as well
+            Crew.load()
+        except Exception as e:
+            self._load_error = e
+        finally:
+            self._utils_ready.set()
+
+    def is_ready(self) -> bool:
+        """
+        Non-blocking readiness check.
+
+        Returns:
+            bool: True when the embedding model has been loaded successfully.
+        """
+        return self._utils_ready.is_set() and self._load_error is None
+
+    def utils(self, timeout: float = None) -> Utils:
+        """
+        Returns the shared Utils instance, waiting for the warm up to finish if needed.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait. None waits forever.
+
+        Returns:
+            Utils: The shared Utils instance.
+        """
+        self.warm_up()
+        if not self._utils_ready.wait(timeout):
+            raise TimeoutError("The embedding model is still loading.")
+
+        if self._load_error is not None:
+            error = self._load_error
+            # Allow the next call to retry the loading
+            with self._lock:
+                self._load_error = None
+                self._loader = None
+                self._utils_ready.clear()
+            raise error
+        return self._utils
+
+    def model(self, api_key: str):
+        """
+        Returns the LLM client for the given API key, creating it on first use.
+
+        Args:
+            api_key (str): The API key for authentication.
+
+        Returns:
+            BaseChatModel: The shared model instance, ChatGroq unless AYA_LLM_BACKEND selects another backend.
+        """
+        with self._lock:
+            if api_key not in self._models:
+                self._models[api_key] = self.utils().load_model(api_key)
+            return self._models[api_key]
+
+    def intent_classifier(self) -> IntentClassifier:
+        """
+        Returns the local intent classifier, fitting it on the bundled seed prompts on first use.
+
+        Returns:
+            IntentClassifier: The shared classifier.
+        """
+        with self._lock:
+            if self._intent_classifier is None:
+                self._intent_classifier = IntentClassifier(self.utils().embedding).fit()
+            return self._intent_classifier
+
+    def agents(self, api_key: str) -> AI_Agents:
+        """
+        Returns the AI agents bound to the model of the given API key, creating them on first use.
+
+        Args:
+            api_key (str): The API key for authentication.
+
+        Returns:
+            AI_Agents: The shared AI_Agents instance.
+        """
+        with self._lock:
+            if api_key not in self._agents:
+                self._agents[api_key] = AI_Agents(
+                    self.model(api_key),
+                    self.output_path,
+                    intent_classifier=self.intent_classifier(),
+                    classifier_threshold=self.classifier_threshold,
+                    direct_tasks=self.direct_tasks
+                )
+            return self._agents[api_key]
+
+    def answer_cache(self) -> SemanticAnswerCache:
+        """
+        Returns the semantic cache of the answers given from memory, creating it on first use.
+
+        Returns:
+            SemanticAnswerCache: The shared answer cache.
+        """
+        with self._lock:
+            if self._answer_cache is None:
+                self._answer_cache = SemanticAnswerCache(self.utils().embedding)
+            return self._answer_cache
+
+    def rate_limiter(self) -> RateLimiter:
+        """
+        Returns the limiter of the LLM requests of the uploads, creating it on first use. All the sessions
+        share it, so together they stay under the requests per minute of the API.
+
+        Returns:
+            RateLimiter: The shared rate limiter.
+        """
+        with self._lock:
+            if self._rate_limiter is None:
+                self._rate_limiter = RateLimiter(self.requests_per_minute)
+            return self._rate_limiter
+
+    def bulk_embedder(self):
+        """
+        Returns the embedder of large ingests, running the embedding model of the shared Utils instance on
+        a worker process per core. It is created on first use and its workers are started on first embed.
+
+        Returns:
+            BulkEmbedder: The shared embedder, or None when the embedding model cannot be loaded by workers.
+        """
+        with self._lock:
+            if self._bulk_embedder is None:
+                self._bulk_embedder = self.utils().bulk_embedder()
+            return self._bulk_embedder
+
+    def vectordb(self):
+        """
+        Returns the open vector database. Absent databases are not cached, so the database
+        is picked up as soon as something is stored in memory.
+
+        Returns:
+            Chroma_AYA: The loaded vector database or a message indicating absence of memory.
+        """
+        with self._lock:
+            if self._vectordb is None:
+                vectordb = self.utils().load_db(self.db_path)
+                if isinstance(vectordb, str):
+                    return vectordb
+                self._vectordb = vectordb
+                # The answers were produced from the store before it was reopened
+                if self._answer_cache is not None:
+                    self._answer_cache.clear()
+            return self._vectordb
+
+    def refresh_vectordb(self) -> None:
+        """
+        Drops the cached vector database so that the next access reopens it.
+        """
+        with self._lock:
+            self._vectordb = None
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    """
+    Returns the process-wide resource registry, creating it on first use.
+
+    Returns:
+        ResourceRegistry: The shared registry.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ResourceRegistry()
+        return _registry
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+class SemanticAnswerCache():
+    """
+    A cache of the answers given from memory, keyed by the embedding of the question. A question close
+    enough to an earlier one gets its answer back, but only while the vector store is still at the write
+    generation the answer was produced from.
+    """
+
+    def __init__(self, embedding, threshold: float = 0.97, max_entries: int = 256) -> None:
+        """
+        Initializes an empty cache.
+
+        Args:
+            embedding (Embeddings): The embedding model of the questions.
+            threshold (float): The minimum cosine similarity between two questions sharing an answer.
+            max_entries (int): The maximum number of answers kept. The least recently used ones are evicted.
+        """
+        self.embedding = embedding
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # question -> (normalized embedding, answer, sources, generation)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str, generation: int) -> Optional[Tuple[str, List[Document]]]:
+        """
+        Finds the answer of the most similar earlier question.
+
+        Args:
+            question (str): The question of the user.
+            generation (int): The current write generation of the vector store.
+
+        Returns:
+            Optional[Tuple[str, List[Document]]]: The answer and its source memories, or None on a miss.
+        """
+        vector = self._embed(question)
+        with self._lock:
+            # Answers produced from an older content of the store are never served again
+            for stale in [key for key, entry in self._entries.items() if entry[3] != generation]:
+                del self._entries[stale]
+
+            best, best_score = None, self.threshold
+            if self._entries:
+                keys = list(self._entries)
+                scores = np.stack([self._entries[key][0] for key in keys]) @ vector
+                idx = int(np.argmax(scores))
+                if scores[idx] >= best_score:
+                    best, best_score = keys[idx], scores[idx]
+
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            _, answer, sources, _ = self._entries[best]
+            return answer, list(sources)
+
+    def store(self, question: str, answer: str, generation: int, sources: List[Document] = ()) -> None:
+        """
+        Stores the answer of a question.
+
+        Args:
+            question (str): The question of the user.
+            answer (str): The answer.
+            generation (int): The write generation of the vector store read before the answer was produced.
+            sources (List[Document]): The memories the answer is based on.
+        """
+        vector = self._embed(question)
+        with self._lock:
+            self._entries[question] = (vector, answer, tuple(sources), generation)
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drops all the answers.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -0,0 +1,107 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# The intents whose branch searches the vector database with the raw prompt
+RETRIEVAL_INTENTS = ("deduce memory from unstructured text", "update memory", "delete memory")
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="aya-speculative")
+
+
+class PrefetchedRetriever(BaseRetriever):
+    """
+    A retriever returning documents that were already fetched, so chains can reuse a prefetched search.
+    """
+
+    documents: List[Document]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.documents
+
+
+class SpeculativeRetrieval():
+    """
+    A top-k similarity search started in the background before the intent of the prompt is known.
+    """
+
+    def __init__(self, vectordb, prompt: str, k: int = 4) -> None:
+        """
+        Starts the search of the prompt in the vector database.
+
+        Args:
+            vectordb (Chroma_AYA): The vector database, or a message indicating absence of memory.
+            prompt (str): The user prompt to search for.
+            k (int): The number of documents to fetch.
+        """
+        self.prompt = prompt
+        self.k = k
+        self._future = None
+        # The write generation of the store when the search started, None if nothing is in memory
+        self.generation = None
+        if not isinstance(vectordb, str):
+            self.generation = vectordb.generation
+            # The search is traced as part of the current chat turn
+            self._future = _executor.submit(contextvars.copy_context().run, vectordb.similarity_search, prompt, k)
+
+    def docs(self, k: int = None) -> List[Document]:
+        """
+        Waits for the search and returns its documents.
+
+        Args:
+            k (int): The number of documents to return. Defaults to all the fetched documents.
+
+        Returns:
+            List[Document]: The documents most similar to the prompt. Empty if nothing is in memory.
+        """
+        if self._future is None:
+            return []
+        return self._future.result()[:k or self.k]
+
+    def retriever(self, k: int = None) -> PrefetchedRetriever:
+        """
+        Wraps the prefetched documents in a retriever.
+
+        Args:
+            k (int): The number of documents to return. Defaults to all the fetched documents.
+
+        Returns:
+            PrefetchedRetriever: A retriever returning the prefetched documents.
+        """
+        return PrefetchedRetriever(documents=self.docs(k))
+
+    def discard(self) -> None:
+        """
+        Drops the search. It is cancelled if it has not started yet.
+        """
+        if self._future is not None:
+            self._future.cancel()
+
+
+def classify_with_prefetch(ai_agents, vectordb, prompt: str, k: int = 4) -> Tuple[str, SpeculativeRetrieval]:
+    """
+    Classifies the prompt while the vector database is searched with it in the background.
+    The search is discarded when the chosen branch does not need it.
+
+    Args:
+        ai_agents (AI_Agents): The agents classifying the prompt.
+        vectordb (Chroma_AYA): The vector database, or a message indicating absence of memory.
+        prompt (str): The user prompt.
+        k (int): The number of documents to prefetch.
+
+    Returns:
+        Tuple[str, SpeculativeRetrieval]: The category of the prompt and the prefetched search.
+    """
+    speculation = SpeculativeRetrieval(vectordb, prompt, k)
+    try:
+        prompt_result = ai_agents.prompt_classifier(prompt)
+    except BaseException:
+        speculation.discard()
+        raise
+
+    if prompt_result not in RETRIEVAL_INTENTS:
+        speculation.discard()
+    return prompt_result, speculation
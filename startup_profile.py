@@ -0,0 +1,98 @@
+"""
+Prints the import-time breakdown of the entry points of the assistant. Every entry point is imported in
+a fresh interpreter with -X importtime, and the slowest imports are listed with their cumulative and
+self times, along with the total per top-level package.
+
+Usage:
+    python startup_profile.py                        # gui and non_gui
+    python startup_profile.py non_gui --top 30
+    python startup_profile.py --budget 1.5           # exits with 1 when an entry point exceeds 1.5s
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ENTRY_POINTS = ("gui", "non_gui")
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile(module: str) -> Tuple[float, List[Tuple[str, int, int, int]]]:
+    """
+    Imports a module in a fresh interpreter and collects the import times.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        Tuple[float, List[Tuple[str, int, int, int]]]: The wall time of the import in seconds, and the name,
+            self and cumulative microseconds and nesting depth of every imported module.
+    """
+    env = dict(os.environ, OTEL_SDK_DISABLED="true")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not import {module}:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return elapsed, imports
+
+
+def by_package(imports: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """
+    Sums the self times of the imported modules per top-level package.
+    """
+    totals: Dict[str, int] = {}
+    for name, self_us, _, _ in imports:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def report(module: str, elapsed: float, imports: List[Tuple[str, int, int, int]], top: int) -> None:
+    total_us = sum(self_us for _, self_us, _, _ in imports)
+    print(f"== {module}: {elapsed:.2f}s wall, {total_us / 1e6:.2f}s importing {len(imports)} modules")
+
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  slowest imports")
+    for name, self_us, cumulative_us, depth in sorted(imports, key=lambda item: -item[2])[:top]:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {'  ' * depth}{name}")
+
+    print(f"\n{'self ms':>14}  {'share':>6}  top-level packages")
+    for package, self_us in sorted(by_package(imports).items(), key=lambda item: -item[1])[:top]:
+        print(f"{self_us / 1000:>14.1f}  {100 * self_us / max(total_us, 1):>5.1f}%  {package}")
+    print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS, help="The modules to profile.")
+    parser.add_argument("--top", type=int, default=20, help="The number of imports and packages listed.")
+    parser.add_argument("--budget", type=float, help="The maximum import time, in seconds, of every module.")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        elapsed, imports = profile(module)
+        report(module, elapsed, imports, args.top)
+        if args.budget is not None and elapsed > args.budget:
+            over_budget.append(f"{module} ({elapsed:.2f}s)")
+
+    if over_budget:
+        print(f"Over the budget of {args.budget:.2f}s: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from chroma_aya import Chroma_AYA
+
+
+class StorePool():
+    """
+    A small pool of persistent Chroma clients and open vector stores, one per directory.
+
+    Opening a persistent client loads the HNSW segment from disk, so the stores are opened once
+    and shared by every load and save until they are explicitly closed or refreshed.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes an empty pool.
+        """
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._stores = {}
+
+    def client(self, path: str):
+        """
+        Returns the persistent client of a directory, creating it on first use.
+
+        Args:
+            path (str): The directory of the database.
+
+        Returns:
+            chromadb.Client: The shared client.
+        """
+        import chromadb
+        import chromadb.config
+
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._clients:
+                # Same settings as Chroma_AYA, so both share the same underlying Chroma system
+                settings = chromadb.config.Settings(is_persistent=True)
+                settings.persist_directory = path
+                self._clients[path] = chromadb.Client(settings)
+            return self._clients[path]
+
+    def open(self, path: str, embedding: Embeddings,
+             collection_name: str = Chroma_AYA._LANGCHAIN_DEFAULT_COLLECTION_NAME) -> Chroma_AYA:
+        """
+        Returns the open vector store of a directory, opening it on first use.
+
+        Args:
+            path (str): The directory of the database.
+            embedding (Embeddings): The embedding function of the store.
+            collection_name (str): The name of the collection.
+
+        Returns:
+            Chroma_AYA: The shared vector store.
+        """
+        path = os.path.abspath(path)
+        key = (path, collection_name, id(embedding))
+        with self._lock:
+            if key not in self._stores:
+                self._stores[key] = Chroma_AYA(
+                    collection_name=collection_name,
+                    embedding_function=embedding,
+                    persist_directory=path,
+                    client=self.client(path),
+                    content_ids=True,
+                )
+            return self._stores[key]
+
+    def is_open(self, path: str) -> bool:
+        """
+        Checks whether a client is open for the directory.
+        """
+        return os.path.abspath(path) in self._clients
+
+    def close(self, path: str) -> None:
+        """
+        Closes the stores and the client of a directory and releases the Chroma system behind them.
+
+        Args:
+            path (str): The directory of the database.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [key for key in self._stores if key[0] == path]:
+                del self._stores[key]
+            client = self._clients.pop(path, None)
+            if client is not None:
+                self._release(client)
+
+    def refresh(self, path: str) -> None:
+        """
+        Closes the directory so that the next open reloads it from disk,
+        e.g. after another process has written to it.
+
+        Args:
+            path (str): The directory of the database.
+        """
+        self.close(path)
+
+    def close_all(self) -> None:
+        """
+        Closes every directory of the pool.
+        """
+        with self._lock:
+            for path in list(self._clients):
+                self.close(path)
+
+    @staticmethod
+    def _release(client) -> None:
+        from chromadb.api.client import SharedSystemClient
+
+        # Chroma caches one system per directory for the whole process
+        system = SharedSystemClient._identifer_to_system.pop(client._identifier, None)
+        if system is not None:
+            system.stop()
+
+
+STORE_POOL = StorePool()
@@ -1,10 +1,69 @@
-from crewai import Task
+import os
+import time
 from agents import Agents
+from audit import AuditWriter
+from lazy import lazy_import
+
+Task = lazy_import("crewai", "Task")
+TaskOutput = lazy_import("crewai.tasks.task_output", "TaskOutput")
+
+OUTPUT_MODES = ("off", "sync", "async")
 
 class Tasks():
-    def __init__(self, path: str) -> None:
-        """Set the output path"""
+    def __init__(self, path: str, output_mode: str = "sync") -> None:
+        """
+        Set the output path and how the task outputs are persisted.
+
+        Args:
+            path (str): The directory of the output files.
+            output_mode (str): "sync" writes the output file of every task when it completes, "async" appends
+                the outputs to {path}/audit.jsonl from a background writer, in batches, and "off" keeps nothing.
+        """
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode '{output_mode}'. Choose among {list(OUTPUT_MODES)}.")
         self.path = path
+        self.output_mode = output_mode
+        self.audit_writer = AuditWriter(os.path.join(path, "audit.jsonl")) if output_mode == "async" else None
+
+    def _output(self, file_name: str) -> dict:
+        """
+        The Task arguments persisting the output of a task according to the output mode.
+
+        Args:
+            file_name (str): The name of the output file of the task.
+
+        Returns:
+            dict: The output_file or callback argument of the Task, empty when the outputs are not persisted.
+        """
+        if self.output_mode == "sync":
+            return {"output_file": os.path.join(self.path, file_name)}
+        if self.output_mode == "async":
+            return {"callback": lambda output: self._audit(file_name, output)}
+        return {}
+
+    def _audit(self, file_name: str, output: TaskOutput) -> None:
+        self.audit_writer.write({
+            "time": time.time(),
+            "task": os.path.splitext(file_name)[0],
+            "agent": output.agent,
+            "description": output.description,
+            "output": output.raw_output,
+        })
+
+    def save_output(self, task: Task, output: str, description: str = None) -> None:
+        """
+        Persists the output of a task which was not run by a crew, e.g. by the direct backend.
+
+        Args:
+            task (Task): The task, created by one of the methods of this class.
+            output (str): The output of the task.
+            description (str): The description the output was produced from. Defaults to the one of the task.
+        """
+        if task.output_file:
+            task._save_file(output)
+        elif task.callback:
+            task.callback(TaskOutput(description=description or task.description, raw_output=output,
+                                     exported_output=output, agent=task.agent.role if task.agent else ""))
 
     def task_personalInfo(self, data: str, agent: Agents):
         """
@@ -39,7 +98,7 @@ class Tasks():
             # Example:
             # {'Contact Information': {'Email': 'test@gmail.com'}, {'Phone Number': '123456789'}}
             # """,
-            output_file=self.path+"/extracted_info.txt",
+            **self._output("extracted_info.txt"),
             agent=agent,
             )
 
@@ -79,7 +138,7 @@ class Tasks():
             """,
 
             expected_output= """ A set of bullet points of categories where there is difference between old data and new data""",
-            output_file=f"{self.path}/difference_info.txt",
+            **self._output("difference_info.txt"),
             agent=agent,
         )
 
@@ -115,7 +174,7 @@ class Tasks():
                 [save something in memory, deduce memory from unstructured text, update memory, delete memory, off_topic] \
                 eg:
                 update memory """,
-            output_file=f"{self.path}/categorized_user_input.txt",
+            **self._output("categorized_user_input.txt"),
             agent=agent,
             )
     
@@ -151,7 +210,7 @@ class Tasks():
             expected_output='Update the category or detail that the user wants to update in the data.',
             # context= [self.task_personalInfo],
             # human_input = True,
-            output_file="{self.path}/update.txt",
+            **self._output("update.txt"),
             agent=agent
         )
     
@@ -183,7 +242,7 @@ class Tasks():
             expected_output='Extract the exact detail or category that the user wants to delete in the data.',
             # context= [self.task_personalInfo],
             # human_input = True,
-            output_file="{self.path}/extract_cat.txt",
+            **self._output("extract_cat.txt"),
             agent=agent
         )
 
@@ -220,6 +279,43 @@ class Tasks():
             expected_output='Remove the category or detail that the user wants to delete in the data.',
             # context= [self.task_personalInfo],
             # human_input = True,
-            output_file="{self.path}/rmv.txt",
+            **self._output("rmv.txt"),
+            agent=agent
+        )
+
+    def task_edit_memory(self, prompt: str, data: str, action: str, format_instructions: str, agent: Agents):
+        """
+        Identify the memory targeted by the user and rewrite it, in a single step.
+
+        Args:
+            prompt (str): The user prompt entered.
+            data (str): The numbered candidate memories most similar to the prompt.
+            action (str): Either 'update' or 'delete'.
+            format_instructions (str): The instructions describing the structured output.
+            agent (Agents): The agent responsible for performing the task.
+
+        Returns:
+            Task: A Task object configured to pick the targeted memory and return it rewritten.
+
+        Description:
+            This method creates a Task which fuses the category extraction with the update or deletion. The task 
+            picks, among the candidate memories, the one holding the detail or category the user wants to change, 
+            applies the change and outputs the number of that memory along with its entire rewritten content.
+        """
+        return Task(
+            description=f"""Your task is to {action} the category or specific detail the user asks for in the prompt below, \
+                in the one candidate memory that holds it.
+                In short perform the following steps:
+                1. Thoroughly analyze the prompt and figure out what category or detail the user wants to {action}.
+                2. Find the candidate memory which holds that category or detail. If none of them holds it, the target is -1.
+                3. Make the {action} on that specific part of the memory, keeping everything else exactly as it is.
+                4. Return the number of the memory and the entire memory after the change.
+
+                USER PROMPT:\n\n {prompt} \n\n
+                CANDIDATE MEMORIES:\n\n {data} \n\n
+                {format_instructions}
+                """,
+            expected_output='The number of the memory that was changed and the entire memory after the change.',
+            **self._output("edit.txt"),
             agent=agent
         )
@@ -0,0 +1,36 @@
+import os
+from langchain_core.embeddings import Embeddings
+
+VOCABULARY = ["name", "email", "phone", "city", "food", "john", "pizza", "boston"]
+
+class BagOfWordsEmbeddings(Embeddings):
+    """ A deterministic stand-in for the instructor model.
+    It lives in its own module, so the test modules and the spawned workers of the bulk embedder
+    import it without importing another test module.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def vector(self, text):
+        words = text.lower().replace("?", "").replace(".", "").split()
+        return [float(words.count(word)) for word in VOCABULARY] + [0.01]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.vector(text)
+
+class LoadCountingEmbeddings(BagOfWordsEmbeddings):
+    """ Appends the number of models loaded in the worker and its process ID to every vector.
+    """
+    loads = 0
+
+    def __init__(self):
+        super().__init__()
+        LoadCountingEmbeddings.loads += 1
+
+    def vector(self, text):
+        return super().vector(text) + [float(LoadCountingEmbeddings.loads), float(os.getpid())]
@@ -0,0 +1,86 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from ai_agents import AI_Agents
+
+@pytest.fixture
+def ai_agents():
+    ai_agents = AI_Agents(MagicMock(), "/tmp/", max_concurrency=4)
+    yield ai_agents
+    ai_agents.close()
+
+def slow(result, delay=0.2):
+    def run(*args):
+        time.sleep(delay)
+        return result
+    return run
+
+def test_async_methods_run_concurrently(ai_agents):
+    ai_agents.prompt_classifier = MagicMock(side_effect=slow("off_topic"))
+    ai_agents.category_extraction = MagicMock(side_effect=slow("email id"))
+    ai_agents.delete_memory = MagicMock(side_effect=slow(""))
+
+    async def serve():
+        return await asyncio.gather(
+            ai_agents.aprompt_classifier("Hello"),
+            ai_agents.acategory_extraction("Delete email id"),
+            ai_agents.adelete_memory("Delete email id", Document(page_content="Email ID - a@b.com")),
+        )
+
+    start = time.monotonic()
+    assert asyncio.run(serve()) == ["off_topic", "email id", ""]
+    assert time.monotonic() - start < 0.5
+
+def test_async_timeout(ai_agents):
+    ai_agents.memory_management = MagicMock(side_effect=slow("updated", delay=0.5))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(ai_agents.amemory_management("Update name", Document(page_content="Name"), timeout=0.05))
+
+def test_async_cancellation(ai_agents):
+    ai_agents.prompt_classifier = MagicMock(side_effect=slow("off_topic", delay=0.5))
+
+    async def cancel():
+        task = asyncio.create_task(ai_agents.aprompt_classifier("Hello"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancel())
+
+CANDIDATES = [Document(page_content="Name - John Doe", metadata={"id": "a"}),
+              Document(page_content="Email ID - a@b.com\nPhone - 555", metadata={"id": "b"})]
+
+def edit_agents(answer):
+    model = MagicMock()
+    model.invoke.return_value = AIMessage(content=answer)
+    return AI_Agents(model, "/tmp/"), model
+
+def test_edit_memory_is_one_call():
+    ai_agents, model = edit_agents('```json\n{"target": 1, "content": "Email ID - new@b.com\\nPhone - 555"}\n```')
+    document = ai_agents.edit_memory("Update my email to new@b.com", CANDIDATES, action="update")
+    assert document.page_content == "Email ID - new@b.com\nPhone - 555"
+    assert document.metadata == {"id": "b"}
+    assert CANDIDATES[1].page_content == "Email ID - a@b.com\nPhone - 555"
+    model.invoke.assert_called_once()
+    prompt = model.invoke.call_args[0][0][1].content
+    assert "[1] Email ID - a@b.com" in prompt and "update" in prompt
+
+def test_edit_memory_without_target():
+    ai_agents, _ = edit_agents('{"target": -1, "content": ""}')
+    assert ai_agents.edit_memory("Delete my passport number", CANDIDATES, action="delete") is None
+    assert ai_agents.edit_memory("Delete my passport number", [], action="delete") is None
+
+def test_edit_memory_falls_back_to_crew():
+    ai_agents, _ = edit_agents("The email was deleted.")
+    ai_agents.delete_memory = MagicMock(return_value="Name - John Doe")
+    document = ai_agents.edit_memory("Delete my name", CANDIDATES, action="delete")
+    assert document.page_content == "Name - John Doe" and document.metadata == {"id": "a"}
+    ai_agents.delete_memory.assert_called_once_with("Delete my name", CANDIDATES[0])
+
+def test_edit_memory_rejects_unknown_action(ai_agents):
+    with pytest.raises(ValueError):
+        ai_agents.edit_memory("Rename my email", CANDIDATES, action="rename")
@@ -0,0 +1,52 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from crewai.tasks.task_output import TaskOutput
+from langchain_core.messages import AIMessage
+from ai_agents import AI_Agents
+from audit import AuditWriter
+from tasks import Tasks
+
+def read_records(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+def test_audit_writer_appends_batches(tmp_path):
+    writer = AuditWriter(str(tmp_path / "logs" / "audit.jsonl"), batch_size=4, flush_interval=0.05)
+    for i in range(10):
+        writer.write({"i": i, "text": "Zoë"})
+    writer.flush()
+    assert read_records(tmp_path / "logs" / "audit.jsonl") == [{"i": i, "text": "Zoë"} for i in range(10)]
+
+    writer.write({"i": 10})
+    writer.close()
+    assert len(read_records(tmp_path / "logs" / "audit.jsonl")) == 11
+
+def test_output_modes(tmp_path):
+    assert Tasks(str(tmp_path), output_mode="sync").task_update_category("p", "d", None).output_file \
+        .endswith("update.txt")
+    assert "{self.path}" not in Tasks(str(tmp_path)).task_delete_category("p", "d", None).output_file
+
+    task = Tasks(str(tmp_path), output_mode="off").task_extract_category("p", None)
+    assert task.output_file is None and task.callback is None
+
+    tasks = Tasks(str(tmp_path), output_mode="async")
+    task = tasks.task_extract_category("Delete my email", None)
+    assert task.output_file is None
+    task.callback(TaskOutput(description=task.description, raw_output="email", agent="Detail Extractor"))
+    tasks.audit_writer.close()
+    [record] = read_records(tmp_path / "audit.jsonl")
+    assert record["task"] == "extract_cat" and record["output"] == "email"
+
+    with pytest.raises(ValueError):
+        Tasks(str(tmp_path), output_mode="later")
+
+def test_direct_tasks_are_audited(tmp_path):
+    model = MagicMock()
+    model.invoke.return_value = AIMessage(content="email id")
+    ai_agents = AI_Agents(model, str(tmp_path), direct_tasks=["extract_category"])
+    ai_agents.category_extraction("Delete my email id")
+    ai_agents.close()
+
+    [record] = read_records(tmp_path / "audit.jsonl")
+    assert record["output"] == "email id" and "Delete my email id" in record["description"]
@@ -0,0 +1,78 @@
+import os
+import uuid
+import pytest
+from langchain_core.documents import Document
+from bulk_embedding import BulkEmbedder
+from chroma_aya import Chroma_AYA
+from fake_embeddings import BagOfWordsEmbeddings, LoadCountingEmbeddings
+
+TEXTS = [f"Name is John {i}. Favourite food is pizza." if i % 2 else f"City is Boston, email {i}."
+         for i in range(23)]
+
+@pytest.fixture(scope="module")
+def embedder():
+    with BulkEmbedder(BagOfWordsEmbeddings, processes=2, batch_size=4) as embedder:
+        yield embedder
+
+@pytest.fixture
+def vectordb():
+    db = Chroma_AYA(collection_name=f"test_{uuid.uuid4().hex}", embedding_function=BagOfWordsEmbeddings(),
+                    content_ids=True)
+    yield db
+    db.delete_collection()
+
+def test_embeddings_come_back_in_order(embedder):
+    vectors = embedder.embed_documents(TEXTS)
+    assert len(vectors) == len(TEXTS)
+    for vector, expected in zip(vectors, BagOfWordsEmbeddings().embed_documents(TEXTS)):
+        assert vector == pytest.approx(expected)
+    assert [start for start, _ in embedder.iter_batches(TEXTS)] == list(range(0, len(TEXTS), 4))
+    assert embedder.embed_documents([]) == []
+
+def test_every_worker_loads_the_model_once():
+    with BulkEmbedder(LoadCountingEmbeddings, processes=2, batch_size=1, max_pending=4) as embedder:
+        vectors = embedder.embed_documents(TEXTS)
+
+    assert {vector[-2] for vector in vectors} == {1.0}
+    assert 1 <= len({vector[-1] for vector in vectors}) <= 2
+    assert os.getpid() not in {vector[-1] for vector in vectors}
+
+def test_bulk_add_texts_matches_add_texts(vectordb, embedder):
+    metadatas = [{"source": f"fact_{i}"} for i in range(len(TEXTS))]
+    ids = vectordb.bulk_add_texts(TEXTS, metadatas=metadatas, embedder=embedder)
+    stored = vectordb._collection.get(ids=ids, include=["embeddings", "metadatas", "documents"])
+
+    assert len(stored["ids"]) == len(TEXTS)
+    by_id = dict(zip(stored["ids"], zip(stored["documents"], stored["metadatas"], stored["embeddings"])))
+    for id_, text, metadata in zip(ids, TEXTS, metadatas):
+        assert by_id[id_][:2] == (text, metadata)
+        assert by_id[id_][2] == pytest.approx(BagOfWordsEmbeddings().vector(text))
+    # The content IDs are the ones add_texts would give, so nothing is stored twice
+    assert vectordb.add_texts(TEXTS, metadatas=metadatas) == ids
+    assert vectordb._collection.count() == len(TEXTS)
+
+def test_bulk_add_texts_skips_stored_texts(vectordb, embedder):
+    vectordb.add_texts(TEXTS[:10])
+    vectordb.bulk_add_texts(TEXTS, embedder=embedder)
+
+    assert vectordb._collection.count() == len(TEXTS)
+
+def test_bulk_add_texts_keeps_the_filtered_texts(vectordb, embedder):
+    batches = []
+
+    def keep(texts, embeddings):
+        batches.append(len(texts))
+        return [idx for idx, text in enumerate(texts) if text.startswith("City")]
+
+    vectordb.bulk_add_texts(TEXTS, embedder=embedder, keep=keep)
+    assert batches == [4, 4, 4, 4, 4, 3]
+    assert sorted(vectordb.get()["documents"]) == sorted(text for text in TEXTS if text.startswith("City"))
+
+def test_from_documents_with_bulk_embedder(embedder):
+    documents = [Document(page_content=text, metadata={"source": str(i)}) for i, text in enumerate(TEXTS)]
+    db = Chroma_AYA.from_documents(documents, BagOfWordsEmbeddings(), collection_name=f"test_{uuid.uuid4().hex}",
+                                   bulk_embedder=embedder)
+
+    assert db._collection.count() == len(TEXTS)
+    assert db.similarity_search("city boston", k=1)[0].page_content.startswith("City is Boston")
+    db.delete_collection()
@@ -0,0 +1,110 @@
+import uuid
+import pytest
+from langchain_core.documents import Document
+from chroma_aya import Chroma_AYA
+from fake_embeddings import BagOfWordsEmbeddings
+
+@pytest.fixture
+def embedding():
+    return BagOfWordsEmbeddings()
+
+@pytest.fixture
+def vectordb(embedding):
+    db = Chroma_AYA(collection_name=f"test_{uuid.uuid4().hex}", embedding_function=embedding)
+    db.add_texts([
+        "Name is John.",
+        "Email is john at mail.",
+        "Phone is 555.",
+        "City is Boston.",
+        "Favourite food is pizza.",
+    ])
+    yield db
+    db.delete_collection()
+
+def test_similarity_search_with_score_batch(vectordb, embedding):
+    embedding.calls = 0
+    queries = ["what is my email?", "which city?", "favourite food?"]
+    batch = vectordb.similarity_search_with_score_batch(queries, k=2)
+
+    assert embedding.calls == 1
+    assert len(batch) == 3
+    assert all(len(results) == 2 for results in batch)
+    for query, results in zip(queries, batch):
+        assert [doc.page_content for doc, _ in results] == \
+            [doc.page_content for doc, _ in vectordb.similarity_search_with_score(query, k=2)]
+
+def test_similarity_search_batch_returns_ids(vectordb):
+    batch = vectordb.similarity_search_batch(["email", "boston city"], k=1)
+    assert batch[0][0].page_content == "Email is john at mail."
+    assert batch[1][0].page_content == "City is Boston."
+    assert all("id" in results[0].metadata for results in batch)
+
+def test_similarity_search_batch_empty(vectordb):
+    assert vectordb.similarity_search_batch([]) == []
+
+def test_nearest_embeddings(vectordb, embedding):
+    nearest = vectordb.nearest_embeddings([embedding.vector("boston city"), embedding.vector("pizza")], k=1)
+    assert [neighbours.tolist() for neighbours in nearest] == \
+        [[pytest.approx(embedding.vector("City is Boston."))], [pytest.approx(embedding.vector("Favourite food is pizza."))]]
+
+def test_nearest_embeddings_of_empty_collection(content_db, embedding):
+    assert [len(neighbours) for neighbours in content_db.nearest_embeddings([embedding.vector("pizza")])] == [0]
+
+@pytest.fixture
+def content_db(embedding):
+    db = Chroma_AYA(collection_name=f"test_{uuid.uuid4().hex}", embedding_function=embedding, content_ids=True)
+    yield db
+    db.delete_collection()
+
+def test_content_ids_make_add_texts_idempotent(content_db, embedding):
+    ids = content_db.add_texts(["Name is John.", "City is Boston."])
+    embedding.calls = 0
+    again = content_db.add_texts(["Name  is John.", "City is Boston.", "Phone is 555."])
+
+    assert again[:2] == ids
+    assert len(content_db) == 3
+    # Only the new text was embedded
+    assert embedding.calls == 1
+
+def test_content_ids_skip_repeated_texts(content_db):
+    ids = content_db.add_texts(["Name is John.", "Name is John."], metadatas=[{"source": "a"}, {"source": "a"}])
+    assert ids[0] == ids[1]
+    assert len(content_db) == 1
+
+def test_content_ids_depend_on_metadata(content_db):
+    ids = content_db.add_texts(["Name is John.", "Name is John."], metadatas=[{"source": "a"}, {"source": "b"}])
+    assert ids[0] != ids[1]
+    assert len(content_db) == 2
+
+def test_content_ids_upsert_explicit_ids(content_db, embedding):
+    ids = content_db.add_texts(["Email is john at mail."])
+    embedding.calls = 0
+    assert content_db.add_texts(["Email is jane at mail."], ids=ids) == ids
+
+    assert embedding.calls == 1
+    assert content_db.get(ids=ids)["documents"] == ["Email is jane at mail."]
+    assert len(content_db) == 1
+
+def test_filter_stored_documents(content_db):
+    content_db.add_documents([Document(page_content="Name is John.", metadata={})])
+    docs = [Document(page_content="Name is John.", metadata={}), Document(page_content="City is Boston.", metadata={})]
+    assert [doc.page_content for doc in content_db.filter_stored_documents(docs)] == ["City is Boston."]
+
+def test_from_texts_with_content_ids(embedding):
+    name = f"test_{uuid.uuid4().hex}"
+    db = Chroma_AYA.from_texts(["Name is John.", "Name is John."], embedding=embedding,
+                               collection_name=name, content_ids=True)
+    assert len(db) == 1
+    db.delete_collection()
+
+def test_generation_is_bumped_by_writes(content_db):
+    assert content_db.generation == 0
+    ids = content_db.add_texts(["Name is John.", "City is Boston."])
+    assert content_db.generation == 1
+    # Nothing is written when every text is already stored
+    content_db.add_texts(["Name is John."])
+    assert content_db.generation == 1
+    content_db.update_document(ids[0], Document(page_content="Name is Jane.", metadata={"id": ids[0]}))
+    assert content_db.generation == 2
+    content_db.delete([ids[1]])
+    assert content_db.generation == 3
@@ -0,0 +1,45 @@
+import pytest
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from ai_agents import AI_Agents
+
+def stub_model(answer):
+    return FakeListChatModel(responses=[f"Thought: I now can give a great answer\nFinal Answer: {answer}"])
+
+def test_crews_are_reused():
+    ai_agents = AI_Agents(stub_model("off_topic"), "/tmp/")
+    assert ai_agents.prompt_classifier("Hello") == "off_topic"
+    assert ai_agents.prompt_classifier("How are you?") == "off_topic"
+    assert ai_agents.crews.built == 1
+
+def test_inputs_are_bound_per_request():
+    ai_agents = AI_Agents(stub_model("Email ID - new@b.com"), "/tmp/")
+    ai_agents.memory_management("Update my email to new@b.com", Document(page_content="Email ID - a@b.com"))
+    ai_agents.memory_management("Update my name to Jane", Document(page_content="Name - John"))
+
+    task = ai_agents.crews._idle["update_memory"][0].tasks[0]
+    assert "Update my name to Jane" in task.description and "Name - John" in task.description
+    assert "a@b.com" not in task.description
+
+def test_inputs_with_braces():
+    ai_agents = AI_Agents(stub_model("- Likes: {json}"), "/tmp/")
+    assert ai_agents.extract_personal_info('I like {"json": 1} and {x}') == "- Likes: {json}"
+    assert '{"json": 1}' in ai_agents.crews._idle["extract_personal_info"][0].tasks[0].description
+
+def test_direct_tasks_make_one_call():
+    model = MagicMock()
+    model.invoke.return_value = AIMessage(content=" email id \n")
+    ai_agents = AI_Agents(model, "/tmp/", direct_tasks=["extract_category"])
+
+    assert ai_agents.category_extraction("Delete my email id") == "email id"
+    model.invoke.assert_called_once()
+    system, prompt = model.invoke.call_args[0][0]
+    assert "Detail Extractor" in system.content
+    assert "Delete my email id" in prompt.content and "{prompt}" not in prompt.content
+    assert ai_agents.crews.built == 0
+
+def test_unknown_direct_task():
+    with pytest.raises(ValueError):
+        AI_Agents(MagicMock(), "/tmp/", direct_tasks=["summarize"])
@@ -0,0 +1,89 @@
+import json
+import os
+import pytest
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+torch = pytest.importorskip("torch")
+
+from embedding_backends import OnnxInstructorEmbeddings, export_onnx, load_embedding, parity
+
+TEXTS = ["my name is jane doe", "my email is jane doe", "my phone is what", "pizza is my food",
+         "the document is my email"]
+QUERIES = ["what is my email", "what is my food"]
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """ A randomly initialized instructor model with the architecture of hkunlp/instructor-base,
+    small enough to be built offline.
+    """
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast, T5Config, T5EncoderModel
+    from sentence_transformers.models import Dense
+    from InstructorEmbedding.instructor import INSTRUCTOR_Pooling
+
+    path = str(tmp_path_factory.mktemp("instructor"))
+    words = ("represent the document for retrieval question retrieving supporting documents "
+             "my name is jane doe email phone food pizza what").split()
+    vocab = {"<pad>": 0, "</s>": 1, "<unk>": 2, **{word: i + 3 for i, word in enumerate(words)}}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(single="$A </s>", special_tokens=[("</s>", 1)])
+    PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="</s>", unk_token="<unk>",
+                            model_input_names=["input_ids", "attention_mask"]).save_pretrained(path)
+    torch.manual_seed(0)
+    T5EncoderModel(T5Config(vocab_size=len(vocab), d_model=16, d_kv=8, d_ff=32, num_layers=1,
+                            num_heads=2)).save_pretrained(path)
+
+    with open(os.path.join(path, "sentence_bert_config.json"), "w") as file:
+        json.dump({"max_seq_length": 512, "do_lower_case": False}, file)
+    with open(os.path.join(path, "modules.json"), "w") as file:
+        json.dump([{"idx": 0, "name": "0", "path": "", "type": "sentence_transformers.models.Transformer"},
+                   {"idx": 1, "name": "1", "path": "1_Pooling", "type": "sentence_transformers.models.Pooling"},
+                   {"idx": 2, "name": "2", "path": "2_Dense", "type": "sentence_transformers.models.Dense"},
+                   {"idx": 3, "name": "3", "path": "3_Normalize",
+                    "type": "sentence_transformers.models.Normalize"}], file)
+    for module in ("1_Pooling", "2_Dense", "3_Normalize"):
+        os.makedirs(os.path.join(path, module))
+    INSTRUCTOR_Pooling(16).save(os.path.join(path, "1_Pooling"))
+    Dense(16, 8, activation_function=torch.nn.Identity()).save(os.path.join(path, "2_Dense"))
+    return path
+
+@pytest.fixture(scope="module")
+def reference(tiny_model):
+    return load_embedding("torch", model_name=tiny_model)
+
+@pytest.fixture(scope="module")
+def onnx_dir(tiny_model, reference, tmp_path_factory):
+    return export_onnx(tiny_model, str(tmp_path_factory.mktemp("onnx")), client=reference.client)
+
+def test_onnx_matches_reference(reference, onnx_dir):
+    onnx = OnnxInstructorEmbeddings(onnx_dir, num_threads=1, batch_size=2)
+    result = parity(reference, onnx, TEXTS, QUERIES, k=2)
+
+    assert result["min_cosine"] > 0.9999
+    assert result["top2_overlap"] == 1.0
+    assert onnx.embed_query(QUERIES[0]) == pytest.approx(reference.embed_query(QUERIES[0]), abs=1e-4)
+
+def test_int8_backends_stay_close(reference, tiny_model, onnx_dir):
+    for backend in ("onnx-int8", "torch-int8"):
+        candidate = load_embedding(backend, model_name=tiny_model, num_threads=1, onnx_dir=onnx_dir)
+        assert parity(reference, candidate, TEXTS)["min_cosine"] > 0.99
+
+def test_backends_have_their_own_model_name(reference, tiny_model, onnx_dir):
+    names = {backend: load_embedding(backend, model_name=tiny_model, onnx_dir=onnx_dir).model_name
+             for backend in ("onnx", "onnx-int8")}
+
+    assert reference.model_name == tiny_model
+    assert names == {"onnx": f"{tiny_model}+onnx", "onnx-int8": f"{tiny_model}+onnx-int8"}
+
+def test_missing_onnx_model_is_exported(tiny_model, tmp_path):
+    embedding = load_embedding("onnx", model_name=tiny_model, onnx_dir=str(tmp_path))
+
+    assert os.path.exists(tmp_path / "model.onnx")
+    assert len(embedding.embed_documents(TEXTS)) == len(TEXTS)
+    assert embedding.embed_documents([]) == []
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        load_embedding("tensorrt")
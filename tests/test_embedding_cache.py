@@ -0,0 +1,97 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from embedding_cache import CachedEmbeddings, DiskEmbeddingStore
+
+class CountingEmbeddings(Embeddings):
+    """ A fake instructor model which counts the texts it embeds.
+    """
+    model_name = "fake-instructor"
+    embed_instruction = "Represent the document for retrieval: "
+    query_instruction = "Represent the question for retrieving supporting documents: "
+
+    def __init__(self):
+        self.calls = 0
+
+    def vector(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.vector(text)
+
+@pytest.fixture
+def model():
+    return CountingEmbeddings()
+
+def test_repeated_texts_are_embedded_once(model):
+    cache = CachedEmbeddings(model)
+    first = cache.embed_documents(["name is John", "email is j@d.com", "name is John"])
+    second = cache.embed_documents(["email is j@d.com"])
+
+    assert model.calls == 2
+    assert first[0] == first[2]
+    assert second[0] == first[1]
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["hits"] == 1
+
+def test_instruction_is_part_of_the_key(model):
+    cache = CachedEmbeddings(model)
+    cache.embed_documents(["what is my email"])
+    cache.embed_query("what is my email")
+    assert model.calls == 2
+    assert cache.key(model.embed_instruction, "a") != cache.key(model.query_instruction, "a")
+
+def test_lru_evicts_oldest_entries(model):
+    cache = CachedEmbeddings(model, max_memory_entries=2)
+    cache.embed_documents(["a", "b", "c"])
+    cache.embed_documents(["a"])
+    assert model.calls == 4
+
+def test_disk_tier_survives_restart(model, tmp_path):
+    cache = CachedEmbeddings(model, cache_dir=str(tmp_path))
+    vectors = cache.embed_documents(["name is John", "email is j@d.com"])
+
+    restarted = CachedEmbeddings(model, cache_dir=str(tmp_path))
+    assert restarted.embed_documents(["email is j@d.com", "name is John"]) == [vectors[1], vectors[0]]
+    assert model.calls == 2
+    assert restarted.stats()["disk_hits"] == 2
+
+def test_disk_store_ignores_incomplete_rows(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), "test")
+    store.put(["k1", "k2"], [[1.0, 2.0], [3.0, 4.0]])
+    # Simulate a crash after the key was written but before its vector
+    with open(store.keys_path, "a") as keys_file:
+        keys_file.write("k3\n")
+
+    reopened = DiskEmbeddingStore(str(tmp_path), "test")
+    assert len(reopened) == 2
+    assert reopened.get("k2") == [3.0, 4.0]
+    assert reopened.get("k3") is None
+
+    reopened.put(["k4"], [[5.0, 6.0]])
+    assert DiskEmbeddingStore(str(tmp_path), "test").get("k4") == [5.0, 6.0]
+
+def test_disk_stores_share_a_directory(tmp_path):
+    first = DiskEmbeddingStore(str(tmp_path), "test")
+    second = DiskEmbeddingStore(str(tmp_path), "test")
+    first.put(["k1"], [[1.0, 0.0]])
+    second.put(["k2", "k1"], [[0.0, 1.0], [9.0, 9.0]])
+
+    # The rows of the second store are numbered after the ones appended by the first
+    assert second.get("k2") == [0.0, 1.0]
+    assert second.get("k1") == [1.0, 0.0]
+    first.put(["k3"], [[2.0, 2.0]])
+    assert first.get("k2") == [0.0, 1.0]
+    assert len(DiskEmbeddingStore(str(tmp_path), "test")) == 3
+
+def test_embed_queries_batches_misses(model):
+    cache = CachedEmbeddings(model)
+    single = cache.embed_query("what is my email")
+    batch = cache.embed_queries(["what is my email", "where do I live", "where do I live"])
+    assert batch[0] == single
+    assert batch[1] == batch[2]
+    assert model.calls == 2
@@ -0,0 +1,90 @@
+import io
+import pytest
+from unittest.mock import MagicMock
+from ingestion import iter_decoded, iter_segments, iter_token_windows, iter_file_windows, prefetch
+from tokens import count_tokens, split_by_tokens
+from ai_agents import AI_Agents, merge_extractions
+
+def test_iter_decoded_keeps_split_characters():
+    data = "Name: Zoë – Café ☕\n" * 50
+    pieces = list(iter_decoded(io.BytesIO(data.encode("utf-8")), chunk_size=7))
+    assert "".join(pieces) == data
+    assert "�" not in "".join(pieces)
+
+def test_iter_segments_bounds_long_lines():
+    segments = list(iter_segments(["a" * 25, "b\nc"], max_chars=10))
+    assert "".join(segments) == "a" * 25 + "b\nc"
+    assert all(len(segment) <= 10 for segment in segments)
+
+def test_iter_token_windows_respects_budget():
+    lines = [f"Line {i}: my favourite number is {i}.\n" for i in range(500)]
+    windows = list(iter_token_windows(iter(lines), max_tokens=50))
+    assert "".join(windows) == "".join(lines)
+    assert len(windows) > 1
+    assert all(count_tokens(window) <= 50 for window in windows)
+
+def test_split_by_tokens_keeps_characters_whole():
+    text = "Name: Zoë 🎉🎉 – 東京 café ☕ 😀\n" * 20
+    for max_tokens in (1, 2, 3, 7):
+        pieces = split_by_tokens(text, max_tokens)
+        assert "".join(pieces) == text
+        assert not any("\ufffd" in piece for piece in pieces)
+
+def test_iter_file_windows_streams_file():
+    data = ("My email is john@doe.com and I like pizza.\n" * 2000).encode("utf-8")
+    windows = list(iter_file_windows(io.BytesIO(data), max_tokens=200, chunk_size=1024))
+    assert "".join(windows).encode("utf-8") == data
+
+def test_prefetch_propagates_errors():
+    def items():
+        yield 1
+        raise RuntimeError("read failed")
+
+    results = prefetch(items())
+    assert next(results) == 1
+    with pytest.raises(RuntimeError):
+        next(results)
+
+def test_iter_extract_from_uploaded_file():
+    file = io.BytesIO(("Name is John Doe.\n" * 300).encode("utf-8"))
+    file.name = "notes.txt"
+    ai_agents = AI_Agents(MagicMock(), "/tmp/")
+    ai_agents.extract_personal_info = MagicMock(side_effect=lambda window: "- Name: John Doe")
+
+    results = list(ai_agents.iter_extract_from_uploaded_file(file, max_tokens=100))
+    assert len(results) > 1
+    assert ai_agents.extract_personal_info.call_count == len(results)
+
+def test_iter_extract_acquires_shared_rate_limiter():
+    file = io.BytesIO(("Name is John Doe.\n" * 300).encode("utf-8"))
+    file.name = "notes.txt"
+    ai_agents = AI_Agents(MagicMock(), "/tmp/")
+    ai_agents.extract_personal_info = MagicMock(side_effect=lambda window: "- Name: John Doe")
+    limiter = MagicMock()
+
+    results = list(ai_agents.iter_extract_from_uploaded_file(file, max_tokens=100, rate_limiter=limiter))
+    assert limiter.acquire.call_count == len(results)
+
+def test_iter_extract_rejects_other_files():
+    file = io.BytesIO(b"%PDF")
+    file.name = "notes.pdf"
+    with pytest.raises(ValueError):
+        list(AI_Agents(MagicMock(), "/tmp/").iter_extract_from_uploaded_file(file))
+
+def test_extract_from_uploaded_file_map_reduce():
+    file = io.BytesIO(("Name is John Doe.\n" * 3000).encode("utf-8"))
+    file.name = "notes.txt"
+    ai_agents = AI_Agents(MagicMock(), "/tmp/")
+    ai_agents.extract_personal_info = MagicMock(
+        side_effect=lambda window: "**Contact Information:**\n- Name: John Doe\n* name:  john doe")
+
+    merged = ai_agents.extract_from_uploaded_file(file, max_workers=4)
+    assert merged == "Contact Information:\n- Name: John Doe"
+    assert ai_agents.extract_personal_info.call_count > 1
+
+def test_merge_extractions():
+    outputs = ["Contact:\n- Email: a@b.com\n\nFood:\n- Likes pizza",
+               "**Contact**\n1. Email: A@b.com\n2. Phone: 555",
+               "Name: John Doe"]
+    assert merge_extractions(outputs) == \
+        "- Name: John Doe\nContact:\n- Email: a@b.com\n- Phone: 555\nFood:\n- Likes pizza"
@@ -0,0 +1,59 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from langchain_core.embeddings import Embeddings
+from intent_classifier import IntentClassifier
+from ai_agents import AI_Agents
+
+VOCABULARY = ["save", "store", "what", "where", "update", "change", "delete", "remove", "hello", "joke"]
+
+class BagOfWordsEmbeddings(Embeddings):
+    """ A deterministic stand-in for the instructor model.
+    """
+    def vector(self, text):
+        words = text.lower().replace("?", "").split()
+        return [float(words.count(word)) for word in VOCABULARY] + [0.01]
+
+    def embed_documents(self, texts):
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.vector(text)
+
+SEEDS = {
+    "save something in memory": ["save this file", "store my data"],
+    "deduce memory from unstructured text": ["what is my email", "where do i live"],
+    "update memory": ["update my email", "change my phone"],
+    "delete memory": ["delete my email", "remove my phone"],
+    "off_topic": ["hello there", "tell me a joke"],
+}
+
+@pytest.fixture
+def classifier():
+    return IntentClassifier(BagOfWordsEmbeddings()).fit(SEEDS)
+
+def test_predict_nearest_centroid(classifier):
+    assert classifier.predict("please delete the email")[0] == "delete memory"
+    assert classifier.predict("change my address")[0] == "update memory"
+    assert classifier.predict("what is my name?")[0] == "deduce memory from unstructured text"
+
+def test_confidence_is_a_probability(classifier):
+    _, confident = classifier.predict("delete")
+    _, unsure = classifier.predict("nothing in the vocabulary")
+    assert 0.0 <= unsure < confident <= 1.0
+
+def test_bundled_seeds_cover_all_categories():
+    classifier = IntentClassifier(BagOfWordsEmbeddings()).fit()
+    assert set(classifier.labels) == set(SEEDS)
+
+@patch('crew_templates.Crew')
+def test_prompt_classifier_skips_crew_when_confident(mock_crew, classifier):
+    ai_agents = AI_Agents(MagicMock(), "/tmp/", intent_classifier=classifier, classifier_threshold=0.5)
+    assert ai_agents.prompt_classifier("delete my email") == "delete memory"
+    mock_crew.assert_not_called()
+
+@patch('crew_templates.Crew')
+def test_prompt_classifier_falls_back_to_crew(mock_crew, classifier):
+    mock_crew.return_value.kickoff.return_value = {'final_output': "off_topic"}
+    ai_agents = AI_Agents(MagicMock(), "/tmp/", intent_classifier=classifier, classifier_threshold=1.1)
+    assert ai_agents.prompt_classifier("delete my email") == "off_topic"
+    mock_crew.assert_called_once()
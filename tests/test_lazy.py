@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from lazy import lazy_import
+from tracing import Tracer
+
+
+@pytest.fixture
+def lazy_module(tmp_path, monkeypatch):
+    (tmp_path / "aya_lazy_sample.py").write_text("LOADED = True\n\ndef double(x):\n    return 2 * x\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "aya_lazy_sample"
+    sys.modules.pop("aya_lazy_sample", None)
+
+
+def test_import_is_deferred_to_first_use(lazy_module):
+    module = lazy_import(lazy_module)
+    double = lazy_import(lazy_module, "double")
+
+    assert lazy_module not in sys.modules
+    assert not double.loaded
+    assert "not imported" in repr(double)
+
+    assert double(21) == 42
+    assert lazy_module in sys.modules
+    assert module.LOADED is True
+    assert double.load() is sys.modules[lazy_module].double
+
+
+def test_import_is_traced(lazy_module, monkeypatch):
+    tracer = Tracer()
+    monkeypatch.setattr("lazy.span", tracer.span)
+
+    lazy_import(lazy_module, "double").load()
+    assert tracer.stats.summary()["import." + lazy_module]["count"] == 1
+
+
+def test_missing_attribute(lazy_module):
+    with pytest.raises(AttributeError):
+        lazy_import(lazy_module).missing
+
+
+@pytest.mark.parametrize("entry_point", ["non_gui", "gui"])
+def test_entry_points_defer_heavy_dependencies(entry_point):
+    heavy = ["crewai", "sentence_transformers", "InstructorEmbedding", "langchain_groq", "langchain.memory",
+             "langchain.tools", "chromadb"]
+    if entry_point == "non_gui":
+        heavy.append("streamlit")
+    code = f"import sys, {entry_point}; print([m for m in {heavy!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,97 @@
+import json
+
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+from mock_llm_server import MockLLMServer, task_type
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer(port=0, script={"classify_prompt": ["update memory", "delete memory"]}) as server:
+        yield server
+
+
+def completion(server, content, **body):
+    return httpx.post(server.url + "/openai/v1/chat/completions",
+                      json={"model": "llama3-70b-8192", "messages": [{"role": "user", "content": content}], **body})
+
+
+def test_task_type():
+    assert task_type([{"role": "user", "content": "USER INPUT:\n\n Update my email"}]) == "classify_prompt"
+    assert task_type([{"role": "user", "content": "CANDIDATE MEMORIES:\n\n [0] Name - Jane"}]) == "edit_memory"
+    assert task_type([{"role": "user", "content": "Hello"}]) == "generic"
+
+
+def test_scripted_completion(server):
+    first = completion(server, "USER INPUT:\n\n Update my email")
+    second = completion(server, "USER INPUT:\n\n Delete my email")
+
+    assert first.status_code == 200
+    assert first.json()["choices"][0]["message"]["content"] == "update memory"
+    assert second.json()["choices"][0]["message"]["content"] == "delete memory"
+    assert first.json()["usage"]["completion_tokens"] == 2
+    assert server.tasks == {"classify_prompt": 2}
+
+
+def test_crew_prompts_get_a_final_answer(server):
+    response = completion(server, "Hello\nUse the format: Final Answer: the answer")
+    content = response.json()["choices"][0]["message"]["content"]
+    assert content.startswith("Thought: I now can give a great answer\nFinal Answer: Hello!")
+
+
+def test_streamed_completion(server):
+    with httpx.stream("POST", server.url + "/v1/chat/completions",
+                      json={"model": "gpt-4-0613", "stream": True,
+                            "messages": [{"role": "user", "content": "Hello"}]}) as response:
+        events = [line[len("data: "):] for line in response.iter_lines() if line.startswith("data: ")]
+
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    text = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks)
+    assert text.startswith("Hello! I am a local mock")
+    assert len(chunks) > 3
+
+
+def test_rate_limit():
+    with MockLLMServer(port=0, requests_per_minute=1, retry_after=2) as server:
+        assert completion(server, "Hello").status_code == 200
+        limited = completion(server, "Hello")
+
+    assert limited.status_code == 429
+    assert limited.headers["Retry-After"] == "2"
+    assert limited.json()["error"]["type"] == "rate_limit_exceeded"
+    assert (server.requests, server.rate_limited) == (2, 1)
+
+
+def test_random_rate_limit():
+    with MockLLMServer(port=0, rate_limit=1.0) as server:
+        assert completion(server, "Hello").status_code == 429
+
+
+def test_unknown_path(server):
+    assert httpx.post(server.url + "/v1/completions", json={}).status_code == 404
+
+
+def test_chat_model_against_the_server(server):
+    model = ChatOpenAI(api_key="test", base_url=server.url + "/v1", max_retries=0,
+                       http_client=httpx.Client(), http_async_client=httpx.AsyncClient())
+
+    assert model.invoke([HumanMessage(content="USER INPUT:\n\n Update it")]).content == "update memory"
+    chunks = [chunk.content for chunk in model.stream([HumanMessage(content="Hello")])]
+    assert "".join(chunks).startswith("Hello! I am a local mock")
+
+
+def test_groq_client_rate_limited():
+    import groq
+    from langchain_groq import ChatGroq
+
+    with MockLLMServer(port=0, requests_per_minute=1) as server:
+        model = ChatGroq(api_key="test", base_url=server.url, max_retries=0,
+                         http_client=httpx.Client(), http_async_client=httpx.AsyncClient())
+        assert model.invoke("Hello").content.startswith("Hello!")
+        with pytest.raises(groq.RateLimitError):
+            model.invoke("Hello")
@@ -0,0 +1,41 @@
+import time
+import threading
+from parallel import RateLimiter, bounded_map
+
+def test_bounded_map_keeps_order():
+    def slow_square(x):
+        time.sleep(0.01 * (5 - x % 5))
+        return x * x
+    assert list(bounded_map(slow_square, range(20), max_workers=4)) == [x * x for x in range(20)]
+
+def test_bounded_map_runs_concurrently():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+    def work(x):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return x
+    list(bounded_map(work, range(8), max_workers=4))
+    assert 1 < peak[0] <= 4
+
+def test_bounded_map_consumes_items_lazily():
+    consumed = []
+    def items():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+    results = bounded_map(lambda x: x, items(), max_workers=2)
+    next(results)
+    assert len(consumed) <= 5
+    results.close()
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(requests_per_minute=1200)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start >= 4 * 0.05 * 0.9
@@ -0,0 +1,35 @@
+from unittest.mock import MagicMock
+from langchain_core.messages import AIMessage
+from ai_agents import AI_Agents
+from prompt_budget import PromptBudget, compact
+from tasks import Tasks
+from tokens import count_tokens
+
+def test_compact_keeps_placeholders():
+    description = Tasks("/tmp").task_classifyPrompt("{data}", None).description
+    compacted = compact(description)
+    assert "{data}" in compacted
+    assert "  " not in compacted and "\n\n\n" not in compacted
+    assert count_tokens(compacted) < count_tokens(description)
+
+def test_fit_truncates_inputs_over_budget():
+    budget = PromptBudget({"update_memory": {"data": 50}})
+    data = "".join(f"Line {i}: my favourite number is {i}.\n" for i in range(100))
+    fitted = budget.fit("update_memory", {"prompt": "Update my number", "data": data})
+    assert fitted["prompt"] == "Update my number"
+    assert count_tokens(fitted["data"]) <= 50
+    assert data.startswith(fitted["data"]) and fitted["data"].endswith(".")
+
+def test_prompt_stats():
+    model = MagicMock()
+    model.invoke.return_value = AIMessage(content="email id")
+    ai_agents = AI_Agents(model, "/tmp/", direct_tasks=["extract_category"],
+                          prompt_budget=PromptBudget({"extract_category": {"prompt": 20}}))
+    ai_agents.category_extraction("Delete my email id")
+    ai_agents.category_extraction("Delete " * 500)
+
+    stats = ai_agents.prompt_stats()["extract_category"]
+    assert stats["calls"] == 2
+    assert stats["max"] == stats["last"] < stats["mean"] + 20
+    sent = model.invoke.call_args[0][0]
+    assert count_tokens(sent[0].content) + count_tokens(sent[1].content) == stats["last"]
@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from resources import ResourceRegistry
+
+@pytest.fixture
+def registry():
+    return ResourceRegistry(db_path="/tmp/db", output_path="/tmp/")
+
+@patch('resources.IntentClassifier')
+@patch('resources.AI_Agents')
+@patch('resources.Utils')
+def test_resources_are_loaded_once(mock_utils, mock_ai_agents, mock_classifier, registry):
+    mock_utils.return_value = MagicMock()
+
+    assert registry.utils() is registry.utils()
+    assert registry.is_ready()
+    mock_utils.assert_called_once()
+
+    model = registry.model("test_api_key")
+    assert registry.model("test_api_key") is model
+    mock_utils.return_value.load_model.assert_called_once_with("test_api_key")
+
+    agents = registry.agents("test_api_key")
+    assert registry.agents("test_api_key") is agents
+    mock_ai_agents.assert_called_once_with(model, "/tmp/",
+        intent_classifier=mock_classifier.return_value.fit.return_value, classifier_threshold=0.6,
+        direct_tasks=("classify_prompt", "extract_category"))
+
+@patch('resources.Utils')
+def test_vectordb_is_cached_until_refresh(mock_utils, registry):
+    mock_db = MagicMock()
+    mock_utils.return_value.load_db.return_value = mock_db
+
+    assert registry.vectordb() is mock_db
+    assert registry.vectordb() is mock_db
+    mock_utils.return_value.load_db.assert_called_once_with("/tmp/db")
+
+    registry.refresh_vectordb()
+    registry.vectordb()
+    assert mock_utils.return_value.load_db.call_count == 2
+
+@patch('resources.Utils')
+def test_missing_vectordb_is_not_cached(mock_utils, registry):
+    mock_utils.return_value.load_db.return_value = "Nothing in Memory"
+
+    assert registry.vectordb() == "Nothing in Memory"
+    registry.vectordb()
+    assert mock_utils.return_value.load_db.call_count == 2
+
+@patch('resources.Utils')
+def test_failed_warm_up_can_be_retried(mock_utils, registry):
+    mock_utils.side_effect = [RuntimeError("download failed"), MagicMock()]
+
+    with pytest.raises(RuntimeError):
+        registry.utils()
+    assert not registry.is_ready()
+    assert registry.utils() is not None
+
+def test_rate_limiter_is_shared(registry):
+    limiter = registry.rate_limiter()
+    assert registry.rate_limiter() is limiter
+    assert limiter.interval == 2.0
+
+@patch('resources.SemanticAnswerCache')
+@patch('resources.Utils')
+def test_reopened_vectordb_clears_answer_cache(mock_utils, mock_cache, registry):
+    cache = registry.answer_cache()
+    registry.vectordb()
+    registry.vectordb()
+    assert cache.clear.call_count == 1
+
+    registry.refresh_vectordb()
+    registry.vectordb()
+    assert cache.clear.call_count == 2
@@ -0,0 +1,31 @@
+from langchain_core.documents import Document
+from semantic_cache import SemanticAnswerCache
+from fake_embeddings import BagOfWordsEmbeddings
+
+SOURCES = [Document(page_content="Email is john at mail.", metadata={"id": "a"})]
+
+def test_similar_question_hits():
+    cache = SemanticAnswerCache(BagOfWordsEmbeddings(), threshold=0.95)
+    assert cache.lookup("What is my email?", generation=1) is None
+    cache.store("What is my email?", "john at mail", generation=1, sources=SOURCES)
+
+    assert cache.lookup("what is the email", generation=1) == ("john at mail", SOURCES)
+    assert cache.lookup("What is my phone?", generation=1) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_writes_invalidate_answers():
+    cache = SemanticAnswerCache(BagOfWordsEmbeddings())
+    cache.store("What is my email?", "john at mail", generation=1)
+    assert cache.lookup("What is my email?", generation=2) is None
+    # Stale answers are dropped, not only skipped
+    assert cache.lookup("What is my email?", generation=1) is None
+
+def test_least_recently_used_answers_are_evicted():
+    cache = SemanticAnswerCache(BagOfWordsEmbeddings(), max_entries=2)
+    cache.store("What is my email?", "john at mail", generation=0)
+    cache.store("What is my phone?", "555", generation=0)
+    assert cache.lookup("What is my email?", generation=0) is not None
+    cache.store("Where is my city?", "Boston", generation=0)
+
+    assert cache.lookup("What is my phone?", generation=0) is None
+    assert cache.lookup("What is my email?", generation=0) is not None
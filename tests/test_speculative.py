@@ -0,0 +1,51 @@
+import threading
+from unittest.mock import patch, MagicMock
+from langchain_core.documents import Document
+from speculative import SpeculativeRetrieval, classify_with_prefetch
+
+DOCS = [Document(page_content=f"Memory {i}", metadata={"id": str(i)}) for i in range(4)]
+
+def test_search_overlaps_with_classification():
+    searched = threading.Event()
+    vectordb = MagicMock()
+    vectordb.similarity_search.side_effect = lambda prompt, k: searched.set() or DOCS[:k]
+
+    def classify(prompt):
+        # The search runs while the classifier is still busy
+        assert searched.wait(1)
+        return "update memory"
+
+    ai_agents = MagicMock()
+    ai_agents.prompt_classifier.side_effect = classify
+
+    prompt_result, prefetched = classify_with_prefetch(ai_agents, vectordb, "update my email")
+    assert prompt_result == "update memory"
+    assert prefetched.docs() == DOCS
+    assert prefetched.docs(k=1) == DOCS[:1]
+    vectordb.similarity_search.assert_called_once_with("update my email", 4)
+
+def test_prefetched_retriever():
+    vectordb = MagicMock()
+    vectordb.similarity_search.return_value = DOCS
+    retriever = SpeculativeRetrieval(vectordb, "what is my email").retriever(k=3)
+    assert retriever.get_relevant_documents("what is my email") == DOCS[:3]
+
+@patch.object(SpeculativeRetrieval, "discard")
+def test_off_topic_discards_search(mock_discard):
+    vectordb = MagicMock()
+    vectordb.similarity_search.return_value = DOCS
+    ai_agents = MagicMock()
+
+    ai_agents.prompt_classifier.return_value = "off_topic"
+    classify_with_prefetch(ai_agents, vectordb, "Hello")
+    mock_discard.assert_called_once()
+
+    ai_agents.prompt_classifier.return_value = "deduce memory from unstructured text"
+    classify_with_prefetch(ai_agents, vectordb, "what is my email")
+    mock_discard.assert_called_once()
+
+def test_nothing_in_memory():
+    ai_agents = MagicMock()
+    ai_agents.prompt_classifier.return_value = "deduce memory from unstructured text"
+    _, prefetched = classify_with_prefetch(ai_agents, "Nothing in Memory", "what is my email")
+    assert prefetched.docs() == []
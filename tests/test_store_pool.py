@@ -0,0 +1,58 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from store_pool import StorePool
+
+class ConstantEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0, float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return [1.0, float(len(text))]
+
+@pytest.fixture
+def pool():
+    pool = StorePool()
+    yield pool
+    pool.close_all()
+
+def test_store_is_opened_once(pool, tmp_path):
+    embedding = ConstantEmbeddings()
+    store = pool.open(str(tmp_path), embedding)
+    assert pool.open(str(tmp_path), embedding) is store
+    assert pool.client(str(tmp_path)) is store._client
+
+def test_refresh_reopens_from_disk(pool, tmp_path):
+    embedding = ConstantEmbeddings()
+    store = pool.open(str(tmp_path), embedding)
+    store.add_texts(["Name is John."])
+
+    pool.refresh(str(tmp_path))
+    assert not pool.is_open(str(tmp_path))
+
+    reopened = pool.open(str(tmp_path), embedding)
+    assert reopened is not store
+    assert len(reopened) == 1
+
+def test_close_is_per_directory(pool, tmp_path):
+    embedding = ConstantEmbeddings()
+    first = str(tmp_path / "first")
+    second = str(tmp_path / "second")
+    pool.open(first, embedding)
+    pool.open(second, embedding)
+
+    pool.close(first)
+    assert not pool.is_open(first)
+    assert pool.is_open(second)
+
+def test_generation_outlives_reopen(pool, tmp_path):
+    embedding = ConstantEmbeddings()
+    store = pool.open(str(tmp_path), embedding)
+    store.add_texts(["Name is John."])
+    assert store.generation == 1
+
+    pool.refresh(str(tmp_path))
+    reopened = pool.open(str(tmp_path), embedding)
+    assert reopened.generation == 1
+    reopened.add_texts(["City is Boston."])
+    # Every store of the directory sees the writes of the others
+    assert store.generation == reopened.generation == 2
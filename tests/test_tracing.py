@@ -0,0 +1,67 @@
+import json
+from unittest.mock import MagicMock
+from langchain_core.messages import AIMessage
+from ai_agents import AI_Agents
+from embedding_cache import CachedEmbeddings
+from tracing import StageStats, Tracer, TRACER
+from fake_embeddings import BagOfWordsEmbeddings
+
+def test_nested_spans_and_attributes():
+    tracer = Tracer()
+    with tracer.span("turn") as turn:
+        with tracer.span("embed", texts=3) as embed:
+            embed.set(hits=2)
+        with tracer.span("embed", texts=1):
+            pass
+    assert embed.parent is turn and embed.depth == 1
+
+    summary = tracer.stats.summary()
+    assert summary["embed"]["count"] == 2 and summary["turn"]["count"] == 1
+    assert summary["embed"]["totals"] == {"texts": 4, "hits": 2}
+    assert summary["turn"]["p95_ms"] >= summary["embed"]["p50_ms"]
+
+def test_session_stats_are_separate():
+    tracer, session = Tracer(), StageStats()
+    with tracer.session(session):
+        with tracer.span("classify"):
+            pass
+    with tracer.span("classify"):
+        pass
+    assert session.summary()["classify"]["count"] == 1
+    assert tracer.stats.summary()["classify"]["count"] == 2
+
+def test_stream_records_first_token():
+    tracer = Tracer()
+    assert list(tracer.stream("llm.answer", iter(["a", "b", "c"]))) == ["a", "b", "c"]
+    summary = tracer.stats.summary()
+    assert summary["llm.answer"]["totals"] == {"chunks": 3}
+    assert summary["llm.answer.first_token"]["count"] == 1
+
+def test_export(tmp_path):
+    tracer = Tracer()
+    with tracer.span("chroma.query"):
+        pass
+    tracer.export(str(tmp_path / "trace.json"))
+    exported = json.loads((tmp_path / "trace.json").read_text())
+    assert exported["stages"]["chroma.query"]["count"] == 1
+    assert exported["spans"][0]["name"] == "chroma.query"
+
+    tracer.export(str(tmp_path / "trace.prom"))
+    metrics = (tmp_path / "trace.prom").read_text()
+    assert 'aya_stage_duration_seconds_bucket{stage="chroma.query",le="+Inf"} 1' in metrics
+    assert 'aya_stage_duration_seconds_count{stage="chroma.query"} 1' in metrics
+
+def test_workflows_are_traced():
+    model = MagicMock()
+    model.invoke.return_value = AIMessage(content="email id")
+    ai_agents = AI_Agents(model, "/tmp/", direct_tasks=["extract_category"])
+    embedding = CachedEmbeddings(BagOfWordsEmbeddings())
+
+    session = StageStats()
+    with TRACER.session(session):
+        ai_agents.category_extraction("Delete my email id")
+        embedding.embed_documents(["Name is John.", "Name is John.", "City is Boston."])
+    summary = session.summary()
+    assert summary["llm.extract_category"]["totals"]["prompt_tokens"] > 0
+    assert summary["embed"]["totals"] == {"texts": 3, "hits": 0, "misses": 3}
+    assert summary["embed.compute"]["totals"] == {"texts": 2}
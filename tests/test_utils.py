@@ -1,10 +1,13 @@
+import uuid
+import numpy as np
 import pytest
 from unittest.mock import patch, MagicMock
 from utils import Utils
 from langchain_groq import ChatGroq
-from langchain.embeddings import HuggingFaceInstructEmbeddings
 from chroma_aya import Chroma_AYA
 from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from fake_embeddings import BagOfWordsEmbeddings
 
 @pytest.fixture
 def utils():
@@ -20,9 +23,29 @@ def test_load_model(mock_chatgroq, utils):
     mock_chatgroq.assert_called_once_with(api_key=api_key, model="llama3-70b-8192")
     assert model == mock_model
 
-@patch('utils.StreamlitCallbackHandler')
 @patch('utils.ChatGroq')
-def test_generic_response(mock_chatgroq, mock_st_cb, utils):
+def test_load_model_base_url(mock_chatgroq, utils):
+    utils.load_model('test_api_key', base_url='http://127.0.0.1:8000', timeout=5, max_retries=0)
+    mock_chatgroq.assert_called_once_with(api_key='test_api_key', model="llama3-70b-8192",
+                                          base_url='http://127.0.0.1:8000', timeout=5, max_retries=0)
+
+@patch('langchain_openai.ChatOpenAI')
+def test_load_model_openai_backend_from_env(mock_chatopenai, utils, monkeypatch):
+    monkeypatch.setenv('AYA_LLM_BACKEND', 'openai')
+    monkeypatch.setenv('AYA_LLM_BASE_URL', 'http://127.0.0.1:8000/v1')
+    monkeypatch.setenv('AYA_LLM_MAX_RETRIES', '3')
+
+    model = utils.load_model('test_api_key')
+    mock_chatopenai.assert_called_once_with(api_key='test_api_key', model="gpt-4-0613",
+                                            base_url='http://127.0.0.1:8000/v1', max_retries=3)
+    assert model == mock_chatopenai.return_value
+
+def test_load_model_unknown_backend(utils):
+    with pytest.raises(ValueError):
+        utils.load_model('test_api_key', backend='anthropic')
+
+@patch('utils.ChatGroq')
+def test_generic_response(mock_chatgroq, utils):
     mock_model = MagicMock()
     mock_response = MagicMock()
     mock_response.content = 'test response'
@@ -34,16 +57,57 @@ def test_generic_response(mock_chatgroq, mock_st_cb, utils):
     mock_model.invoke.assert_called_once()
     assert response == 'test response'
 
+@patch('utils.load_embedding')
+def test_injected_embedding(mock_load):
+    embedding = BagOfWordsEmbeddings()
+    utils = Utils(embedding_cache_dir=None, embedding=embedding)
+
+    mock_load.assert_not_called()
+    assert utils.embedding.embed_documents(["my email"]) == embedding.embed_documents(["my email"])
+    assert embedding.calls == 2
+
+@patch('utils.load_embedding')
+def test_embedding_backend_from_env(mock_load, monkeypatch):
+    mock_load.return_value = BagOfWordsEmbeddings()
+    monkeypatch.setenv('AYA_EMBEDDING_BACKEND', 'onnx-int8')
+    monkeypatch.setenv('AYA_EMBEDDING_THREADS', '2')
+
+    Utils(embedding_cache_dir=None)
+    mock_load.assert_called_once_with('onnx-int8', num_threads=2, onnx_dir=None)
+
+def test_stream_generic_response(utils):
+    model = FakeListChatModel(responses=["I am fine, thank you."])
+    chunks = list(utils.stream_generic_response(model, "Hello, how are you?"))
+    assert len(chunks) > 1
+    assert "".join(chunks) == "I am fine, thank you."
+
+class RecordingChatModel(FakeListChatModel):
+    seen: list = []
+
+    def _stream(self, messages, *args, **kwargs):
+        self.seen.append(messages)
+        return super()._stream(messages, *args, **kwargs)
+
+def test_stream_answer_from_memory(utils):
+    model = RecordingChatModel(responses=["Your email is a@b.com"])
+    docs = [Document(page_content="Email ID - a@b.com"), Document(page_content="Name - John Doe")]
+
+    chunks = list(utils.stream_answer_from_memory(model, "What is my email?", docs))
+    assert len(chunks) > 1 and "".join(chunks) == "Your email is a@b.com"
+    messages = model.seen[0]
+    assert "Email ID - a@b.com\n\nName - John Doe" in messages[0].content
+    assert messages[-1].content == "What is my email?"
+
 @patch('os.path.exists')
-@patch('utils.Chroma_AYA')
-def test_load_db(mock_chroma_aya, mock_path_exists, utils):
+def test_load_db(mock_path_exists, utils):
     mock_path_exists.return_value = True
     mock_db = MagicMock(spec=Chroma_AYA)
-    mock_chroma_aya.return_value = mock_db
+    utils.stores = MagicMock()
+    utils.stores.open.return_value = mock_db
 
     db_path = "/tmp/db"
     vectordb = utils.load_db(db_path)
-    mock_chroma_aya.assert_called_once_with(persist_directory=db_path, embedding_function=utils.embedding)
+    utils.stores.open.assert_called_once_with(db_path, utils.embedding)
     assert vectordb == mock_db
 
     mock_path_exists.return_value = False
@@ -55,16 +119,63 @@ def test_text_splitter(utils):
     split_texts = utils.text_splitter(text)
     assert isinstance(split_texts, list)
 
-@patch('os.path.exists')
-@patch('utils.Chroma_AYA')
-def test_store_in_db(mock_chroma_aya, mock_path_exists, utils):
+def test_store_in_db(utils):
     data = "This is some test data."
-    mock_path_exists.return_value = True
     mock_db = MagicMock(spec=Chroma_AYA)
-    mock_chroma_aya.return_value = mock_db
+    mock_db.filter_stored_documents.side_effect = lambda documents: documents
+    mock_db.nearest_embeddings.side_effect = lambda embeddings, k: [np.zeros((0, 0))] * len(embeddings)
+    utils.stores = MagicMock()
+    utils.stores.open.return_value = mock_db
 
     utils.store_in_db(data)
-    mock_chroma_aya.assert_called()
+    utils.stores.open.assert_called_once_with(utils.db_path, utils.embedding)
+    mock_db.add_documents.assert_called_once()
+
+class InlineBulkEmbedder():
+    """ Embeds one text per batch in this process, like BulkEmbedder.iter_batches.
+    """
+    def __init__(self):
+        self.texts = []
+
+    def iter_batches(self, texts):
+        for start, text in enumerate(texts):
+            self.texts.append(text)
+            yield start, BagOfWordsEmbeddings().embed_documents([text])
+
+def test_store_in_db_with_bulk_embedder():
+    embedding = BagOfWordsEmbeddings()
+    utils = Utils(embedding_cache_dir=None, embedding=embedding, bulk_min_chunks=2)
+    vectordb = Chroma_AYA(collection_name=f"test_{uuid.uuid4().hex}", embedding_function=utils.embedding,
+                          content_ids=True)
+    utils.stores = MagicMock()
+    utils.stores.open.return_value = vectordb
+    bulk_embedder = InlineBulkEmbedder()
+
+    # A single chunk stays below bulk_min_chunks
+    utils.store_in_db("Name is John.", bulk_embedder=bulk_embedder)
+    assert bulk_embedder.texts == []
+
+    # The last chunk is a near-duplicate of the first one, in a later batch
+    data = "\n\n".join(["Phone is 555. " * 30, "City is Boston. " * 40, "Favourite food is pizza. " * 30,
+                         "phone is 555. " * 30])
+    embedding.calls = 0
+    utils.store_in_db(data, bulk_embedder=bulk_embedder)
+    assert len(bulk_embedder.texts) == 4
+    # Nothing is embedded in this process, and the near-duplicate is not stored
+    assert embedding.calls == 0
+    assert len(vectordb) == 4
+    vectordb.delete_collection()
+
+@patch('utils.load_embedding')
+def test_bulk_embedder_uses_the_resolved_backend(mock_load):
+    mock_load.return_value = BagOfWordsEmbeddings()
+    utils = Utils(embedding_cache_dir=None, embedding_backend='onnx-int8', embedding_threads=4)
+
+    bulk_embedder = utils.bulk_embedder(processes=2)
+    assert bulk_embedder.processes == 2
+    assert bulk_embedder.factory.args == ('onnx-int8',)
+    assert bulk_embedder.factory.keywords["num_threads"] == 2
+    assert Utils(embedding_cache_dir=None, embedding=BagOfWordsEmbeddings()).bulk_embedder() is None
 
 def test_wrap_text_preserve_newlines(utils):
     text = "This is a test text.\nWith a newline."
@@ -75,3 +186,21 @@ def test_process_llm_response(utils):
     llm_response = {'result': "This is a test response from the LLM."}
     processed_response = utils.process_llm_response(llm_response)
     assert processed_response == utils.wrap_text_preserve_newlines(llm_response['result'])
+
+def test_compare_new_data_to_db(utils):
+    texts = [Document(page_content="Name is John Doe.", metadata={}),
+             Document(page_content="Email ID is john@doe.com", metadata={}),
+             Document(page_content="Name is John Doe.", metadata={})]
+    # Deduplicates the chunks of the same upload
+    new_texts = utils.compare_new_data_to_db(texts)
+    assert [text.page_content for text in new_texts] == ["Name is John Doe.", "Email ID is john@doe.com"]
+
+    # Drops the chunks already stored, comparing them to their nearest stored memories only
+    stored = np.asarray(utils.embedding.embed_documents(["Email ID is john@doe.com"]))
+    mock_db = MagicMock(spec=Chroma_AYA)
+    mock_db.nearest_embeddings.side_effect = lambda embeddings, k: [stored] * len(embeddings)
+    new_texts = utils.compare_new_data_to_db(texts, mock_db, neighbours=1)
+    assert [text.page_content for text in new_texts] == ["Name is John Doe."]
+    mock_db.nearest_embeddings.assert_called_once()
+    # The duplicate within the upload is not looked up
+    assert len(mock_db.nearest_embeddings.call_args.args[0]) == 2
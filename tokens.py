@@ -0,0 +1,100 @@
+import threading
+from typing import List
+
+# Average number of characters per token, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """
+    Loads the tiktoken encoding once. Returns None if tiktoken or its vocabulary is not available.
+    """
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text. Falls back to a character based estimate without a tokenizer.
+
+    Args:
+        text (str): The text to be measured.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """
+    Cuts a text into consecutive pieces of at most max_tokens tokens each.
+
+    Args:
+        text (str): The text to be cut.
+        max_tokens (int): The maximum number of tokens per piece.
+
+    Returns:
+        List[str]: The pieces, in order.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        size = max_tokens * CHARS_PER_TOKEN
+        return [text[start:start + size] for start in range(0, len(text), size)]
+
+    tokens = encoding.encode(text, disallowed_special=())
+    pieces, start = [], 0
+    while start < len(tokens):
+        end = min(start + max_tokens, len(tokens))
+        # A character whose bytes span several tokens is not cut: its tokens are moved to the next piece,
+        # or kept together in this one when they alone exceed max_tokens
+        while start + 1 < end < len(tokens) and _decode(encoding, tokens[start:end]) is None:
+            end -= 1
+        while end < len(tokens) and _decode(encoding, tokens[start:end]) is None:
+            end += 1
+        piece = _decode(encoding, tokens[start:end])
+        pieces.append(piece if piece is not None else encoding.decode(tokens[start:end]))
+        start = end
+    return pieces
+
+
+def _decode(encoding, tokens: List[int]):
+    """
+    Decodes tokens, or returns None when their bytes end within a character.
+    """
+    try:
+        return encoding.decode_bytes(tokens).decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Keeps the beginning of a text up to max_tokens tokens.
+
+    Args:
+        text (str): The text to be truncated.
+        max_tokens (int): The maximum number of tokens kept.
+
+    Returns:
+        str: The truncated text.
+    """
+    if max_tokens <= 0:
+        return ""
+    pieces = split_by_tokens(text, max_tokens)
+    return pieces[0] if pieces else ""
@@ -0,0 +1,337 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# The upper bounds, in seconds, of the buckets of the exported latency histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Span():
+    """
+    A timed stage of a chat turn. Numeric attributes, e.g. token counts or cache hits, are summed per stage.
+    """
+
+    __slots__ = ("name", "parent", "depth", "start", "duration", "attributes")
+
+    def __init__(self, name: str, parent: "Span" = None, **attributes) -> None:
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attributes = attributes
+
+    def set(self, **attributes) -> None:
+        """
+        Sets attributes of the span.
+        """
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "depth": self.depth,
+            "duration_ms": round(1000 * self.duration, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+        }
+
+
+class StageStats():
+    """
+    The latency histogram and the attribute totals of every stage.
+    """
+
+    def __init__(self, window: int = 2048) -> None:
+        """
+        Initializes empty statistics.
+
+        Args:
+            window (int): The number of most recent durations per stage used for the percentiles.
+        """
+        self.window = window
+        self._stages: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, span: Span) -> None:
+        """
+        Adds a finished span to the statistics of its stage.
+
+        Args:
+            span (Span): The finished span.
+        """
+        with self._lock:
+            stage = self._stages.get(span.name)
+            if stage is None:
+                stage = self._stages[span.name] = {
+                    "count": 0, "sum": 0.0, "buckets": [0] * (len(BUCKETS) + 1),
+                    "recent": deque(maxlen=self.window), "totals": {},
+                }
+            stage["count"] += 1
+            stage["sum"] += span.duration
+            stage["buckets"][bisect.bisect_left(BUCKETS, span.duration)] += 1
+            stage["recent"].append(span.duration)
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage["totals"][key] = stage["totals"].get(key, 0) + value
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Summarizes every stage.
+
+        Returns:
+            Dict[str, dict]: The count, total, p50, p95 and p99 durations in milliseconds, the histogram
+                buckets and the attribute totals of every stage.
+        """
+        with self._lock:
+            stages = {name: dict(stage, recent=sorted(stage["recent"]), buckets=list(stage["buckets"]),
+                                 totals=dict(stage["totals"]))
+                      for name, stage in self._stages.items()}
+        return {
+            name: {
+                "count": stage["count"],
+                "sum_ms": 1000 * stage["sum"],
+                "p50_ms": 1000 * _percentile(stage["recent"], 0.50),
+                "p95_ms": 1000 * _percentile(stage["recent"], 0.95),
+                "p99_ms": 1000 * _percentile(stage["recent"], 0.99),
+                "buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], stage["buckets"])),
+                "totals": stage["totals"],
+            }
+            for name, stage in sorted(stages.items())
+        }
+
+    def to_prometheus(self, prefix: str = "aya") -> str:
+        """
+        Renders the statistics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): The prefix of the metric names.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = [f"# HELP {prefix}_stage_duration_seconds The latency of the stages of the assistant.",
+                 f"# TYPE {prefix}_stage_duration_seconds histogram"]
+        totals = []
+        with self._lock:
+            for name, stage in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in BUCKETS] + ["+Inf"], stage["buckets"]):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{name}"}} {stage["sum"]}')
+                lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{name}"}} {stage["count"]}')
+                totals.extend((name, key, value) for key, value in sorted(stage["totals"].items()))
+
+        if totals:
+            lines.append(f"# HELP {prefix}_stage_attribute_total The totals of the numeric attributes of the stages.")
+            lines.append(f"# TYPE {prefix}_stage_attribute_total counter")
+            lines.extend(f'{prefix}_stage_attribute_total{{stage="{name}",attribute="{key}"}} {value}'
+                         for name, key, value in totals)
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+_current_span = contextvars.ContextVar("aya_current_span", default=None)
+_session_stats = contextvars.ContextVar("aya_session_stats", default=None)
+
+
+class Tracer():
+    """
+    Records nested spans. Every finished span is added to the process-wide statistics, to the statistics
+    of the current session if one is set, and to a bounded log of the most recent spans.
+    """
+
+    def __init__(self, enabled: bool = True, max_spans: int = 1000, export_path: str = None) -> None:
+        """
+        Initializes the tracer.
+
+        Args:
+            enabled (bool): Whether spans are recorded.
+            max_spans (int): The number of most recent spans kept.
+            export_path (str): The file written by maybe_export, in JSON or in the Prometheus text format
+                when its extension is .prom.
+        """
+        self.enabled = enabled
+        self.export_path = export_path
+        self.stats = StageStats()
+        self.spans = deque(maxlen=max_spans)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """
+        Times the enclosed block as a stage, nested in the current span.
+
+        Args:
+            name (str): The name of the stage.
+            **attributes: The attributes of the span.
+
+        Returns:
+            Iterator[Optional[Span]]: The span, None when tracing is disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        span = Span(name, _current_span.get(), **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException:
+            span.set(errors=1)
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            _current_span.reset(token)
+            self._finish(span)
+
+    def traced(self, name: str) -> Callable:
+        """
+        Decorates a function so that every call is recorded as a span.
+
+        Args:
+            name (str): The name of the stage.
+
+        Returns:
+            Callable: The decorator.
+        """
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stream(self, name: str, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Records the consumption of a stream of tokens as a span, and the time to its first chunk as
+        the "<name>.first_token" stage.
+
+        Args:
+            name (str): The name of the stage.
+            chunks (Iterable[str]): The stream.
+
+        Returns:
+            Iterator[str]: The same chunks.
+        """
+        if not self.enabled:
+            yield from chunks
+            return
+
+        # The span is not made current: the stream is suspended between chunks and may be consumed elsewhere
+        span = Span(name, _current_span.get())
+        count = 0
+        try:
+            for chunk in chunks:
+                if count == 0:
+                    first = Span(name + ".first_token", span)
+                    first.start = span.start
+                    first.duration = time.perf_counter() - span.start
+                    self._finish(first)
+                count += 1
+                yield chunk
+        except Exception:
+            span.set(errors=1)
+            raise
+        finally:
+            span.set(chunks=count)
+            span.duration = time.perf_counter() - span.start
+            self._finish(span)
+
+    def annotate(self, **attributes) -> None:
+        """
+        Sets attributes of the current span, if any.
+
+        Args:
+            **attributes: The attributes.
+        """
+        current = _current_span.get()
+        if current is not None:
+            current.set(**attributes)
+
+    @contextlib.contextmanager
+    def session(self, stats: StageStats) -> Iterator[StageStats]:
+        """
+        Also adds the spans of the enclosed block to the given statistics, e.g. the ones of a Streamlit session.
+
+        Args:
+            stats (StageStats): The statistics of the session.
+
+        Returns:
+            Iterator[StageStats]: The statistics of the session.
+        """
+        token = _session_stats.set(stats)
+        try:
+            yield stats
+        finally:
+            _session_stats.reset(token)
+
+    def bind_session(self, stats: StageStats) -> None:
+        """
+        Also adds the following spans of the current thread to the given statistics. Meant for runners
+        which execute a whole script per session in their own thread, like Streamlit.
+
+        Args:
+            stats (StageStats): The statistics of the session.
+        """
+        _session_stats.set(stats)
+
+    def export(self, path: str) -> None:
+        """
+        Writes the statistics to a file, in the Prometheus text format if the extension is .prom and
+        in JSON otherwise. The file is replaced atomically.
+
+        Args:
+            path (str): The path of the file.
+        """
+        if path.endswith(".prom"):
+            content = self.stats.to_prometheus()
+        else:
+            content = json.dumps({"stages": self.stats.summary(),
+                                  "spans": [span.to_dict() for span in list(self.spans)]}, indent=2)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+
+    def maybe_export(self) -> None:
+        """
+        Writes the statistics to the export path, if one is set.
+        """
+        if self.export_path:
+            self.export(self.export_path)
+
+    def _finish(self, span: Span) -> None:
+        self.stats.observe(span)
+        session = _session_stats.get()
+        if session is not None:
+            session.observe(span)
+        self.spans.append(span)
+
+
+# The process-wide tracer. AYA_TRACING=0 disables it, and AYA_TRACE_EXPORT sets the export file.
+TRACER = Tracer(enabled=os.environ.get("AYA_TRACING", "1") != "0",
+                export_path=os.environ.get("AYA_TRACE_EXPORT"))
+span = TRACER.span
+traced = TRACER.traced
+annotate = TRACER.annotate
@@ -1,15 +1,31 @@
-from langchain_groq import ChatGroq
-from langchain.callbacks import StreamlitCallbackHandler
-import streamlit as st
+from langchain_core.output_parsers import StrOutputParser
 import os, textwrap
+from typing import Iterator, List
+import numpy as np
 
-from langchain.embeddings import HuggingFaceInstructEmbeddings
-from InstructorEmbedding import INSTRUCTOR
 from chroma_aya import Chroma_AYA
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from embedding_backends import DEFAULT_MODEL, load_embedding
+from embedding_cache import CachedEmbeddings
+from lazy import lazy_import
+from store_pool import STORE_POOL, StorePool
+from tracing import TRACER, annotate, traced
 from langchain_core.documents import Document
-from sentence_transformers import SentenceTransformer, util
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+
+
+# The LLM clients and the chains are only imported when they are first used
+ChatGroq = lazy_import("langchain_groq", "ChatGroq")
+PROMPT_SELECTOR = lazy_import("langchain.chains.question_answering.stuff_prompt", "PROMPT_SELECTOR")
+RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+
+# The default model of every LLM backend
+DEFAULT_MODELS = {"groq": "llama3-70b-8192", "openai": "gpt-4-0613"}
+
+
+def _env_number(name: str, cast: type):
+    value = os.environ.get(name)
+    return cast(value) if value else None
 
 
 class Utils():
@@ -18,29 +34,103 @@ class Utils():
     text processing, and database operations.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, embedding_cache_dir: str = "/tmp/embedding_cache", db_path: str = "/tmp/db",
+                 store_pool: StorePool = None, embedding: Embeddings = None, embedding_backend: str = None,
+                 embedding_threads: int = None, bulk_min_chunks: int = 256) -> None:
         """
         Initializes the Utils class with an embedding model from HuggingFace.
+        The embeddings are cached by content so that the same text is never embedded twice.
+
+        Args:
+            embedding_cache_dir (str): The directory of the on-disk embedding cache. None keeps it in memory only.
+            db_path (str): The default path of the vector database directory.
+            store_pool (StorePool): The pool of open vector stores. Defaults to the process-wide pool.
+            embedding (Embeddings): The embedding model. Defaults to the hkunlp/instructor-base model on the
+                embedding backend.
+            embedding_backend (str): The backend of the hkunlp/instructor-base model, among "torch",
+                "torch-int8", "onnx" and "onnx-int8". Defaults to the AYA_EMBEDDING_BACKEND environment
+                variable, or "torch".
+            embedding_threads (int): The number of intra-op threads of the embedding model. Defaults to the
+                AYA_EMBEDDING_THREADS environment variable, or the default of the runtime.
+            bulk_min_chunks (int): The number of new chunks from which store_in_db embeds them on the worker
+                processes of a bulk embedder, when one is given.
+        """
+        # The resolved settings of the model, which the workers of the bulk embedder load as well
+        self.embedding_backend = None
+        self.embedding_threads = None
+        self.embedding_onnx_dir = None
+        if embedding is None:
+            self.embedding_backend = embedding_backend or os.environ.get("AYA_EMBEDDING_BACKEND", "torch")
+            self.embedding_threads = embedding_threads or _env_number("AYA_EMBEDDING_THREADS", int)
+            self.embedding_onnx_dir = os.environ.get("AYA_EMBEDDING_ONNX_DIR")
+            embedding = load_embedding(self.embedding_backend, num_threads=self.embedding_threads,
+                                       onnx_dir=self.embedding_onnx_dir)
+        self.embedding = CachedEmbeddings(embedding, cache_dir=embedding_cache_dir)
+        self.bulk_min_chunks = bulk_min_chunks
+        self.db_path = db_path
+        self.stores = store_pool if store_pool is not None else STORE_POOL
+
+    def bulk_embedder(self, processes: int = None, batch_size: int = 64):
+        """
+        Builds an embedder of large ingests, whose worker processes load the same model on the same backend
+        as this instance and share its threads. The workers are started on first use.
+
+        Args:
+            processes (int): The number of worker processes. Defaults to the AYA_EMBEDDING_PROCESSES environment
+                variable, or 2. Every worker loads its own copy of the model.
+            batch_size (int): The number of texts per batch.
+
+        Returns:
+            BulkEmbedder: The embedder, or None when the embedding model was given at init, since the workers
+                cannot load it.
         """
-        self.embedding = HuggingFaceInstructEmbeddings(model_name="hkunlp/instructor-base")
+        if self.embedding_backend is None:
+            return None
+        from bulk_embedding import DEFAULT_PROCESSES, BulkEmbedder, model_factory
 
-    def load_model(self, api_key: str) -> ChatGroq:
+        processes = processes or _env_number("AYA_EMBEDDING_PROCESSES", int) or DEFAULT_PROCESSES
+        factory = model_factory(self.embedding_backend, model_name=DEFAULT_MODEL, processes=processes,
+                                onnx_dir=self.embedding_onnx_dir, num_threads=self.embedding_threads)
+        return BulkEmbedder(factory, processes=processes, batch_size=batch_size)
+
+    def load_model(self, api_key: str, backend: str = None, base_url: str = None, model_name: str = None,
+                   timeout: float = None, max_retries: int = None) -> BaseChatModel:
         """
-        Loads the language model using the provided API key.
+        Loads the language model using the provided API key. The backend, the base URL, the model name,
+        the timeout and the number of retries default to the AYA_LLM_BACKEND, AYA_LLM_BASE_URL,
+        AYA_LLM_MODEL, AYA_LLM_TIMEOUT and AYA_LLM_MAX_RETRIES environment variables, so the assistant
+        can be pointed at a local server such as mock_llm_server.py.
 
         Args:
             api_key (str): The API key for authentication.
+            backend (str): Either "groq" (the default) or "openai", for any OpenAI-compatible server.
+            base_url (str): The URL of the chat completions API. Defaults to the one of the backend.
+            model_name (str): The model. Defaults to llama3-70b-8192 on Groq and gpt-4-0613 on OpenAI.
+            timeout (float): The number of seconds after which a request is abandoned.
+            max_retries (int): The number of retries of a failed or rate-limited request.
 
         Returns:
-            ChatGroq: An instance of the ChatGroq model.
+            BaseChatModel: An instance of the ChatGroq or ChatOpenAI model.
         """
-        # os.environ.get("GROQ_API_KEY")
-        model = ChatGroq(
-                api_key= api_key,
-                model="llama3-70b-8192"
-            )
-        return model
-
+        backend = backend or os.environ.get("AYA_LLM_BACKEND", "groq")
+        if backend not in DEFAULT_MODELS:
+            raise ValueError(f"Unknown LLM backend '{backend}'. Choose among {list(DEFAULT_MODELS)}.")
+        base_url = base_url or os.environ.get("AYA_LLM_BASE_URL")
+        timeout = timeout if timeout is not None else _env_number("AYA_LLM_TIMEOUT", float)
+        max_retries = max_retries if max_retries is not None else _env_number("AYA_LLM_MAX_RETRIES", int)
+
+        # Only the settings which are given are passed, the clients keep their own defaults otherwise
+        options = {"api_key": api_key, "model": model_name or os.environ.get("AYA_LLM_MODEL", DEFAULT_MODELS[backend])}
+        for key, value in (("base_url", base_url), ("timeout", timeout), ("max_retries", max_retries)):
+            if value is not None:
+                options[key] = value
+
+        if backend == "openai":
+            from langchain_openai import ChatOpenAI
+            return ChatOpenAI(**options)
+        return ChatGroq(**options)
+
+    @traced("llm.generic")
     def generic_response(self, model: ChatGroq, prompt: str) -> str:
         """
         Generates a response to the given prompt using the specified model (LLM)
@@ -52,39 +142,67 @@ class Utils():
         Returns:
             str: The generated response content.
         """
-        st_cb = StreamlitCallbackHandler(st.container(), expand_new_thoughts=False)
+        # Invoke the model with the prepared messages
+        response = model.invoke(self._generic_messages(prompt))
+        return response.content
+
+    def stream_generic_response(self, model: ChatGroq, prompt: str) -> Iterator[str]:
+        """
+        Streams the response of the model (LLM) to the given prompt, token by token.
+
+        Args:
+            model: The language model to be used for generating the response.
+            prompt (str): The input prompt for the model.
+
+        Returns:
+            Iterator[str]: The pieces of the response, as soon as the model produces them.
+        """
+        chunks = (chunk.content for chunk in model.stream(self._generic_messages(prompt)) if chunk.content)
+        yield from TRACER.stream("llm.generic_stream", chunks)
 
+    def stream_answer_from_memory(self, model: ChatGroq, prompt: str, docs: List[Document]) -> Iterator[str]:
+        """
+        Streams the answer to the prompt based on the given memories, token by token. The memories are
+        stuffed in the same question answering prompt as the one of RetrievalQA with chain_type="stuff".
+
+        Args:
+            model: The language model to be used for generating the answer.
+            prompt (str): The question of the user.
+            docs (List[Document]): The memories most similar to the question.
+
+        Returns:
+            Iterator[str]: The pieces of the answer, as soon as the model produces them.
+        """
+        chain = PROMPT_SELECTOR.get_prompt(model) | model | StrOutputParser()
+        context = "\n\n".join(doc.page_content for doc in docs)
+        chunks = (chunk for chunk in chain.stream({"context": context, "question": prompt}) if chunk)
+        yield from TRACER.stream("llm.answer_stream", chunks)
+
+    @staticmethod
+    def _generic_messages(prompt: str) -> list:
         # Prepare the messages for the model
-        messages = [("system", "You are a helpful assistant. Respond to the user sentence in English."),
+        return [("system", "You are a helpful assistant. Respond to the user sentence in English."),
             ("human", prompt),
         ]
 
-        # Invoke the model with the prepared messages
-        response = model.invoke(messages)
-        return response.content
-
-    def load_db(self, path = "/tmp/db") -> Chroma_AYA:
+    @traced("db.load")
+    def load_db(self, path: str = None) -> Chroma_AYA:
         """
         Loads the vector database from the specified path, or returns a message if the path does not exist.
+        The database is opened once and then shared through the store pool.
 
         Args:
-            path (str): The path to the vector database directory.
+            path (str): The path to the vector database directory. Defaults to the path given at init.
 
         Returns:
             Chroma_AYA: The loaded vector database or a message indicating absence of memory.
         """
-        if os.path.exists(path):
-            # Loading the preexisting database
-            vectordb = Chroma_AYA(
-                persist_directory=path, 
-                embedding_function=self.embedding
-            )
-        else:
+        path = path or self.db_path
+        if not os.path.exists(path):
             return "Nothing in Memory"
-        
-        # Persist the database to disk
-        vectordb.persist()
-        return vectordb
+
+        # Reuse the already open database
+        return self.stores.open(path, self.embedding)
 
     def text_splitter(self, text: list) -> list:
         """
@@ -101,52 +219,131 @@ class Utils():
         texts = text_splitter.split_documents(text)
         return texts
 
-    def compare_new_data_to_db(self, splitted_texts):
+    @traced("db.dedupe")
+    def compare_new_data_to_db(self, splitted_texts: list, vectordb: Chroma_AYA = None,
+                               threshold: float = 0.97, neighbours: int = 4) -> list:
         """
-        # TODO: Add This Function for comparing memories and only adding the necessary part.
-        Compares new data to the existing data in the database using sentence embeddings.
+        Compares new data to the existing data in the database using the embeddings of the chunks,
+        and only keeps the chunks that are not near-duplicates of each other or of stored memories.
 
         Args:
             splitted_texts (list): List of text chunks to be compared.
+            vectordb (Chroma_AYA): The database holding the existing memories. None only deduplicates the new chunks.
+            threshold (float): The cosine similarity above which a chunk counts as a duplicate.
+            neighbours (int): The number of stored memories nearest to a chunk, found with the HNSW index of
+                the database, that it is compared to.
+
+        Returns:
+            list: The chunks which are worth adding to the database.
+        """
+        splitted_texts = list(splitted_texts)
+        if not splitted_texts:
+            return []
+
+        # The embeddings are cached, so storing the kept chunks does not embed them again
+        new_embeddings = self._normalize(np.asarray(
+            self.embedding.embed_documents([text.page_content for text in splitted_texts]), dtype=np.float32))
+        keep = self._novel(new_embeddings, vectordb, threshold, neighbours)
+        return [text for text, kept in zip(splitted_texts, keep) if kept]
+
+    def _novel(self, new_embeddings: np.ndarray, vectordb: Chroma_AYA = None, threshold: float = 0.97,
+               neighbours: int = 4, earlier: np.ndarray = None) -> np.ndarray:
         """
-        model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        Finds the chunks which are not near-duplicates of an earlier chunk of the same data or of a stored memory.
+
+        Args:
+            new_embeddings (np.ndarray): The normalized embeddings of the chunks, one per row.
+            vectordb (Chroma_AYA): The database holding the existing memories.
+            threshold (float): The cosine similarity above which a chunk counts as a duplicate.
+            neighbours (int): The number of nearest stored memories a chunk is compared to.
+            earlier (np.ndarray): The normalized embeddings of the chunks of the same data which came before.
 
-        #Compute embedding for both lists
-        # embedding_1= model.encode(texts[0].page_content, convert_to_tensor=True)
-        # embedding_2 = model.encode(t_da, convert_to_tensor=True)
+        Returns:
+            np.ndarray: True for the chunks worth adding to the database.
+        """
+        # Drop chunks which duplicate an earlier chunk of the same upload
+        similarities = new_embeddings @ new_embeddings.T
+        keep = ~np.triu(similarities >= threshold, k=1).any(axis=0)
+        if earlier is not None and len(earlier):
+            keep &= (new_embeddings @ earlier.T).max(axis=1) < threshold
+
+        # Compare the remaining chunks to their nearest stored memories only, looked up in the HNSW index,
+        # so the cost of a save does not grow with the size of the database
+        if vectordb is not None and not isinstance(vectordb, str) and keep.any():
+            indices = np.flatnonzero(keep)
+            for idx, stored in zip(indices, vectordb.nearest_embeddings(new_embeddings[indices], k=neighbours)):
+                if len(stored) and (self._normalize(stored) @ new_embeddings[idx]).max() >= threshold:
+                    keep[idx] = False
+        return keep
+
+    def _bulk_store(self, vectordb: Chroma_AYA, documents: List[Document], bulk_embedder,
+                    threshold: float = 0.97) -> int:
+        """
+        Stores many chunks through Chroma_AYA.bulk_add_texts. Every batch embedded by the workers is
+        deduplicated against the earlier chunks of the same data and the nearest stored memories, then
+        upserted while the workers embed the following batches.
 
-        # util.pytorch_cos_sim(embedding_1, embedding_2)
-        # for each_split in splitted_texts:
-        #     page_content = each_split.page_content
-        # pass
+        Args:
+            vectordb (Chroma_AYA): The database.
+            documents (List[Document]): The chunks, none of which is stored yet.
+            bulk_embedder (BulkEmbedder): The embedder of large ingests.
+            threshold (float): The cosine similarity above which a chunk counts as a duplicate.
+
+        Returns:
+            int: The number of chunks stored.
+        """
+        earlier, added = [], 0
+
+        def keep(texts: List[str], embeddings: List[List[float]]) -> List[int]:
+            nonlocal added
+            vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+            kept = self._novel(vectors, vectordb, threshold, earlier=np.concatenate(earlier) if earlier else None)
+            earlier.append(vectors)
+            added += int(kept.sum())
+            return np.flatnonzero(kept).tolist()
+
+        vectordb.bulk_add_texts([doc.page_content for doc in documents],
+                                metadatas=[doc.metadata for doc in documents], embedder=bulk_embedder, keep=keep)
+        return added
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """
+        Scales the vectors to unit length so that dot products are cosine similarities.
+        """
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
 
-    def store_in_db(self, data: str) -> None:
+    @traced("db.store")
+    def store_in_db(self, data: str, bulk_embedder=None) -> None:
         """
         Stores the provided data in the vector database, splitting it into chunks if necessary.
+        From bulk_min_chunks new chunks on, they are embedded on the worker processes of the bulk embedder and
+        stored in batches through Chroma_AYA.bulk_add_texts.
 
         Args:
             data (str): The data to be stored.
+            bulk_embedder (BulkEmbedder): The embedder of large ingests, see bulk_embedder().
         """
-        persist_directory = '/tmp/db'
         # loader = TextLoader(data_path)
         # documents = loader.load()
         splitted_texts = self.text_splitter([Document(page_content=data, metadata={})])
 
-        # new_texts = self.compare_new_data_to_db(splitted_texts)
+        # The store is created on first use and stays open for the following saves and queries
+        vectordb = self.stores.open(self.db_path, self.embedding)
 
-        if os.path.exists(persist_directory):
-            # Loading the preexisting DB
-            vectordb = Chroma_AYA(persist_directory=persist_directory, 
-                    embedding_function=self.embedding)
-            vectordb.add_documents(documents=splitted_texts)
-        
+        # Only add the chunks which are not already in memory
+        new_texts = vectordb.filter_stored_documents(splitted_texts)
+        bulk = bulk_embedder is not None and len(new_texts) >= self.bulk_min_chunks
+        if bulk:
+            # Embedded on the workers, each batch stored while the next one is embedded
+            added = self._bulk_store(vectordb, new_texts, bulk_embedder)
         else:
-            vectordb = Chroma_AYA.from_documents(documents=splitted_texts, 
-                                    embedding=self.embedding,
-                                    persist_directory=persist_directory)
-        
-        # persiste the db to disk
-        vectordb.persist()
+            new_texts = self.compare_new_data_to_db(new_texts, vectordb)
+            if new_texts:
+                vectordb.add_documents(documents=new_texts)
+            added = len(new_texts)
+        annotate(chunks=len(splitted_texts), added=added, bulk=bulk)
 
     def wrap_text_preserve_newlines(self, text: str, width=110) -> str:
         """